@@ -0,0 +1,44 @@
+"""unique open attendance record per user
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Cerrar registros abiertos duplicados, conservando el más reciente por usuario
+    op.execute(
+        """
+        UPDATE attendance_records AS ar
+        SET check_out = ar.check_in
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY user_id ORDER BY check_in DESC) AS rn
+            FROM attendance_records
+            WHERE check_out IS NULL
+        ) AS dup
+        WHERE ar.id = dup.id AND dup.rn > 1
+        """
+    )
+
+    op.create_index(
+        'uq_attendance_open_per_user',
+        'attendance_records',
+        ['user_id'],
+        unique=True,
+        postgresql_where=sa.text('check_out IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_attendance_open_per_user', table_name='attendance_records')
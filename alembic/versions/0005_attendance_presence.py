@@ -0,0 +1,44 @@
+"""attendance presence table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'attendance_presence',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('record_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('check_in', sa.DateTime(), nullable=False),
+        sa.Column('location', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+        sa.UniqueConstraint('record_id'),
+    )
+
+    # Poblar con los check-ins abiertos actuales
+    op.execute(
+        """
+        INSERT INTO attendance_presence (user_id, record_id, check_in, location)
+        SELECT user_id, id, check_in, location
+        FROM attendance_records
+        WHERE check_out IS NULL
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('attendance_presence')
@@ -0,0 +1,26 @@
+"""email outbox dedupe key for digests
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('email_outbox', sa.Column('dedupe_key', sa.String(length=255), nullable=True))
+    op.create_unique_constraint('email_outbox_dedupe_key_key', 'email_outbox', ['dedupe_key'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('email_outbox_dedupe_key_key', 'email_outbox', type_='unique')
+    op.drop_column('email_outbox', 'dedupe_key')
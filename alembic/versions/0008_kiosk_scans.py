@@ -0,0 +1,34 @@
+"""kiosk offline scan sync
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'kiosk_scans',
+        sa.Column('client_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('device_id', sa.String(length=100), nullable=False),
+        sa.Column('captured_at', sa.DateTime(), nullable=False),
+        sa.Column('outcome', sa.String(length=20), nullable=True),
+        sa.Column('record_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('received_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('client_id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('kiosk_scans')
@@ -0,0 +1,33 @@
+"""scan debounce window
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # UNLOGGED: sin WAL; el contenido es descartable tras un reinicio
+    op.create_table(
+        'scan_debounce',
+        sa.Column('code_data', sa.String(length=255), nullable=False),
+        sa.Column('scanned_at', sa.DateTime(), nullable=False),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.PrimaryKeyConstraint('code_data'),
+        prefixes=['UNLOGGED'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('scan_debounce')
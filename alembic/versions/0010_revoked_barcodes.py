@@ -0,0 +1,30 @@
+"""revoked signed barcodes
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'revoked_barcodes',
+        sa.Column('code_data', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('code_data'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('revoked_barcodes')
@@ -0,0 +1,41 @@
+"""materialized shift calendar
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'shift_instances',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('work_date', sa.Date(), nullable=False),
+        sa.Column('shift_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('starts_at', sa.DateTime(), nullable=False),
+        sa.Column('ends_at', sa.DateTime(), nullable=False),
+        sa.Column('late_after', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['shift_id'], ['shifts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'work_date'),
+    )
+    op.create_index('ix_shift_instances_user_window', 'shift_instances', ['user_id', 'starts_at', 'ends_at'])
+    op.create_index('ix_shift_instances_work_date', 'shift_instances', ['work_date'])
+    # El job de la app materializa los días siguientes al arrancar
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shift_instances_work_date', table_name='shift_instances')
+    op.drop_index('ix_shift_instances_user_window', table_name='shift_instances')
+    op.drop_table('shift_instances')
@@ -0,0 +1,66 @@
+"""daily attendance rollups
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'attendance_daily_user',
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('check_ins', sa.Integer(), nullable=False),
+        sa.Column('late_count', sa.Integer(), nullable=False),
+        sa.Column('minutes_worked', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'day'),
+    )
+    op.create_index('ix_attendance_daily_user_day', 'attendance_daily_user', ['day'])
+
+    op.create_table(
+        'attendance_daily_department',
+        sa.Column('department_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('check_ins', sa.Integer(), nullable=False),
+        sa.Column('late_count', sa.Integer(), nullable=False),
+        sa.Column('minutes_worked', sa.Integer(), nullable=False),
+        sa.Column('employees', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('department_id', 'day'),
+    )
+    op.create_index('ix_attendance_daily_department_day', 'attendance_daily_department', ['day'])
+
+    op.create_table(
+        'rollup_state',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('rolled_through', sa.Date(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_table(
+        'rollup_dirty_days',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('day'),
+    )
+    # El histórico lo consolida el job de la app en su primera corrida
+
+
+def downgrade() -> None:
+    op.drop_table('rollup_dirty_days')
+    op.drop_table('rollup_state')
+    op.drop_index('ix_attendance_daily_department_day', table_name='attendance_daily_department')
+    op.drop_table('attendance_daily_department')
+    op.drop_index('ix_attendance_daily_user_day', table_name='attendance_daily_user')
+    op.drop_table('attendance_daily_user')
@@ -0,0 +1,60 @@
+"""background report export jobs
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'report_jobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('requested_by', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('range_start', sa.DateTime(), nullable=False),
+        sa.Column('range_end', sa.DateTime(), nullable=False),
+        sa.Column('department_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('rows_total', sa.Integer(), nullable=True),
+        sa.Column('rows_done', sa.Integer(), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=True),
+        sa.Column('size_bytes', sa.Integer(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_report_jobs_cache_key', 'report_jobs', ['cache_key', 'status'])
+    op.create_index('ix_report_jobs_due', 'report_jobs', ['status', 'created_at'])
+    op.create_index(
+        'uq_report_jobs_active_key',
+        'report_jobs',
+        ['cache_key'],
+        unique=True,
+        postgresql_where=sa.text("status IN ('pending', 'running')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_report_jobs_active_key', table_name='report_jobs')
+    op.drop_index('ix_report_jobs_due', table_name='report_jobs')
+    op.drop_index('ix_report_jobs_cache_key', table_name='report_jobs')
+    op.drop_table('report_jobs')
@@ -0,0 +1,51 @@
+"""attendance change tracking for incremental exports
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'attendance_records',
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+    )
+    op.add_column(
+        'attendance_records',
+        sa.Column('change_xid', sa.BigInteger(), server_default=sa.text('txid_current()'), nullable=False),
+    )
+    op.create_index('ix_attendance_change_xid', 'attendance_records', ['change_xid'])
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION attendance_records_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := timezone('utc', now());
+            NEW.change_xid := txid_current();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        "CREATE TRIGGER attendance_records_touch BEFORE UPDATE ON attendance_records "
+        "FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE attendance_records_touch()"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS attendance_records_touch ON attendance_records")
+    op.execute("DROP FUNCTION IF EXISTS attendance_records_touch()")
+    op.drop_index('ix_attendance_change_xid', table_name='attendance_records')
+    op.drop_column('attendance_records', 'change_xid')
+    op.drop_column('attendance_records', 'updated_at')
@@ -0,0 +1,51 @@
+"""scheduled report exports
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'report_schedules',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('created_by', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('range_template', sa.String(length=20), nullable=False),
+        sa.Column('department_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('frequency', sa.String(length=10), nullable=False),
+        sa.Column('weekday', sa.Integer(), nullable=True),
+        sa.Column('day_of_month', sa.Integer(), nullable=True),
+        sa.Column('recipients', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('next_run_at', sa.DateTime(), nullable=False),
+        sa.Column('last_run_at', sa.DateTime(), nullable=True),
+        sa.Column('pending_job_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('last_job_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['created_by'], ['users.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['department_id'], ['departments.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['pending_job_id'], ['report_jobs.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['last_job_id'], ['report_jobs.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_report_schedules_due', 'report_schedules', ['is_active', 'next_run_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_report_schedules_due', table_name='report_schedules')
+    op.drop_table('report_schedules')
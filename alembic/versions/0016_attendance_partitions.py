@@ -0,0 +1,157 @@
+"""monthly range partitions for attendance_records
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, user_id, check_in, check_out, status, location, notes, shift_id, created_at, updated_at, change_xid"
+)
+
+TOUCH_TRIGGER = (
+    "CREATE TRIGGER attendance_records_touch BEFORE UPDATE ON attendance_records "
+    "FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE attendance_records_touch()"
+)
+
+ENSURE_PARTITION = """
+CREATE OR REPLACE FUNCTION attendance_ensure_partition(for_month date) RETURNS text AS $$
+DECLARE
+    start_at timestamp := date_trunc('month', for_month);
+    end_at timestamp := date_trunc('month', for_month) + interval '1 month';
+    part text := 'attendance_records_' || to_char(for_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN part;
+    END IF;
+    -- Varios workers corren el job al arrancar: una creación a la vez
+    PERFORM pg_advisory_xact_lock(hashtext('attendance_partitions'));
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN part;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE attendance_records INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part);
+    -- Filas del mes que cayeron en la partición default (p. ej. sincronizaciones offline atrasadas)
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM attendance_records_default WHERE check_in >= %L AND check_in < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        start_at, end_at, part
+    );
+    EXECUTE format(
+        'ALTER TABLE attendance_records ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+        part, start_at, end_at
+    );
+    RETURN part;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def _create_indexes(open_unique: bool) -> None:
+    op.create_index('ix_attendance_user_checkin', 'attendance_records', ['user_id', 'check_in'])
+    op.create_index('ix_attendance_records_check_in', 'attendance_records', ['check_in'])
+    op.create_index('ix_attendance_records_status', 'attendance_records', ['status'])
+    op.create_index('ix_attendance_change_xid', 'attendance_records', ['change_xid'])
+    if open_unique:
+        op.create_index(
+            'uq_attendance_open_per_user',
+            'attendance_records',
+            ['user_id'],
+            unique=True,
+            postgresql_where=sa.text('check_out IS NULL'),
+        )
+
+
+def _drop_indexes(table: str, open_unique: bool) -> None:
+    if open_unique:
+        op.drop_index('uq_attendance_open_per_user', table_name=table)
+    op.drop_index('ix_attendance_change_xid', table_name=table)
+    op.drop_index('ix_attendance_records_status', table_name=table)
+    op.drop_index('ix_attendance_records_check_in', table_name=table)
+    op.drop_index('ix_attendance_user_checkin', table_name=table)
+
+
+def _create_table(partitioned: bool) -> None:
+    primary_key = ['id', 'check_in'] if partitioned else ['id']
+    options = {'postgresql_partition_by': 'RANGE (check_in)'} if partitioned else {}
+    op.create_table(
+        'attendance_records',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('check_in', sa.DateTime(), nullable=False),
+        sa.Column('check_out', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=True),
+        sa.Column('location', sa.String(length=255), nullable=True),
+        sa.Column('notes', sa.Text(), nullable=True),
+        sa.Column('shift_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.text("timezone('utc', now())"), nullable=False),
+        sa.Column('change_xid', sa.BigInteger(), server_default=sa.text('txid_current()'), nullable=False),
+        sa.ForeignKeyConstraint(['shift_id'], ['shifts.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(*primary_key),
+        sa.CheckConstraint('check_out IS NULL OR check_out >= check_in', name='ck_checkout_after_checkin'),
+        **options,
+    )
+
+
+def upgrade() -> None:
+    # La tabla actual queda a un lado mientras se copia; los nombres de índices son globales
+    op.execute("DROP TRIGGER attendance_records_touch ON attendance_records")
+    op.rename_table('attendance_records', 'attendance_records_unpartitioned')
+    _drop_indexes('attendance_records_unpartitioned', open_unique=True)
+    op.execute(
+        "ALTER TABLE attendance_records_unpartitioned "
+        "RENAME CONSTRAINT attendance_records_pkey TO attendance_records_unpartitioned_pkey"
+    )
+
+    # El índice único de registros abiertos no puede existir en una tabla
+    # particionada (debería incluir check_in); la clave primaria de
+    # attendance_presence ya serializa los escaneos de cada usuario
+    _create_table(partitioned=True)
+    _create_indexes(open_unique=False)
+    op.execute("CREATE TABLE attendance_records_default PARTITION OF attendance_records DEFAULT")
+    op.execute(TOUCH_TRIGGER)
+    op.execute(ENSURE_PARTITION)
+
+    # Un mes por partición desde el registro más antiguo hasta tres meses adelante
+    op.execute(
+        """
+        SELECT attendance_ensure_partition(month::date)
+        FROM generate_series(
+            date_trunc('month', coalesce((SELECT min(check_in) FROM attendance_records_unpartitioned), timezone('utc', now()))),
+            date_trunc('month', timezone('utc', now())) + interval '3 months',
+            interval '1 month'
+        ) AS month
+        """
+    )
+    op.execute(f"INSERT INTO attendance_records ({COLUMNS}) SELECT {COLUMNS} FROM attendance_records_unpartitioned")
+    op.drop_table('attendance_records_unpartitioned')
+
+
+def downgrade() -> None:
+    op.rename_table('attendance_records', 'attendance_records_partitioned')
+    _drop_indexes('attendance_records_partitioned', open_unique=False)
+    op.execute(
+        "ALTER TABLE attendance_records_partitioned "
+        "RENAME CONSTRAINT attendance_records_pkey TO attendance_records_partitioned_pkey"
+    )
+
+    _create_table(partitioned=False)
+    op.execute(f"INSERT INTO attendance_records ({COLUMNS}) SELECT {COLUMNS} FROM attendance_records_partitioned")
+    _create_indexes(open_unique=True)
+    op.execute(TOUCH_TRIGGER)
+
+    # Borra también todas las particiones
+    op.execute("DROP TABLE attendance_records_partitioned CASCADE")
+    op.execute("DROP FUNCTION IF EXISTS attendance_ensure_partition(date)")
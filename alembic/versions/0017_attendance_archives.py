@@ -0,0 +1,40 @@
+"""attendance archive manifest
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '0017'
+down_revision = '0016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'attendance_archives',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('file_path', sa.String(length=500), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('first_check_in', sa.DateTime(), nullable=True),
+        sa.Column('last_check_in', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_attendance_archives_month'), 'attendance_archives', ['month'])
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_attendance_archives_month'), table_name='attendance_archives')
+    op.drop_table('attendance_archives')
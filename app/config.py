@@ -33,7 +33,63 @@ class Settings(BaseSettings):
     smtp_username: str | None = None
     smtp_password: str | None = None
     smtp_tls: bool = False
+    smtp_pool_size: int = 4
+    smtp_pool_idle_timeout_seconds: float = 60
+    smtp_pool_health_check_seconds: float = 15
     mail_from: EmailStr = "noreply@example.com"
+    email_outbox_workers: int = 2
+    email_outbox_batch_size: int = 20
+    email_outbox_poll_seconds: float = 1.0
+    email_outbox_max_attempts: int = 8
+    email_outbox_retry_base_seconds: int = 30
+    email_outbox_retry_max_seconds: int = 3600
+    email_outbox_lease_seconds: int = 300
+    scan_group_commit: bool = False  # Opt-in: agrupa los escaneos en lotes con un único escritor
+    scan_batch_max_size: int = 200
+    scan_batch_linger_ms: float = 5
+    audit_queue_size: int = 10000  # Entradas de auditoría en espera; con la cola llena las peticiones esperan
+    audit_batch_size: int = 200
+    audit_flush_interval_ms: float = 1000
+    scan_debounce_seconds: float = 3  # Lecturas repetidas del mismo código en esta ventana no alternan; 0 lo desactiva
+    shift_calendar_horizon_days: int = 14  # Días hacia adelante con turnos esperados materializados
+    shift_early_checkin_minutes: int = 240  # Antelación máxima con la que una entrada cuenta para el turno
+    rollup_interval_seconds: int = 600  # Frecuencia del job que consolida los rollups diarios
+    rollup_recompute_days: int = 2  # Días recientes que se recalculan siempre (salidas después de medianoche)
+    report_cache_open_ttl_seconds: int = 30  # Rangos que incluyen hoy (además se invalidan con cada escaneo)
+    report_cache_closed_ttl_seconds: int = 86400  # Rangos ya cerrados
+    report_cache_max_entries: int = 1000
+    payroll_max_days: int = 62  # Período máximo de /api/reports/payroll
+    report_export_parallelism: int = 1  # Consultas de exportación en paralelo (por mes o departamento); tope: pool del engine
+    report_stream_chunk_size: int = 2000  # Filas por lote del cursor de exportación
+    report_csv_copy: bool = False  # Exportar CSV con COPY ... TO STDOUT (más rápido, formato de Postgres)
+    report_pdf_chunk_pages: int = 40  # Páginas por lote leído del cursor al renderizar PDF
+    report_pdf_max_rows: int = 250000  # Rangos más grandes fallan (usar CSV)
+    report_columnar_compression: str = "zstd"  # zstd o lz4 (snappy/gzip solo en Parquet)
+    report_columnar_batch_rows: int = 50000  # Filas por row group / record batch
+    report_store_dir: str = "storage/reports"  # File store de exportaciones terminadas
+    report_job_workers: int = 1
+    report_job_ttl_seconds: int = 3600  # Vigencia del resultado; exportaciones idénticas lo reutilizan
+    report_job_lease_seconds: int = 300
+    report_job_poll_seconds: float = 2.0
+    report_job_progress_seconds: float = 2.0
+    report_job_max_attempts: int = 3
+    report_schedule_window_start: int = 1  # Hora (UTC) en que empieza la ventana fuera de horas pico
+    report_schedule_window_end: int = 5  # Hora (UTC) en que termina; puede cruzar la medianoche (22 -> 4)
+    report_schedule_poll_seconds: float = 60
+    report_schedule_ttl_seconds: int = 604800  # Vigencia de los archivos programados para descarga
+    report_schedule_attach_max_bytes: int = 5000000  # Archivos más grandes se envían como enlace
+    attendance_partition_months_ahead: int = 3  # Particiones mensuales creadas por adelantado
+    attendance_archive_after_months: int = 13  # Meses cerrados más viejos se mueven al archivo frío; 0 desactiva
+    attendance_archive_dir: str = "storage/archive"  # Compartido por todas las instancias, como REPORT_STORE_DIR
+    attendance_archive_format: str = "csv.gz"  # csv.gz o parquet (requiere pyarrow)
+    attendance_archive_hour: int = 2  # Hora (UTC) a partir de la cual corre el archivado diario
+    attendance_digest_hour: int = 6  # Hora (UTC) a partir de la cual se envían los resúmenes del día anterior
+    live_feed_buffer_size: int = 100  # Eventos pendientes por suscriptor antes de desconectarlo
+    live_feed_heartbeat_seconds: float = 15
+    barcode_signed_codes: bool = True  # Emitir códigos firmados (HMAC) que se validan sin consultar qr_codes
+    barcode_signing_keys: str = ""  # "versión:clave" separados por coma; la versión 1 se deriva de SECRET_KEY si falta
+    barcode_signing_key_version: int = 1  # Versión con la que se firman los códigos nuevos
+    barcode_revocation_refresh_seconds: float = 30
     frontend_base_url: str = "http://localhost:3000"
     api_base_url: str = "http://localhost:8000"
     enable_biometric: bool = False
@@ -15,6 +15,11 @@ settings = get_settings()
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    return await user_from_token(token, db)
+
+
+async def user_from_token(token: str, db: AsyncSession) -> User:
+    """Valida un access token y retorna el usuario activo (también para tokens por query string)."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
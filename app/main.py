@@ -1,5 +1,6 @@
 import uvicorn
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -9,7 +10,20 @@ from sqlalchemy import text
 
 from .config import get_settings
 from .database import Base, engine
-from .routes import admin, attendance, auth, barcodes, biometric, reports, user
+from .routes import admin, attendance, auth, barcodes, biometric, live, reports, user
+from .utils.archive import start_archive_job, stop_archive_job
+from .utils.audit import audit_sink
+from .utils.digests import start_digest_scheduler, stop_digest_scheduler
+from .utils.email import smtp_pool
+from .utils.live_events import start_live_feed, stop_live_feed
+from .utils.metrics import render_metrics
+from .utils.outbox import start_outbox_workers, stop_outbox_workers
+from .utils.partitions import start_partition_job, stop_partition_job
+from .utils.report_jobs import start_report_workers, stop_report_workers
+from .utils.report_schedules import start_report_scheduler, stop_report_scheduler
+from .utils.rollups import start_rollup_job, stop_rollup_job
+from .utils.scan_batcher import scan_batcher
+from .utils.shift_calendar import start_shift_calendar_job, stop_shift_calendar_job
 
 
 settings = get_settings()
@@ -34,9 +48,7 @@ app.include_router(reports.router)
 app.include_router(biometric.router)
 app.include_router(admin.router)
 app.include_router(user.router)
-
-# Servir archivos estáticos del frontend
-app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
+app.include_router(live.router)
 
 
 @app.on_event("startup")
@@ -44,6 +56,35 @@ async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
         await conn.execute(text("SELECT 1"))
+    audit_sink.start()
+    start_partition_job()
+    start_archive_job()
+    start_outbox_workers()
+    start_digest_scheduler()
+    start_live_feed()
+    start_shift_calendar_job()
+    start_rollup_job()
+    start_report_workers()
+    start_report_scheduler()
+    if settings.scan_group_commit:
+        scan_batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await scan_batcher.stop()
+    await stop_report_scheduler()
+    await stop_report_workers()
+    await stop_rollup_job()
+    await stop_shift_calendar_job()
+    await stop_live_feed()
+    await stop_digest_scheduler()
+    await stop_outbox_workers()
+    await stop_archive_job()
+    await stop_partition_job()
+    # Último: escribe las entradas de auditoría que dejaron las peticiones y los jobs
+    await audit_sink.stop()
+    await smtp_pool.close()
 
 
 @app.get("/health")
@@ -51,5 +92,14 @@ async def health():
     return {"status": "ok", "env": settings.environment}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return render_metrics()
+
+
+# Servir archivos estáticos del frontend (al final: el mount en "/" captura cualquier ruta)
+app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
+
+
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,16 +1,22 @@
 import uuid
-from datetime import datetime, time, timezone
+from datetime import date, datetime, time, timezone
 
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Boolean,
     CheckConstraint,
+    Date,
     DateTime,
     ForeignKey,
     Index,
+    Integer,
     String,
     Text,
     Time,
     UniqueConstraint,
+    event,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -79,7 +85,10 @@ class User(Base):
     shift_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("shifts.id"))
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     is_email_verified: Mapped[bool] = mapped_column(Boolean, default=False)
-    notification_preferences: Mapped[dict] = mapped_column(JSONB, default=lambda: {"registration": True, "reset": True, "attendance": True})
+    notification_preferences: Mapped[dict] = mapped_column(
+        JSONB,
+        default=lambda: {"registration": True, "reset": True, "attendance": True, "attendance_mode": "instant", "late_digest": False},
+    )
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, onupdate=utc_now)
 
@@ -103,27 +112,222 @@ class User(Base):
 
 
 class AttendanceRecord(Base):
+    """
+    Particionada por rango mensual de ``check_in`` (attendance_records_AAAA_MM,
+    más una partición default). Las consultas que filtran por ``check_in`` solo
+    leen los meses del rango.
+    """
+
     __tablename__ = "attendance_records"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
     user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    check_in: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=utc_now, index=True)
+    # Parte de la clave primaria: en una tabla particionada la clave debe incluir la columna de partición
+    check_in: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=utc_now, index=True)
     check_out: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
     status: Mapped[str] = mapped_column(String(20), default="on-time", index=True)
     location: Mapped[str | None] = mapped_column(String(255))
     notes: Mapped[str | None] = mapped_column(Text)
     shift_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("shifts.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+    # Seguimiento de cambios para exportaciones incrementales; el trigger
+    # attendance_records_touch los renueva en cada UPDATE que cambia la fila
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=text("timezone('utc', now())"))
+    change_xid: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=text("txid_current()"))
 
     user: Mapped["User"] = relationship("User", back_populates="attendance_records")
     shift: Mapped["Shift | None"] = relationship("Shift")
 
+    # Un solo registro abierto por usuario lo garantiza la clave primaria de
+    # attendance_presence (un índice único por user_id no es posible en la tabla particionada)
     __table_args__ = (
         Index("ix_attendance_user_checkin", "user_id", "check_in"),
         CheckConstraint("check_out IS NULL OR check_out >= check_in", name="ck_checkout_after_checkin"),
+        Index("ix_attendance_change_xid", "change_xid"),
+        {"postgresql_partition_by": "RANGE (check_in)"},
+    )
+
+
+# Mismos trigger, partición default y función de particiones que las
+# migraciones 0014 y 0016, para las bases creadas con create_all
+event.listen(
+    AttendanceRecord.__table__,
+    "after_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION attendance_records_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := timezone('utc', now());
+            NEW.change_xid := txid_current();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    ),
+)
+event.listen(
+    AttendanceRecord.__table__,
+    "after_create",
+    DDL(
+        "CREATE TRIGGER attendance_records_touch BEFORE UPDATE ON attendance_records "
+        "FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE PROCEDURE attendance_records_touch()"
+    ),
+)
+event.listen(
+    AttendanceRecord.__table__,
+    "after_create",
+    DDL("CREATE TABLE attendance_records_default PARTITION OF attendance_records DEFAULT"),
+)
+# DDL interpola con %: los %%I / %%L llegan a format() como %I / %L
+event.listen(
+    AttendanceRecord.__table__,
+    "after_create",
+    DDL(
+        """
+        CREATE OR REPLACE FUNCTION attendance_ensure_partition(for_month date) RETURNS text AS $$
+        DECLARE
+            start_at timestamp := date_trunc('month', for_month);
+            end_at timestamp := date_trunc('month', for_month) + interval '1 month';
+            part text := 'attendance_records_' || to_char(for_month, 'YYYY_MM');
+        BEGIN
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN part;
+            END IF;
+            PERFORM pg_advisory_xact_lock(hashtext('attendance_partitions'));
+            IF to_regclass(part) IS NOT NULL THEN
+                RETURN part;
+            END IF;
+            EXECUTE format('CREATE TABLE %%I (LIKE attendance_records INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM attendance_records_default WHERE check_in >= %%L AND check_in < %%L RETURNING *) '
+                'INSERT INTO %%I SELECT * FROM moved',
+                start_at, end_at, part
+            );
+            EXECUTE format(
+                'ALTER TABLE attendance_records ATTACH PARTITION %%I FOR VALUES FROM (%%L) TO (%%L)',
+                part, start_at, end_at
+            );
+            RETURN part;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    ),
+)
+
+
+class ShiftInstance(Base):
+    """Turno esperado de un usuario en un día, materializado por adelantado desde ``Shift``."""
+
+    __tablename__ = "shift_instances"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    work_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    shift_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("shifts.id", ondelete="CASCADE"), nullable=False)
+    starts_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # Turnos nocturnos terminan al día siguiente de work_date
+    ends_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    late_after: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_shift_instances_user_window", "user_id", "starts_at", "ends_at"),
+        Index("ix_shift_instances_work_date", "work_date"),
     )
 
 
+class AttendanceDailyUser(Base):
+    """Rollup diario por usuario (día de la entrada); lo mantiene el job de rollups."""
+
+    __tablename__ = "attendance_daily_user"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    check_ins: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    late_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    minutes_worked: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_attendance_daily_user_day", "day"),)
+
+
+class AttendanceDailyDepartment(Base):
+    """Rollup diario por departamento. Usuarios sin departamento van bajo el UUID nulo."""
+
+    __tablename__ = "attendance_daily_department"
+
+    department_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    check_ins: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    late_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    minutes_worked: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    employees: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_attendance_daily_department_day", "day"),)
+
+
+class RollupState(Base):
+    """Hasta qué día (inclusive) están completos los rollups."""
+
+    __tablename__ = "rollup_state"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    rolled_through: Mapped[date | None] = mapped_column(Date, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+
+
+class RollupDirtyDay(Base):
+    """Días ya consolidados que recibieron registros tarde (p. ej. sync offline) y deben recalcularse."""
+
+    __tablename__ = "rollup_dirty_days"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+
+
+class AttendancePresence(Base):
+    """Quién está dentro ahora: una fila por usuario con check-in abierto."""
+
+    __tablename__ = "attendance_presence"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    record_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False, unique=True)
+    check_in: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    location: Mapped[str | None] = mapped_column(String(255))
+
+    user: Mapped["User"] = relationship("User")
+
+
+class KioskScan(Base):
+    """Escaneos sincronizados desde kioscos offline, para deduplicar por id de cliente."""
+
+    __tablename__ = "kiosk_scans"
+
+    client_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    device_id: Mapped[str] = mapped_column(String(100), nullable=False)
+    captured_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    outcome: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    record_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    received_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+
+
+class ScanDebounce(Base):
+    """Último escaneo por código, para ignorar lecturas repetidas. Tabla UNLOGGED: es descartable."""
+
+    __tablename__ = "scan_debounce"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    code_data: Mapped[str] = mapped_column(String(255), primary_key=True)
+    scanned_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    result: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+
+
+class RevokedBarcode(Base):
+    """Códigos firmados revocados antes de expirar (p. ej. al regenerar el código de un usuario)."""
+
+    __tablename__ = "revoked_barcodes"
+
+    code_data: Mapped[str] = mapped_column(String(255), primary_key=True)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    revoked_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+
+
 class QRCode(Base):
     __tablename__ = "qr_codes"
 
@@ -168,3 +372,125 @@ class AuditLog(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, index=True)
 
     user: Mapped["User | None"] = relationship("User", back_populates="audit_logs")
+
+
+class EmailOutbox(Base):
+    """Emails pendientes de envío, escritos en la misma transacción que el cambio de negocio."""
+
+    __tablename__ = "email_outbox"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
+    recipient: Mapped[str] = mapped_column(String(255), nullable=False)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    body: Mapped[str] = mapped_column(Text, nullable=False)
+    html: Mapped[str | None] = mapped_column(Text, nullable=True)
+    attachments: Mapped[list | None] = mapped_column(JSONB, nullable=True)
+    # Evita encolar dos veces el mismo email (p.ej. un digest diario)
+    dedupe_key: Mapped[str | None] = mapped_column(String(255), nullable=True, unique=True)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, nullable=False)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+
+class ReportJob(Base):
+    """Exportación de reportes en segundo plano; el resultado queda en el file store hasta ``expires_at``."""
+
+    __tablename__ = "report_jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
+    requested_by: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True
+    )
+    format: Mapped[str] = mapped_column(String(10), nullable=False)
+    range_start: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    range_end: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    department_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    # Hash de los parámetros normalizados: exportaciones idénticas comparten el resultado
+    cache_key: Mapped[str] = mapped_column(String(64), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    rows_total: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    rows_done: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    file_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    size_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    locked_until: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_report_jobs_cache_key", "cache_key", "status"),
+        Index("ix_report_jobs_due", "status", "created_at"),
+        # Un solo job en curso por combinación de parámetros
+        Index(
+            "uq_report_jobs_active_key",
+            "cache_key",
+            unique=True,
+            postgresql_where=text("status IN ('pending', 'running')"),
+        ),
+    )
+
+
+class ReportSchedule(Base):
+    """Exportación recurrente; el worker de programaciones la genera en la ventana fuera de horas pico."""
+
+    __tablename__ = "report_schedules"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
+    name: Mapped[str] = mapped_column(String(100), nullable=False)
+    created_by: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True
+    )
+    format: Mapped[str] = mapped_column(String(10), nullable=False)
+    # previous_day, previous_week, previous_month, last_7_days o last_30_days, relativo al día de ejecución
+    range_template: Mapped[str] = mapped_column(String(20), nullable=False)
+    department_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("departments.id", ondelete="CASCADE"), nullable=True
+    )
+    # daily, weekly (weekday: 0=domingo ... 6=sábado) o monthly (day_of_month)
+    frequency: Mapped[str] = mapped_column(String(10), nullable=False)
+    weekday: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    day_of_month: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    recipients: Mapped[list[str]] = mapped_column(JSONB, default=list)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    last_run_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Job encolado en la última ejecución y todavía no entregado
+    pending_job_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("report_jobs.id", ondelete="SET NULL"), nullable=True
+    )
+    last_job_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("report_jobs.id", ondelete="SET NULL"), nullable=True
+    )
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, nullable=False)
+
+    __table_args__ = (Index("ix_report_schedules_due", "is_active", "next_run_at"),)
+
+
+class AttendanceArchive(Base):
+    """Manifiesto del archivo frío: un archivo comprimido con los registros de un mes ya cerrado."""
+
+    __tablename__ = "attendance_archives"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=default_uuid)
+    # Primer día del mes; puede haber más de un archivo si llegaron registros tarde
+    month: Mapped[date] = mapped_column(Date, nullable=False, index=True)
+    file_path: Mapped[str] = mapped_column(String(500), nullable=False)
+    format: Mapped[str] = mapped_column(String(10), nullable=False)
+    row_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=False)
+    first_check_in: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_check_in: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=utc_now, nullable=False)
@@ -7,11 +7,15 @@ from sqlalchemy.orm import selectinload
 
 from .. import schemas
 from ..dependencies import require_role
-from ..models import AuditLog, Department, Role, Shift, User, QRCode
+from ..models import Department, Role, Shift, User, QRCode, utc_now
 from ..utils.security import hash_password
 from ..utils import barcode
-from ..utils.email import build_admin_created_user_email, send_email
+from ..utils.audit import add_audit_entry
+from ..utils.email import build_admin_created_user_email
+from ..utils.outbox import enqueue_email
 from ..utils.password import generate_secure_password
+from ..utils.revocation import revoke_code
+from ..utils import shift_calendar
 from ..database import get_db
 
 admin_only = require_role(["Admin"])
@@ -78,19 +82,19 @@ async def create_user(request: Request, payload: schemas.UserCreate, db: AsyncSe
         is_active=True
     )
     db.add(barcode_record)
+    await shift_calendar.refresh_users(db, [user.id])
 
     # Registrar en audit log
-    db.add(AuditLog(
-        user_id=user.id,
-        action="CREATE",
-        resource="user",
-        changes={"created_by_admin": True, "user": str(user.id)},
-        ip_address=request.client.host if request.client else None
-    ))
-
-    await db.commit()
+    add_audit_entry(
+        db,
+        user.id,
+        "CREATE",
+        "user",
+        {"created_by_admin": True, "user": str(user.id)},
+        ip_address=request.client.host if request.client else None,
+    )
 
-    # Enviar email con credenciales y código de barras
+    # Encolar email con credenciales y código de barras
     if user.notification_preferences.get("registration", True):
         subject, recipient, html = build_admin_created_user_email(
             user.email,
@@ -98,8 +102,9 @@ async def create_user(request: Request, payload: schemas.UserCreate, db: AsyncSe
             user.employee_id,
             plain_password
         )
-        barcode_png = barcode.generate_barcode_png(user.employee_id)
-        await send_email(
+        barcode_png = barcode.generate_barcode_png(barcode_record.code_data)
+        enqueue_email(
+            db,
             subject,
             recipient,
             f"Bienvenido {user.first_name}",
@@ -107,6 +112,8 @@ async def create_user(request: Request, payload: schemas.UserCreate, db: AsyncSe
             attachments=[(f"barcode_{user.employee_id}.png", barcode_png, "image/png")]
         )
 
+    await db.commit()
+
     # Recargar con relaciones
     result = await db.execute(
         select(User)
@@ -126,8 +133,12 @@ async def update_user(user_id: uuid.UUID, payload: schemas.UserUpdate, db: Async
     user = result.scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    for field, value in payload.model_dump(exclude_unset=True).items():
+    changes = payload.model_dump(exclude_unset=True)
+    for field, value in changes.items():
         setattr(user, field, value)
+    if "shift_id" in changes or "is_active" in changes:
+        await db.flush()
+        await shift_calendar.refresh_users(db, [user.id])
     await db.commit()
 
     # Recargar con relaciones
@@ -150,6 +161,34 @@ async def delete_user(user_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
     return {"detail": "deleted"}
 
 
+@router.post("/users/{user_id}/barcode")
+async def regenerate_barcode(user_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """
+    Emite un código nuevo para el usuario y revoca el anterior.
+
+    También sirve para migrar códigos planos (employee_id) al formato firmado.
+    """
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    barcode_record = await db.scalar(select(QRCode).where(QRCode.user_id == user_id))
+
+    expires_at = barcode.default_expiration()
+    code_data = barcode.generate_code_data(user.employee_id, expires_at)
+    if barcode_record is None:
+        db.add(QRCode(user_id=user.id, code_data=code_data, expires_at=expires_at, is_active=True))
+    else:
+        if barcode.is_signed_code(barcode_record.code_data):
+            # Un código firmado es válido por sí mismo hasta expirar: hay que revocarlo
+            await revoke_code(db, barcode_record.code_data, barcode_record.expires_at)
+        barcode_record.code_data = code_data
+        barcode_record.generated_at = utc_now()
+        barcode_record.expires_at = expires_at
+        barcode_record.is_active = True
+    await db.commit()
+    return {"detail": "Código regenerado", "code_data": code_data}
+
+
 @router.get("/roles", response_model=list[schemas.RoleOut])
 async def list_roles(db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Role))
@@ -243,6 +282,8 @@ async def update_shift(shift_id: uuid.UUID, payload: schemas.ShiftUpdate, db: As
         raise HTTPException(status_code=404, detail="Turno no encontrado")
     for field, value in payload.model_dump(exclude_unset=True).items():
         setattr(shift, field, value)
+    await db.flush()
+    await shift_calendar.refresh_shift(db, shift.id)
     await db.commit()
     await db.refresh(shift)
     return shift
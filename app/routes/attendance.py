@@ -1,15 +1,33 @@
+import uuid
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile, Form
-from sqlalchemy import and_, select, func
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 import logging
 
 from .. import schemas
 from ..dependencies import get_current_user
-from ..models import AttendanceRecord, QRCode, User, BiometricData
-from ..utils.email import build_attendance_alert, send_email
+from ..models import AttendanceRecord, KioskScan, QRCode, User, BiometricData
+from ..utils import barcode
+from ..utils.attendance import (
+    ScanIntent,
+    apply_scans_bulk,
+    enqueue_scan_alerts,
+    status_for_check_in,
+    toggle_attendance,
+)
+from ..utils.debounce import claim_scan, debounce_enabled, previous_result, release_scan, store_result
+from ..utils.digests import attendance_mode
+from ..utils.email import build_attendance_alert
+from ..utils.live_events import attendance_event, notify_events, outcome_events, publish_events
+from ..utils.outbox import enqueue_email
+from ..utils.revocation import is_revoked
+from ..utils.rollups import mark_dirty
+from ..utils.scan_batcher import scan_batcher
 from ..database import get_db
 
 logger = logging.getLogger(__name__)
@@ -17,77 +35,257 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/attendance", tags=["attendance"])
 
 
-async def _status_for_check_in(user: User, check_in: datetime) -> str:
-    # User must have eagerly loaded shift relationship
-    if not user.shift:
-        return "on-time"
-    start_dt = datetime.combine(check_in.date(), user.shift.start_time)
-    if check_in > start_dt + timedelta(minutes=user.shift.grace_period_minutes):
-        return "late"
-    return "on-time"
-
-
 @router.post("/scan", response_model=schemas.AttendanceOut)
 async def scan_attendance(payload: schemas.AttendanceCreate, db: AsyncSession = Depends(get_db)):
     now = datetime.now(timezone.utc).replace(tzinfo=None)  # Naive datetime para PostgreSQL
-    qr_result = await db.execute(
-        select(QRCode)
-        .where(QRCode.code_data == payload.code_data)
-        .where(QRCode.is_active.is_(True))
-        .where((QRCode.expires_at.is_(None)) | (QRCode.expires_at > now))
-    )
-    qr = qr_result.scalar_one_or_none()
-    if not qr:
+    users = await _resolve_codes(db, {payload.code_data}, now)
+    user = users.get(payload.code_data)
+    if not user:
         raise HTTPException(status_code=404, detail="Código no válido")
-
-    user_result = await db.execute(
-        select(User).options(selectinload(User.shift)).where(User.id == qr.user_id)
-    )
-    user = user_result.scalar_one_or_none()
-    if not user or not user.is_active:
+    if not user.is_active:
         raise HTTPException(status_code=403, detail="Usuario inactivo")
 
-    # LÓGICA AUTOMÁTICA: Detectar si es entrada o salida
-    # Buscar si hay un check-in abierto (sin check-out)
-    last_result = await db.execute(
-        select(AttendanceRecord)
-        .where(and_(AttendanceRecord.user_id == user.id, AttendanceRecord.check_out.is_(None)))
-        .order_by(AttendanceRecord.check_in.desc())
-        .limit(1)  # IMPORTANTE: Solo obtener el último registro
-    )
-    open_record = last_result.scalar_one_or_none()
+    if payload.client_id is not None:
+        # Reintento de un escaneo ya registrado (p. ej. se perdió la respuesta)
+        prior = await db.get(KioskScan, payload.client_id)
+        if prior is not None:
+            if prior.record_id is None:
+                raise HTTPException(status_code=409, detail="Escaneo duplicado en proceso")
+            return await db.scalar(select(AttendanceRecord).where(AttendanceRecord.id == prior.record_id))
+
+    debounced = debounce_enabled()
+    if debounced and not await claim_scan(db, payload.code_data, now):
+        # Lectura repetida del mismo código: responder con el resultado anterior
+        previous = await previous_result(db, payload.code_data)
+        if previous is None:
+            raise HTTPException(status_code=409, detail="Escaneo duplicado en proceso")
+        return previous
 
-    if open_record:
-        # Ya hay un check-in abierto → registrar SALIDA
-        open_record.check_out = now
-        open_record.notes = payload.notes or open_record.notes
+    try:
+        record = await _toggle_scan(db, user, now, payload)
+    except Exception:
+        if debounced:
+            await db.rollback()
+            await release_scan(db, payload.code_data, now)
+        raise
+
+    if debounced:
+        result = schemas.AttendanceOut.model_validate(record).model_dump(mode="json")
+        await store_result(db, payload.code_data, now, result)
         await db.commit()
-        await db.refresh(open_record)
-        record = open_record
-        action_performed = "check_out"
-    else:
-        # No hay check-in abierto → registrar ENTRADA
-        status = await _status_for_check_in(user, now)
-        record = AttendanceRecord(
-            user_id=user.id,
-            check_in=now,
-            status=status,
-            location=payload.location,
-            notes=payload.notes,
-            shift_id=user.shift_id,
-        )
-        db.add(record)
+    return record
+
+
+async def _toggle_scan(db: AsyncSession, user: User, now: datetime, payload: schemas.AttendanceCreate):
+    # LÓGICA AUTOMÁTICA: Detectar si es entrada o salida
+    # Con client_id el toggle y su fila en kiosk_scans van en la misma transacción:
+    # el lote del group commit confirma por separado, así que no se usa
+    if scan_batcher.running and payload.client_id is None:
+        # Libera la conexión de lectura mientras el lote se confirma
         await db.commit()
-        await db.refresh(record)
-        action_performed = "check_in"
+        outcome = await scan_batcher.submit(
+            ScanIntent(user=user, at=now, location=payload.location, notes=payload.notes)
+        )
+        if outcome.record is None:
+            raise HTTPException(status_code=409, detail=outcome.detail)
+        return outcome.record
+
+    # Una sola sentencia cierra el check-in abierto o registra uno nuevo
+    record, action = await toggle_attendance(
+        db,
+        user.id,
+        user.shift_id,
+        now,
+        status_for_check_in(user, now),
+        location=payload.location,
+        notes=payload.notes,
+    )
 
-    if user.notification_preferences.get("attendance", True):
+    if attendance_mode(user.notification_preferences) == "instant":
         subject, recipient, html = build_attendance_alert(user.email, record.status, payload.notes)
-        await send_email(subject, recipient, "Alerta de asistencia", html)
+        enqueue_email(db, subject, recipient, "Alerta de asistencia", html)
+
+    if payload.client_id is not None:
+        # La sincronización offline deduplica por client_id contra esta fila
+        db.add(
+            KioskScan(
+                client_id=payload.client_id,
+                device_id=payload.device_id or "online",
+                captured_at=now,
+                outcome=action,
+                record_id=record.id,
+                received_at=now,
+            )
+        )
 
+    events = [attendance_event(user, schemas.AttendanceOut.model_validate(record).model_dump())]
+    await notify_events(db, events)
+    try:
+        await db.commit()
+    except IntegrityError:
+        if payload.client_id is None:
+            raise
+        # El mismo client_id llegó dos veces en paralelo: el otro ya registró
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Escaneo duplicado en proceso")
+    publish_events(events)
     return record
 
 
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def _resolve_codes(db: AsyncSession, codes: set[str], now: datetime) -> dict[str, User]:
+    """
+    Resuelve códigos válidos a sus usuarios.
+
+    Los códigos firmados se validan en memoria (firma, expiración y revocación)
+    y solo se consulta ``users``; los códigos planos (employee_id) siguen
+    validándose contra ``qr_codes``.
+    """
+    resolved: dict[str, User] = {}
+    signed: dict[str, str] = {}
+    plain: set[str] = set()
+    for code in codes:
+        if not barcode.is_signed_code(code):
+            plain.add(code)
+            continue
+        employee_id = barcode.verify_code_data(code, now)
+        if employee_id is not None and not await is_revoked(db, code):
+            signed[code] = employee_id
+
+    if signed:
+        result = await db.execute(
+            select(User).options(selectinload(User.shift)).where(User.employee_id.in_(set(signed.values())))
+        )
+        by_employee = {user.employee_id: user for user in result.scalars().all()}
+        for code, employee_id in signed.items():
+            if employee_id in by_employee:
+                resolved[code] = by_employee[employee_id]
+
+    if plain:
+        result = await db.execute(
+            select(QRCode.code_data, User)
+            .join(User, User.id == QRCode.user_id)
+            .options(selectinload(User.shift))
+            .where(QRCode.code_data.in_(plain))
+            .where(QRCode.is_active.is_(True))
+            .where((QRCode.expires_at.is_(None)) | (QRCode.expires_at > now))
+        )
+        resolved.update({code: user for code, user in result.all()})
+    return resolved
+
+
+async def _apply_offline_scans(
+    db: AsyncSession, payload: schemas.ScanSyncRequest
+) -> tuple[list[schemas.ScanSyncResult], list[dict]]:
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    received = {scan.client_id: scan for scan in payload.scans}
+
+    # Reclamar los client_id: los que ya existían son reintentos ya procesados
+    claimed = set(
+        (
+            await db.execute(
+                pg_insert(KioskScan)
+                .values(
+                    [
+                        {
+                            "client_id": scan.client_id,
+                            "device_id": payload.device_id,
+                            "captured_at": _naive_utc(scan.captured_at),
+                            "received_at": now,
+                        }
+                        for scan in received.values()
+                    ]
+                )
+                .on_conflict_do_nothing(index_elements=["client_id"])
+                .returning(KioskScan.client_id)
+            )
+        ).scalars()
+    )
+
+    results: dict[uuid.UUID, schemas.ScanSyncResult] = {}
+    duplicates = [client_id for client_id in received if client_id not in claimed]
+    if duplicates:
+        prior = await db.execute(
+            select(KioskScan.client_id, KioskScan.record_id).where(KioskScan.client_id.in_(duplicates))
+        )
+        for client_id, record_id in prior.all():
+            results[client_id] = schemas.ScanSyncResult(client_id=client_id, outcome="duplicate", record_id=record_id)
+
+    pending = [scan for client_id, scan in received.items() if client_id in claimed]
+    users = await _resolve_codes(db, {scan.code_data for scan in pending}, now)
+
+    intents: list[ScanIntent] = []
+    intent_scans: list[schemas.OfflineScan] = []
+    for scan in pending:
+        user = users.get(scan.code_data)
+        captured_at = _naive_utc(scan.captured_at)
+        if user is None:
+            results[scan.client_id] = schemas.ScanSyncResult(client_id=scan.client_id, outcome="invalid_code", detail="Código no válido")
+        elif not user.is_active:
+            results[scan.client_id] = schemas.ScanSyncResult(client_id=scan.client_id, outcome="inactive_user", detail="Usuario inactivo")
+        elif captured_at > now + timedelta(minutes=5):
+            results[scan.client_id] = schemas.ScanSyncResult(client_id=scan.client_id, outcome="rejected", detail="Hora de captura en el futuro")
+        else:
+            intents.append(ScanIntent(user=user, at=captured_at, location=scan.location, notes=scan.notes))
+            intent_scans.append(scan)
+
+    outcomes = await apply_scans_bulk(db, intents)
+    for scan, outcome in zip(intent_scans, outcomes):
+        record = outcome.record
+        results[scan.client_id] = schemas.ScanSyncResult(
+            client_id=scan.client_id,
+            outcome=outcome.action,
+            record_id=record["id"] if record else None,
+            detail=outcome.detail,
+        )
+    enqueue_scan_alerts(db, outcomes)
+    await notify_events(db, outcome_events(outcomes))
+    # Escaneos de días ya consolidados: recalcular sus rollups
+    await mark_dirty(db, {outcome.record["check_in"].date() for outcome in outcomes if outcome.record})
+
+    # Guardar el resultado para responder igual a futuros reintentos
+    if claimed:
+        await db.execute(
+            update(KioskScan)
+            .where(KioskScan.client_id == bindparam("b_client_id"))
+            .values(outcome=bindparam("b_outcome"), record_id=bindparam("b_record_id")),
+            [
+                {"b_client_id": client_id, "b_outcome": results[client_id].outcome, "b_record_id": results[client_id].record_id}
+                for client_id in claimed
+            ],
+        )
+
+    return [results[scan.client_id] for scan in payload.scans], outcome_events(outcomes)
+
+
+@router.post("/sync", response_model=schemas.ScanSyncResponse)
+async def sync_offline_scans(payload: schemas.ScanSyncRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Sincroniza en lote los escaneos que un kiosco guardó sin conexión.
+
+    Deduplica por ``client_id``, ordena por usuario y hora de captura, aplica
+    el toggle con escrituras en lote y retorna el resultado de cada escaneo.
+    """
+    if not payload.scans:
+        return schemas.ScanSyncResponse(results=[])
+    for attempt in range(2):
+        try:
+            results, events = await _apply_offline_scans(db, payload)
+            await db.commit()
+            publish_events(events)
+            return schemas.ScanSyncResponse(results=results)
+        except IntegrityError:
+            # Un escaneo en línea abrió una entrada en paralelo: reintentar con la presencia actual
+            await db.rollback()
+            if attempt:
+                raise HTTPException(status_code=409, detail="Conflicto al sincronizar, reintenta")
+
+
 @router.post("/biometric-scan", response_model=schemas.AttendanceOut)
 async def biometric_scan(
     image: UploadFile = File(...),
@@ -170,48 +368,29 @@ async def biometric_scan(
         # Same logic as /scan endpoint - detect check-in or check-out
         now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-        last_result = await db.execute(
-            select(AttendanceRecord)
-            .where(and_(
-                AttendanceRecord.user_id == matched_user.id,
-                AttendanceRecord.check_out.is_(None)
-            ))
-            .order_by(AttendanceRecord.check_in.desc())
-            .limit(1)
+        record, _ = await toggle_attendance(
+            db,
+            matched_user.id,
+            matched_user.shift_id,
+            now,
+            status_for_check_in(matched_user, now),
+            location=location,
+            notes=notes,
         )
-        open_record = last_result.scalar_one_or_none()
-
-        if open_record:
-            # Already checked in → register CHECK-OUT
-            open_record.check_out = now
-            open_record.notes = notes or open_record.notes
-            await db.commit()
-            await db.refresh(open_record)
-            record = open_record
-        else:
-            # No open check-in → register CHECK-IN
-            status = await _status_for_check_in(matched_user, now)
-            record = AttendanceRecord(
-                user_id=matched_user.id,
-                check_in=now,
-                status=status,
-                location=location,
-                notes=notes,
-                shift_id=matched_user.shift_id,
-            )
-            db.add(record)
-            await db.commit()
-            await db.refresh(record)
 
         # Send notification if enabled
-        if matched_user.notification_preferences.get("attendance", True):
+        if attendance_mode(matched_user.notification_preferences) == "instant":
             subject, recipient, html = build_attendance_alert(
                 matched_user.email,
                 record.status,
                 notes
             )
-            await send_email(subject, recipient, "Alerta de asistencia", html)
+            enqueue_email(db, subject, recipient, "Alerta de asistencia", html)
 
+        events = [attendance_event(matched_user, schemas.AttendanceOut.model_validate(record).model_dump())]
+        await notify_events(db, events)
+        await db.commit()
+        publish_events(events)
         return record
 
     except HTTPException:
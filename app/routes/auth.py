@@ -10,9 +10,11 @@ from slowapi.util import get_remote_address
 
 from .. import schemas
 from ..dependencies import get_current_user
-from ..models import AuditLog, BiometricData, QRCode, Role, User
-from ..utils import barcode
-from ..utils.email import build_reset_email, build_verification_email, build_welcome_email, send_email
+from ..models import BiometricData, QRCode, Role, User
+from ..utils import barcode, shift_calendar
+from ..utils.audit import add_audit_entry, audit_sink
+from ..utils.email import build_reset_email, build_verification_email, build_welcome_email
+from ..utils.outbox import enqueue_email
 from ..utils.security import (
     create_access_token,
     create_email_verification_token,
@@ -56,11 +58,6 @@ router = APIRouter(prefix="/api/auth", tags=["auth"])
 limiter = Limiter(key_func=get_remote_address)
 
 
-async def _log(db: AsyncSession, user_id: uuid.UUID | None, action: str, resource: str, changes: dict | None = None, ip_address: str | None = None):
-    db.add(AuditLog(user_id=user_id, action=action, resource=resource, changes=changes, ip_address=ip_address))
-    await db.commit()
-
-
 @router.post("/register", response_model=schemas.AuthResponse, status_code=status.HTTP_201_CREATED)
 @limiter.limit("5/minute")
 async def register(request: Request, payload: schemas.RegistrationRequest, db: AsyncSession = Depends(get_db)):
@@ -95,22 +92,22 @@ async def register(request: Request, payload: schemas.RegistrationRequest, db: A
         is_active=True
     )
     db.add(barcode_code)
-    await db.commit()
-    await db.refresh(user)
+    await shift_calendar.refresh_users(db, [user.id])
 
-    # Enviar emails de verificación y bienvenida
+    # Encolar emails de verificación y bienvenida en la misma transacción
     if user.notification_preferences.get("registration", True):
         # Email de verificación
         verify_token = create_email_verification_token(str(user.id))
         subject, recipient, html = build_verification_email(user.email, verify_token)
-        await send_email(subject, recipient, "Verifica tu correo", html)
+        enqueue_email(db, subject, recipient, "Verifica tu correo", html)
 
         # Email de bienvenida con código de barras adjunto
         subject_welcome, recipient_welcome, html_welcome = build_welcome_email(
             user.email, user.first_name, user.employee_id
         )
-        barcode_png = barcode.generate_barcode_png(user.employee_id)
-        await send_email(
+        barcode_png = barcode.generate_barcode_png(barcode_code.code_data)
+        enqueue_email(
+            db,
             subject_welcome,
             recipient_welcome,
             f"Bienvenido {user.first_name}",
@@ -118,7 +115,10 @@ async def register(request: Request, payload: schemas.RegistrationRequest, db: A
             attachments=[(f"barcode_{user.employee_id}.png", barcode_png, "image/png")]
         )
 
-    await _log(db, user.id, "CREATE", "user", {"user": str(user.id)}, ip_address=request.client.host if request.client else None)
+    await db.commit()
+    await db.refresh(user)
+
+    await audit_sink.log(user.id, "CREATE", "user", {"user": str(user.id)}, ip_address=request.client.host if request.client else None)
     tokens = schemas.AuthTokens(access_token=create_access_token(str(user.id)))
     return schemas.AuthResponse(user=user, tokens=tokens)
 
@@ -218,8 +218,8 @@ async def login_with_face(request: Request, payload: schemas.FaceLoginRequest, d
                 f"Face verification failed for user {payload.email}: "
                 f"confidence={confidence:.2f}%"
             )
-            await _log(
-                db, user.id, "FAILED_FACE_LOGIN", "auth",
+            await audit_sink.log(
+                user.id, "FAILED_FACE_LOGIN", "auth",
                 {"confidence": confidence, "reason": "face_mismatch"},
                 ip_address=request.client.host if request.client else None
             )
@@ -234,8 +234,8 @@ async def login_with_face(request: Request, payload: schemas.FaceLoginRequest, d
 
         # Login exitoso
         logger.info(f"Successful face login for user {payload.email} (confidence: {confidence:.2f}%)")
-        await _log(
-            db, user.id, "FACE_LOGIN", "auth",
+        await audit_sink.log(
+            user.id, "FACE_LOGIN", "auth",
             {"confidence": confidence, "method": "facial_recognition"},
             ip_address=request.client.host if request.client else None
         )
@@ -289,7 +289,7 @@ async def verify_email(request: Request, payload: schemas.EmailVerificationReque
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     user.is_email_verified = True
     await db.commit()
-    await _log(db, user.id, "VERIFY", "user", {"verified": True}, ip_address=request.client.host if request.client else None)
+    await audit_sink.log(user.id, "VERIFY", "user", {"verified": True}, ip_address=request.client.host if request.client else None)
     return {"detail": "Correo verificado"}
 
 
@@ -323,13 +323,13 @@ async def request_password_reset(request: Request, payload: schemas.PasswordRese
     user.password_reset_token = reset_token
     user.password_reset_expires = datetime.now() + timedelta(hours=1)  # Expira en 1 hora
 
-    await db.commit()
-
     if user.notification_preferences.get("reset", True):
         subject, recipient, html = build_reset_email(user.email, reset_token)
-        await send_email(subject, recipient, "Restablecer contraseña", html)
+        enqueue_email(db, subject, recipient, "Restablecer contraseña", html)
+
+    await db.commit()
 
-    await _log(db, user.id, "REQUEST_RESET", "user", None, ip_address=request.client.host if request.client else None)
+    await audit_sink.log(user.id, "REQUEST_RESET", "user", None, ip_address=request.client.host if request.client else None)
     return {"detail": "Si el correo existe, se enviará un enlace"}
 
 
@@ -360,9 +360,10 @@ async def confirm_password_reset(request: Request, payload: schemas.PasswordRese
     user.password_changed_at = datetime.now()
     user.password_reset_token = None
     user.password_reset_expires = None
+    # Cambio de credenciales: la entrada se confirma con el cambio
+    add_audit_entry(db, user.id, "RESET", "user", None, ip_address=request.client.host if request.client else None)
 
     await db.commit()
-    await _log(db, user.id, "RESET", "user", None, ip_address=request.client.host if request.client else None)
     return {"detail": "Contraseña actualizada"}
 
 
@@ -385,9 +386,9 @@ async def change_password(
     current_user.password_hash = hash_password(payload.new_password)
     current_user.password_reset_required = False
     current_user.password_changed_at = datetime.now()
+    add_audit_entry(db, current_user.id, "CHANGE_PASSWORD", "user", None, ip_address=request.client.host if request.client else None)
 
     await db.commit()
-    await _log(db, current_user.id, "CHANGE_PASSWORD", "user", None, ip_address=request.client.host if request.client else None)
 
     return {"detail": "Contraseña cambiada exitosamente"}
 
@@ -14,14 +14,14 @@ router = APIRouter(prefix="/api/barcodes", tags=["barcodes"])
 async def my_barcode(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """
     Retorna el código de barras del usuario actual como imagen PNG.
-    El código de barras es Code128 y contiene el employee_id del usuario.
+    El código de barras es Code128 y contiene el código firmado del usuario
+    (o el employee_id en códigos anteriores a la firma).
     """
     result = await db.execute(select(QRCode).where(QRCode.user_id == current_user.id))
     barcode_record = result.scalar_one_or_none()
     if not barcode_record or not barcode_record.is_active:
         raise HTTPException(status_code=404, detail="Código no encontrado")
 
-    # Generar el código de barras usando el employee_id del usuario
-    png = generate_barcode_png(current_user.employee_id)
+    png = generate_barcode_png(barcode_record.code_data)
     return Response(content=png, media_type="image/png")
 
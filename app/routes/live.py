@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import get_db
+from ..dependencies import user_from_token
+from ..models import User
+from ..utils.live_events import OVERFLOW, subscribe, unsubscribe
+
+settings = get_settings()
+
+MANAGER_ROLES = ["Admin", "HR Manager", "Supervisor"]
+
+router = APIRouter(prefix="/api/live", tags=["live"])
+
+
+async def stream_manager(token: str = Query(...), db: AsyncSession = Depends(get_db)) -> User:
+    # EventSource no permite cabeceras: el access token llega por query string
+    user = await user_from_token(token, db)
+    if not user.role or user.role.name not in MANAGER_ROLES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Insufficient permissions")
+    return user
+
+
+@router.get("/attendance")
+async def attendance_stream(
+    request: Request,
+    department_id: str | None = None,
+    current_user: User = Depends(stream_manager),
+):
+    """
+    Feed en vivo (Server-Sent Events) de entradas y salidas.
+
+    El filtro por departamento se aplica en el servidor. Cada suscriptor tiene
+    un buffer acotado; si se llena se envía ``overflow`` y se cierra el stream
+    para que el cliente reconecte y recargue el estado.
+    """
+    subscriber = subscribe(department_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), timeout=settings.live_feed_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is OVERFLOW:
+                    yield "event: overflow\ndata: {}\n\n"
+                    break
+                yield f"event: attendance\ndata: {json.dumps(event)}\n\n"
+        finally:
+            unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,16 +1,32 @@
-from datetime import datetime
-from typing import Any
+import os
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
-from sqlalchemy import case, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import FileResponse, ORJSONResponse
+from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import schemas
+from ..config import get_settings
 from ..dependencies import require_role
-from ..models import AttendanceRecord, Department, User
-from ..utils.reporting import attendance_to_csv, attendance_to_pdf
+from ..models import AttendancePresence, Department, ReportJob, ReportSchedule, User, utc_now
+from ..utils.aggregates import DIMENSIONS, aggregate, arrival_histogram
+from ..utils.archive import ArchivedRange, ensure_not_archived
+from ..utils.change_feed import InvalidCursor, changes_since
+from ..utils.columnar import COLUMNAR_FORMATS, columnar_available
+from ..utils.payroll import payroll_report
+from ..utils.report_cache import report_cache
+from ..utils.report_jobs import FORMATS, submit_job
+from ..utils.report_schedules import next_run_at
+from ..utils.reporting import payroll_to_csv
+from ..utils.rollups import summarize
+from ..utils.shift_calendar import absences_query
 from ..database import get_db
 
+settings = get_settings()
+
 manager_only = require_role(["Admin", "HR Manager", "Supervisor"])
 
 router = APIRouter(prefix="/api/reports", tags=["reports"], dependencies=[Depends(manager_only)])
@@ -20,49 +36,313 @@ router = APIRouter(prefix="/api/reports", tags=["reports"], dependencies=[Depend
 async def summary(
     start: datetime = Query(...),
     end: datetime = Query(...),
+    department_id: uuid.UUID | None = None
+):
+    """Totales del rango: días completos desde los rollups diarios, bordes y hoy desde los registros."""
+    total, late = await report_cache.get("summary", summarize, start, end, department_id)
+    return schemas.AttendanceSummary(
+        total_check_ins=total, late_count=late, range_start=start, range_end=end
+    )
+
+
+async def _aggregate(db: AsyncSession, start: datetime, end: datetime, department_id, group_by: tuple[str, ...]):
+    return await aggregate(db, list(group_by), start, end, department_id)
+
+
+@router.get("/aggregate", response_model=schemas.AttendanceAggregate)
+async def aggregate_report(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    group_by: list[Literal[DIMENSIONS]] = Query(default=["day"]),
+    department_id: uuid.UUID | None = None
+):
+    """
+    Entradas, tardanzas y minutos trabajados en [start, end) agrupados por
+    cualquier combinación de day, week, department, shift, location y status.
+
+    La respuesta es columnar: ``columns`` tiene una lista por dimensión y por
+    métrica, todas del mismo largo. En meses archivados solo se puede agrupar
+    por day, week y department en días completos (409 si no).
+    """
+    group_by = list(dict.fromkeys(group_by))
+    try:
+        columns = await report_cache.get("aggregate", _aggregate, start, end, department_id, tuple(group_by))
+    except ArchivedRange as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return ORJSONResponse(
+        {
+            "group_by": group_by,
+            "range_start": start,
+            "range_end": end,
+            "row_count": len(columns["check_ins"]),
+            "columns": columns,
+        }
+    )
+
+
+@router.get("/arrivals", response_model=schemas.ArrivalHistogram)
+async def arrivals_histogram(
+    start: datetime = Query(...),
+    end: datetime = Query(...),
+    department_id: uuid.UUID | None = None
+):
+    """Histograma de llegadas por hora del día en [start, end)."""
+    histogram = await report_cache.get("arrivals", arrival_histogram, start, end, department_id)
+    return ORJSONResponse({"range_start": start, "range_end": end, **histogram})
+
+
+@router.get("/payroll", response_model=schemas.PayrollReport)
+async def payroll(
+    start: date = Query(...),
+    end: date = Query(...),
+    department_id: uuid.UUID | None = None,
+    missing_checkout: Literal["shift_end", "none"] = Query(
+        default="shift_end", description="Cómo acreditar registros sin salida: hasta el fin del turno o nada"
+    ),
+    format: Literal["json", "csv"] = "json",
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Horas trabajadas, extra, tardanzas, ausencias y salidas faltantes por
+    usuario para los turnos con fecha en [start, end].
+    """
+    if end < start:
+        raise HTTPException(status_code=400, detail="El fin del período es anterior al inicio")
+    if (end - start).days > settings.payroll_max_days:
+        raise HTTPException(status_code=400, detail=f"El período no puede superar {settings.payroll_max_days} días")
+    try:
+        entries = await payroll_report(db, start, end, department_id, credit_shift_end=missing_checkout == "shift_end")
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Cálculo de nómina no disponible. Las dependencias no están instaladas.")
+    except ArchivedRange as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if format == "csv":
+        return Response(
+            content=payroll_to_csv(entries),
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="payroll-{start:%Y%m%d}-{end:%Y%m%d}.csv"'},
+        )
+    return ORJSONResponse({"period_start": start, "period_end": end, "entries": entries})
+
+
+@router.get("/payroll/changes", response_model=schemas.AttendanceChanges)
+async def payroll_changes(
+    cursor: str | None = Query(default=None, description="Cursor de la respuesta anterior; vacío para la carga inicial"),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Registros de asistencia creados o modificados desde ``cursor``. Repetir con
+    el cursor devuelto mientras ``has_more`` sea verdadero y guardarlo para la
+    próxima corrida. Una fila puede llegar más de una vez: aplicar por ``id``.
+    """
+    try:
+        rows, next_cursor, has_more = await changes_since(db, cursor, limit)
+    except InvalidCursor as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return ORJSONResponse({"rows": rows, "cursor": next_cursor, "has_more": has_more})
+
+
+@router.get("/presence", response_model=schemas.PresenceSummary)
+async def presence(
     department_id: str | None = None,
+    include_people: bool = Query(default=False, description="Incluir el listado nominal (pase de lista)"),
     db: AsyncSession = Depends(get_db),
 ):
-    query = select(
-        func.count(AttendanceRecord.id),
-        func.count(case((AttendanceRecord.status == "late", 1))),
-    ).where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in <= end)
+    """Ocupación actual por departamento y ubicación, leída de la tabla de presencia."""
+    groups_query = (
+        select(
+            User.department_id,
+            Department.name,
+            AttendancePresence.location,
+            func.count(AttendancePresence.user_id),
+        )
+        .join(User, User.id == AttendancePresence.user_id)
+        .outerjoin(Department, Department.id == User.department_id)
+        .group_by(User.department_id, Department.name, AttendancePresence.location)
+        .order_by(Department.name, AttendancePresence.location)
+    )
     if department_id:
-        dept_users = select(User.id).where(User.department_id == department_id)
-        query = query.where(AttendanceRecord.user_id.in_(dept_users))
-    result = await db.execute(query)
-    total, late = result.one()
-    return schemas.AttendanceSummary(
-        total_check_ins=total or 0, late_count=late or 0, range_start=start, range_end=end
+        groups_query = groups_query.where(User.department_id == department_id)
+    groups = [
+        schemas.PresenceGroup(department_id=dept_id, department_name=dept_name, location=location, count=count)
+        for dept_id, dept_name, location, count in (await db.execute(groups_query)).all()
+    ]
+
+    people = None
+    if include_people:
+        people_query = (
+            select(
+                User.id.label("user_id"),
+                User.employee_id,
+                User.first_name,
+                User.last_name,
+                User.department_id,
+                AttendancePresence.location,
+                AttendancePresence.check_in,
+            )
+            .join(User, User.id == AttendancePresence.user_id)
+            .order_by(User.last_name, User.first_name)
+        )
+        if department_id:
+            people_query = people_query.where(User.department_id == department_id)
+        people = [schemas.PresenceEntry(**row) for row in (await db.execute(people_query)).mappings().all()]
+
+    return schemas.PresenceSummary(
+        total=sum(group.count for group in groups),
+        groups=groups,
+        people=people,
+        as_of=datetime.now(timezone.utc).replace(tzinfo=None),
     )
 
 
-@router.post("/export")
-async def export_report(payload: schemas.ReportExport, db: AsyncSession = Depends(get_db)):
-    records_query = (
-        select(
-            User.email.label("user_email"),
-            AttendanceRecord.check_in,
-            AttendanceRecord.check_out,
-            AttendanceRecord.status,
-            AttendanceRecord.location,
-            AttendanceRecord.notes,
+@router.get("/absences", response_model=list[schemas.AbsenceEntry])
+async def absences(
+    start: date = Query(...),
+    end: date = Query(...),
+    department_id: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Turnos esperados (calendario materializado) que terminaron sin ninguna entrada."""
+    # Los turnos de meses archivados no tienen registros en la tabla: todos se verían como ausencias
+    try:
+        await ensure_not_archived(
+            db,
+            datetime.combine(start, time.min) - timedelta(minutes=settings.shift_early_checkin_minutes),
+            datetime.combine(end, time.max) + timedelta(days=1),
+        )
+    except ArchivedRange as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    query = absences_query(start, end, datetime.now(timezone.utc).replace(tzinfo=None))
+    if department_id:
+        query = query.where(User.department_id == department_id)
+    return [
+        schemas.AbsenceEntry(
+            user_id=user.id,
+            employee_id=user.employee_id,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            department_id=user.department_id,
+            work_date=instance.work_date,
+            starts_at=instance.starts_at,
+            ends_at=instance.ends_at,
+        )
+        for instance, user in (await db.execute(query)).all()
+    ]
+
+
+def _job_out(job: ReportJob) -> schemas.ReportJobOut:
+    out = schemas.ReportJobOut.model_validate(job)
+    if job.status == "done":
+        out.progress = 1.0
+        out.download_url = f"{router.prefix}/export/{job.id}/download"
+    elif job.rows_total:
+        out.progress = round(min(job.rows_done / job.rows_total, 1.0), 4)
+    return out
+
+
+@router.post("/export", response_model=schemas.ReportJobOut, status_code=202)
+async def export_report(
+    payload: schemas.ReportExport,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(manager_only),
+):
+    """Encola la exportación (o reutiliza una idéntica en curso o vigente) y retorna el job."""
+    if payload.format in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(
+            status_code=503, detail="Exportación Parquet/Arrow no disponible. Las dependencias no están instaladas."
         )
-        .join(User, User.id == AttendanceRecord.user_id)
-        .where(AttendanceRecord.check_in >= payload.range_start, AttendanceRecord.check_in <= payload.range_end)
+    job = await submit_job(
+        db, payload.format, payload.range_start, payload.range_end, payload.department_id, current_user.id
     )
-    if payload.department_id:
-        records_query = records_query.where(User.department_id == payload.department_id)
+    return _job_out(job)
 
-    rows = (await db.execute(records_query)).mappings().all()
-    rows_as_dict: list[dict[str, Any]] = [dict(row) for row in rows]
 
-    if payload.format == "csv":
-        content = attendance_to_csv(rows_as_dict)
-        return Response(content=content, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=report.csv"})
-    if payload.format == "pdf":
-        content = attendance_to_pdf(rows_as_dict)
-        return Response(
-            content=content, media_type="application/pdf", headers={"Content-Disposition": 'attachment; filename="report.pdf"'}
+async def _get_job(db: AsyncSession, job_id: uuid.UUID) -> ReportJob:
+    job = await db.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return job
+
+
+@router.get("/export/{job_id}", response_model=schemas.ReportJobOut)
+async def export_status(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    return _job_out(await _get_job(db, job_id))
+
+
+@router.get("/export/{job_id}/download")
+async def export_download(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    """Descarga el resultado; FileResponse atiende ``Range`` para reanudar descargas grandes."""
+    job = await _get_job(db, job_id)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"La exportación está en estado {job.status}")
+    if job.expires_at and job.expires_at < utc_now():
+        raise HTTPException(status_code=410, detail="La exportación expiró")
+    if not job.file_path or not os.path.exists(job.file_path):
+        raise HTTPException(status_code=410, detail="El archivo de la exportación ya no existe")
+    media_type, extension = FORMATS[job.format]
+    filename = f"report-{job.range_start:%Y%m%d}-{job.range_end:%Y%m%d}.{extension}"
+    return FileResponse(job.file_path, media_type=media_type, filename=filename)
+
+
+def _check_schedule(schedule: ReportSchedule) -> None:
+    if schedule.frequency == "weekly" and schedule.weekday is None:
+        raise HTTPException(status_code=422, detail="Las programaciones semanales requieren weekday")
+    if schedule.frequency == "monthly" and schedule.day_of_month is None:
+        raise HTTPException(status_code=422, detail="Las programaciones mensuales requieren day_of_month")
+    if schedule.format in COLUMNAR_FORMATS and not columnar_available():
+        raise HTTPException(
+            status_code=503, detail="Exportación Parquet/Arrow no disponible. Las dependencias no están instaladas."
         )
-    raise HTTPException(status_code=400, detail="Formato no soportado")
+
+
+@router.get("/schedules", response_model=list[schemas.ReportScheduleOut])
+async def list_schedules(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(ReportSchedule).order_by(ReportSchedule.name))
+    return result.scalars().all()
+
+
+@router.post("/schedules", response_model=schemas.ReportScheduleOut, status_code=status.HTTP_201_CREATED)
+async def create_schedule(
+    payload: schemas.ReportScheduleCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(manager_only),
+):
+    """Programa una exportación recurrente; se genera en la ventana fuera de horas pico."""
+    schedule = ReportSchedule(**payload.model_dump(), created_by=current_user.id)
+    _check_schedule(schedule)
+    schedule.next_run_at = next_run_at(schedule.frequency, schedule.weekday, schedule.day_of_month, utc_now())
+    db.add(schedule)
+    await db.commit()
+    await db.refresh(schedule)
+    return schedule
+
+
+async def _get_schedule(db: AsyncSession, schedule_id: uuid.UUID) -> ReportSchedule:
+    schedule = await db.get(ReportSchedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Programación no encontrada")
+    return schedule
+
+
+@router.patch("/schedules/{schedule_id}", response_model=schemas.ReportScheduleOut)
+async def update_schedule(
+    schedule_id: uuid.UUID, payload: schemas.ReportScheduleUpdate, db: AsyncSession = Depends(get_db)
+):
+    schedule = await _get_schedule(db, schedule_id)
+    changes = payload.model_dump(exclude_unset=True)
+    for field, value in changes.items():
+        setattr(schedule, field, value)
+    _check_schedule(schedule)
+    if changes.keys() & {"frequency", "weekday", "day_of_month", "is_active"}:
+        schedule.next_run_at = next_run_at(schedule.frequency, schedule.weekday, schedule.day_of_month, utc_now())
+    await db.commit()
+    await db.refresh(schedule)
+    return schedule
+
+
+@router.delete("/schedules/{schedule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_schedule(schedule_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    await db.execute(delete(ReportSchedule).where(ReportSchedule.id == schedule_id))
+    await db.commit()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -8,9 +8,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import schemas
 from ..dependencies import get_current_user
-from ..models import AttendanceRecord, User
+from ..models import AttendanceRecord, QRCode, User
 from ..utils.security import hash_password, verify_password
-from ..utils.email import build_welcome_email, send_email
+from ..utils.email import build_welcome_email
+from ..utils.outbox import enqueue_email
 from ..utils import barcode
 from ..database import get_db
 
@@ -55,6 +56,10 @@ async def resend_barcode(
             detail="Las notificaciones por email están deshabilitadas"
         )
 
+    barcode_record = await db.scalar(select(QRCode).where(QRCode.user_id == current_user.id))
+    if not barcode_record or not barcode_record.is_active:
+        raise HTTPException(status_code=404, detail="Código no encontrado")
+
     # Construir email
     subject, recipient, html = build_welcome_email(
         current_user.email,
@@ -63,16 +68,18 @@ async def resend_barcode(
     )
 
     # Generar barcode PNG
-    barcode_png = barcode.generate_barcode_png(current_user.employee_id)
+    barcode_png = barcode.generate_barcode_png(barcode_record.code_data)
 
-    # Enviar email
-    await send_email(
+    # Encolar email
+    enqueue_email(
+        db,
         subject,
         recipient,
         f"Tu código de barras - {current_user.employee_id}",
         html,
         attachments=[(f"barcode_{current_user.employee_id}.png", barcode_png, "image/png")]
     )
+    await db.commit()
 
     return {"detail": "Código de barras enviado a tu email"}
 
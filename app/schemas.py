@@ -1,5 +1,5 @@
 import uuid
-from datetime import datetime, time
+from datetime import date, datetime, time
 from typing import Any, Literal, Optional
 import re
 
@@ -88,8 +88,16 @@ class UserBase(BaseModel):
     department_id: uuid.UUID | None = None
     shift_id: uuid.UUID | None = None
     is_active: bool = True
-    notification_preferences: dict[str, bool] = Field(
-        default_factory=lambda: {"registration": True, "reset": True, "attendance": True}
+    # attendance_mode: "instant" (un email por escaneo) o "daily" (resumen diario)
+    # late_digest: resumen diario de llegadas tarde del departamento (managers)
+    notification_preferences: dict[str, bool | Literal["instant", "daily"]] = Field(
+        default_factory=lambda: {
+            "registration": True,
+            "reset": True,
+            "attendance": True,
+            "attendance_mode": "instant",
+            "late_digest": False,
+        }
     )
 
 
@@ -122,7 +130,7 @@ class UserUpdate(BaseModel):
     department_id: uuid.UUID | None = None
     shift_id: uuid.UUID | None = None
     is_active: bool | None = None
-    notification_preferences: dict[str, bool] | None = None
+    notification_preferences: dict[str, bool | Literal["instant", "daily"]] | None = None
 
 
 class UserOut(UserBase):
@@ -214,6 +222,9 @@ class AttendanceCreate(BaseModel):
     location: str | None = None
     notes: str | None = None
     action: Literal["check_in", "check_out"] = "check_in"
+    # Kiosco: el mismo client_id se reusa si el escaneo termina en la cola offline
+    client_id: uuid.UUID | None = None
+    device_id: str | None = Field(default=None, max_length=100)
 
 
 class AttendanceOut(BaseModel):
@@ -230,6 +241,30 @@ class AttendanceOut(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class OfflineScan(BaseModel):
+    client_id: uuid.UUID  # Generado por el kiosco; deduplica reintentos
+    code_data: str
+    captured_at: datetime
+    location: str | None = None
+    notes: str | None = None
+
+
+class ScanSyncRequest(BaseModel):
+    device_id: str = Field(max_length=100)
+    scans: list[OfflineScan] = Field(max_length=1000)
+
+
+class ScanSyncResult(BaseModel):
+    client_id: uuid.UUID
+    outcome: Literal["check_in", "check_out", "duplicate", "invalid_code", "inactive_user", "rejected"]
+    record_id: uuid.UUID | None = None
+    detail: str | None = None
+
+
+class ScanSyncResponse(BaseModel):
+    results: list[ScanSyncResult]
+
+
 class AttendanceSummary(BaseModel):
     total_check_ins: int
     late_count: int
@@ -237,13 +272,175 @@ class AttendanceSummary(BaseModel):
     range_end: datetime
 
 
+class AttendanceAggregate(BaseModel):
+    """Agregado en formato columnar: una lista por dimensión y por métrica, alineadas por índice."""
+
+    group_by: list[str]
+    range_start: datetime
+    range_end: datetime
+    row_count: int
+    columns: dict[str, list[Any]]
+
+
+class ArrivalHistogram(BaseModel):
+    range_start: datetime
+    range_end: datetime
+    hour: list[int]
+    check_ins: list[int]
+    late: list[int]
+
+
+class PresenceGroup(BaseModel):
+    department_id: uuid.UUID | None
+    department_name: str | None
+    location: str | None
+    count: int
+
+
+class PresenceEntry(BaseModel):
+    user_id: uuid.UUID
+    employee_id: str
+    first_name: str
+    last_name: str
+    department_id: uuid.UUID | None
+    location: str | None
+    check_in: datetime
+
+
+class PresenceSummary(BaseModel):
+    total: int
+    groups: list[PresenceGroup]
+    people: list[PresenceEntry] | None = None
+    as_of: datetime
+
+
+class AbsenceEntry(BaseModel):
+    user_id: uuid.UUID
+    employee_id: str
+    first_name: str
+    last_name: str
+    department_id: uuid.UUID | None
+    work_date: date
+    starts_at: datetime
+    ends_at: datetime
+
+
+class PayrollEntry(BaseModel):
+    user_id: uuid.UUID
+    employee_id: str | None
+    name: str | None
+    department_id: uuid.UUID | None
+    days_worked: int
+    records: int
+    worked_minutes: int
+    scheduled_minutes: int
+    overtime_minutes: int
+    late_minutes: int
+    late_count: int
+    absences: int
+    missing_checkouts: int
+
+
+class PayrollReport(BaseModel):
+    period_start: date
+    period_end: date
+    entries: list[PayrollEntry]
+
+
+class AttendanceChange(BaseModel):
+    id: uuid.UUID
+    user_id: uuid.UUID
+    employee_id: str
+    check_in: datetime
+    check_out: datetime | None
+    status: str
+    location: str | None
+    shift_id: uuid.UUID | None
+    updated_at: datetime
+    change_xid: int
+
+
+class AttendanceChanges(BaseModel):
+    rows: list[AttendanceChange]
+    cursor: str
+    has_more: bool
+
+
 class ReportExport(BaseModel):
-    format: Literal["csv", "pdf"] = "csv"
+    format: Literal["csv", "pdf", "parquet", "arrow"] = "csv"
     range_start: datetime
     range_end: datetime
     department_id: uuid.UUID | None = None
 
 
+class ReportJobOut(BaseModel):
+    id: uuid.UUID
+    status: str
+    format: str
+    range_start: datetime
+    range_end: datetime
+    department_id: uuid.UUID | None
+    rows_total: int | None
+    rows_done: int
+    progress: float | None = None
+    size_bytes: int | None
+    error: str | None
+    created_at: datetime
+    finished_at: datetime | None
+    expires_at: datetime | None
+    download_url: str | None = None
+
+    model_config = {"from_attributes": True}
+
+
+RangeTemplate = Literal["previous_day", "previous_week", "previous_month", "last_7_days", "last_30_days"]
+
+
+class ReportScheduleCreate(BaseModel):
+    name: str = Field(max_length=100)
+    format: Literal["csv", "pdf", "parquet", "arrow"] = "csv"
+    range_template: RangeTemplate = "previous_week"
+    department_id: uuid.UUID | None = None
+    frequency: Literal["daily", "weekly", "monthly"] = "weekly"
+    weekday: int | None = Field(default=None, ge=0, le=6)  # 0=domingo, para frequency=weekly
+    day_of_month: int | None = Field(default=None, ge=1, le=28)  # para frequency=monthly
+    recipients: list[EmailStr] = Field(default_factory=list, max_length=50)
+    is_active: bool = True
+
+
+class ReportScheduleUpdate(BaseModel):
+    name: str | None = Field(default=None, max_length=100)
+    format: Literal["csv", "pdf", "parquet", "arrow"] | None = None
+    range_template: RangeTemplate | None = None
+    department_id: uuid.UUID | None = None
+    frequency: Literal["daily", "weekly", "monthly"] | None = None
+    weekday: int | None = Field(default=None, ge=0, le=6)
+    day_of_month: int | None = Field(default=None, ge=1, le=28)
+    recipients: list[EmailStr] | None = Field(default=None, max_length=50)
+    is_active: bool | None = None
+
+
+class ReportScheduleOut(BaseModel):
+    id: uuid.UUID
+    name: str
+    format: str
+    range_template: str
+    department_id: uuid.UUID | None
+    frequency: str
+    weekday: int | None
+    day_of_month: int | None
+    recipients: list[str]
+    is_active: bool
+    next_run_at: datetime
+    last_run_at: datetime | None
+    pending_job_id: uuid.UUID | None
+    last_job_id: uuid.UUID | None
+    last_error: str | None
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
 class BiometricEnrollment(BaseModel):
     user_id: uuid.UUID
     biometric_type: str
@@ -0,0 +1,152 @@
+import uuid
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import DateTime, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import AttendanceDailyDepartment, AttendanceRecord, User
+from .archive import archived_rows, archives_for_range, department_user_ids, ensure_not_archived
+from .rollups import NO_DEPARTMENT, rolled_through
+
+
+settings = get_settings()
+
+
+DIMENSIONS = ("day", "week", "department", "shift", "location", "status")
+# Dimensiones disponibles en attendance_daily_department
+_ROLLUP_DIMENSIONS = {"day", "week", "department"}
+
+_COLUMN_NAMES = {
+    "day": "day",
+    "week": "week",
+    "department": "department_id",
+    "shift": "shift_id",
+    "location": "location",
+    "status": "status",
+}
+
+
+def _raw_dimension(name: str):
+    return {
+        "day": func.date_trunc("day", AttendanceRecord.check_in),
+        "week": func.date_trunc("week", AttendanceRecord.check_in),
+        "department": User.department_id,
+        "shift": AttendanceRecord.shift_id,
+        "location": AttendanceRecord.location,
+        "status": AttendanceRecord.status,
+    }[name]
+
+
+def _rollup_dimension(name: str):
+    rollup = AttendanceDailyDepartment
+    return {
+        "day": cast(rollup.day, DateTime),
+        "week": func.date_trunc("week", cast(rollup.day, DateTime)),
+        "department": func.nullif(rollup.department_id, NO_DEPARTMENT),
+    }[name]
+
+
+def _raw_query(group_by: list[str], start: datetime, end: datetime, department_id: uuid.UUID | None):
+    dimensions = [_raw_dimension(name).label(_COLUMN_NAMES[name]) for name in group_by]
+    minutes = func.extract("epoch", AttendanceRecord.check_out - AttendanceRecord.check_in) / 60
+    query = (
+        select(
+            *dimensions,
+            func.count().label("check_ins"),
+            func.count().filter(AttendanceRecord.status == "late").label("late"),
+            func.coalesce(func.round(func.sum(minutes)), 0).label("minutes_worked"),
+        )
+        .select_from(AttendanceRecord)
+        .where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end)
+    )
+    if "department" in group_by or department_id:
+        query = query.join(User, User.id == AttendanceRecord.user_id)
+    if department_id:
+        query = query.where(User.department_id == department_id)
+    return query.group_by(*dimensions).order_by(*dimensions)
+
+
+def _rollup_query(group_by: list[str], start: datetime, end: datetime, department_id: uuid.UUID | None):
+    rollup = AttendanceDailyDepartment
+    dimensions = [_rollup_dimension(name).label(_COLUMN_NAMES[name]) for name in group_by]
+    query = select(
+        *dimensions,
+        func.sum(rollup.check_ins).label("check_ins"),
+        func.sum(rollup.late_count).label("late"),
+        func.sum(rollup.minutes_worked).label("minutes_worked"),
+    ).where(rollup.day >= start.date(), rollup.day < end.date())
+    if department_id:
+        query = query.where(rollup.department_id == department_id)
+    return query.group_by(*dimensions).order_by(*dimensions)
+
+
+def _is_midnight(value: datetime) -> bool:
+    return value.time() == time.min
+
+
+async def aggregate(
+    db: AsyncSession,
+    group_by: list[str],
+    start: datetime,
+    end: datetime,
+    department_id: uuid.UUID | None = None,
+) -> dict[str, list]:
+    """
+    Agrega asistencia en [start, end) con un solo GROUP BY y retorna columnas.
+
+    Si las dimensiones y el rango (días completos ya consolidados) lo permiten,
+    se lee del rollup por departamento en vez de ``attendance_records``.
+    """
+    through = await rolled_through(db)
+    use_rollup = (
+        set(group_by) <= _ROLLUP_DIMENSIONS
+        and _is_midnight(start)
+        and _is_midnight(end)
+        and through is not None
+        and end.date() <= through + timedelta(days=1)
+    )
+    if not use_rollup:
+        # Los meses archivados solo conservan sus rollups diarios
+        await ensure_not_archived(db, start, end - timedelta(microseconds=1))
+    query = (_rollup_query if use_rollup else _raw_query)(group_by, start, end, department_id)
+    result = await db.execute(query)
+    names = list(result.keys())
+    columns: dict[str, list] = {name: [] for name in names}
+    for row in result.all():
+        for name, value in zip(names, row):
+            columns[name].append(value)
+    for name in ("check_ins", "late", "minutes_worked"):
+        columns[name] = [int(value or 0) for value in columns[name]]
+    return columns
+
+
+async def arrival_histogram(
+    db: AsyncSession, start: datetime, end: datetime, department_id: uuid.UUID | None = None
+) -> dict[str, list[int]]:
+    """Entradas por hora del día (0-23) en [start, end), con un solo GROUP BY más los meses archivados."""
+    hour = func.extract("hour", AttendanceRecord.check_in).label("hour")
+    query = (
+        select(hour, func.count(), func.count().filter(AttendanceRecord.status == "late"))
+        .select_from(AttendanceRecord)
+        .where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end)
+        .group_by(hour)
+    )
+    if department_id:
+        query = query.join(User, User.id == AttendanceRecord.user_id).where(User.department_id == department_id)
+    counts = [0] * 24
+    late = [0] * 24
+    for value, total, late_total in (await db.execute(query)).all():
+        counts[int(value)] = total
+        late[int(value)] = late_total
+
+    # Meses archivados: se leen de sus archivos, como las exportaciones
+    archives = await archives_for_range(db, start, end)
+    if archives:
+        users = await department_user_ids(db, department_id) if department_id else None
+        async for batch in archived_rows(archives, start, end, settings.report_stream_chunk_size):
+            for row in batch:
+                if row["check_in"] < end and (users is None or row["user_id"] in users):
+                    counts[row["check_in"].hour] += 1
+                    late[row["check_in"].hour] += row["status"] == "late"
+    return {"hour": list(range(24)), "check_ins": counts, "late": late}
@@ -0,0 +1,380 @@
+"""
+Archivo frío de asistencia.
+
+Los meses cerrados hace más de ``ATTENDANCE_ARCHIVE_AFTER_MONTHS`` se escriben
+a un archivo comprimido (CSV con gzip o Parquet) en ``ATTENDANCE_ARCHIVE_DIR``,
+se registran en ``attendance_archives`` y su partición se separa y se borra.
+Las exportaciones, el resumen y el histograma de llegadas leen estos archivos
+cuando el rango pedido los incluye (ver ``report_rows.stream_row_batches``);
+los reportes que cruzan registros con turnos responden ``ArchivedRange``.
+"""
+import asyncio
+import csv
+import gzip
+import hashlib
+import logging
+import os
+import uuid
+from datetime import date, datetime, time
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import AttendanceArchive, AttendancePresence, AttendanceRecord, User, default_uuid, utc_now
+from .partitions import add_months, detach_partition
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ARCHIVE_FORMATS = ("csv.gz", "parquet")
+ARCHIVE_COLUMNS = [
+    "id",
+    "user_id",
+    "check_in",
+    "check_out",
+    "status",
+    "location",
+    "notes",
+    "shift_id",
+    "created_at",
+    "updated_at",
+    "change_xid",
+]
+_UUIDS = ("id", "user_id", "shift_id")
+_DATETIMES = ("check_in", "check_out", "created_at", "updated_at")
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+_last_run_day: date | None = None
+
+
+class ArchivedRange(ValueError):
+    """El rango pedido incluye meses que ya solo están en el archivo frío"""
+    pass
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet  # noqa: F401
+        return pa
+    except ImportError as e:
+        logger.error(f"Failed to import pyarrow: {e}")
+        raise ImportError("Parquet archive dependencies not installed. Run: pip install pyarrow")
+
+
+def archive_dir() -> Path:
+    return Path(settings.attendance_archive_dir)
+
+
+def _month_bounds(month: date) -> tuple[datetime, datetime]:
+    return datetime.combine(month, time.min), datetime.combine(add_months(month, 1), time.min)
+
+
+class _CsvArchiveWriter:
+    def __init__(self, path: Path):
+        self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(ARCHIVE_COLUMNS)
+
+    def write(self, rows: list[dict]) -> None:
+        # None se escribe como celda vacía y se lee de vuelta como None
+        self._writer.writerows(
+            [
+                [
+                    "" if row[name] is None else row[name].isoformat() if isinstance(row[name], datetime) else row[name]
+                    for name in ARCHIVE_COLUMNS
+                ]
+                for row in rows
+            ]
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetArchiveWriter:
+    def __init__(self, path: Path):
+        pa = self._pa = _import_pyarrow()
+        self.schema = pa.schema(
+            [
+                pa.field(name, pa.int64() if name == "change_xid" else pa.timestamp("us") if name in _DATETIMES else pa.string())
+                for name in ARCHIVE_COLUMNS
+            ]
+        )
+        self._writer = pa.parquet.ParquetWriter(str(path), self.schema, compression="zstd")
+
+    def write(self, rows: list[dict]) -> None:
+        columns = {
+            name: [str(row[name]) if name in _UUIDS and row[name] is not None else row[name] for row in rows]
+            for name in ARCHIVE_COLUMNS
+        }
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+def _typed(row: dict) -> dict:
+    for name in _UUIDS:
+        if row[name] is not None:
+            row[name] = uuid.UUID(row[name])
+    return row
+
+
+def _read_csv(path: Path, chunk_size: int) -> Iterator[list[dict]]:
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as source:
+        batch = []
+        for raw in csv.DictReader(source):
+            row = {name: value if value != "" else None for name, value in raw.items()}
+            for name in _DATETIMES:
+                if row[name] is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            row["change_xid"] = int(row["change_xid"])
+            batch.append(_typed(row))
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def _read_parquet(path: Path, chunk_size: int) -> Iterator[list[dict]]:
+    pa = _import_pyarrow()
+    for record_batch in pa.parquet.ParquetFile(str(path)).iter_batches(batch_size=chunk_size):
+        yield [_typed(row) for row in record_batch.to_pylist()]
+
+
+async def _in_thread(batches: Iterator[list[dict]]) -> AsyncIterator[list[dict]]:
+    """Lee cada lote en un hilo: descomprimir y parsear no bloquea el event loop."""
+    done = object()
+    try:
+        while True:
+            batch = await asyncio.to_thread(next, batches, done)
+            if batch is done:
+                return
+            yield batch
+    finally:
+        batches.close()
+
+
+async def archives_for_range(db: AsyncSession, range_start: datetime, range_end: datetime) -> list[AttendanceArchive]:
+    """Archivos de los meses que tocan [range_start, range_end], en orden cronológico."""
+    return (
+        await db.scalars(
+            select(AttendanceArchive)
+            .where(
+                AttendanceArchive.month >= range_start.date().replace(day=1),
+                AttendanceArchive.month <= range_end.date(),
+            )
+            .order_by(AttendanceArchive.month, AttendanceArchive.archived_at)
+        )
+    ).all()
+
+
+async def ensure_not_archived(db: AsyncSession, range_start: datetime, range_end: datetime) -> None:
+    """Lanza ``ArchivedRange`` si [range_start, range_end] toca meses archivados."""
+    archives = await archives_for_range(db, range_start, range_end)
+    if archives:
+        months = ", ".join(sorted({f"{archive.month:%Y-%m}" for archive in archives}))
+        raise ArchivedRange(f"El rango incluye meses archivados ({months}); use la exportación para consultarlos")
+
+
+async def archived_months(db: AsyncSession, first_day: date, last_day: date) -> set[date]:
+    """Meses (primer día) con archivo en el manifiesto que tocan [first_day, last_day]."""
+    return set(
+        (
+            await db.scalars(
+                select(AttendanceArchive.month)
+                .where(AttendanceArchive.month >= first_day.replace(day=1), AttendanceArchive.month <= last_day)
+                .distinct()
+            )
+        ).all()
+    )
+
+
+async def archived_rows(
+    archives: list[AttendanceArchive], range_start: datetime, range_end: datetime, chunk_size: int
+) -> AsyncIterator[list[dict]]:
+    """Registros archivados con ``check_in`` en [range_start, range_end], con las columnas de la tabla."""
+    for archive in archives:
+        reader = _read_parquet if archive.format == "parquet" else _read_csv
+        async for batch in _in_thread(reader(Path(archive.file_path), chunk_size)):
+            rows = [row for row in batch if range_start <= row["check_in"] <= range_end]
+            if rows:
+                yield rows
+
+
+async def department_user_ids(db: AsyncSession, department_id: uuid.UUID) -> set[uuid.UUID]:
+    """Usuarios del departamento, para filtrar filas archivadas (no tienen join con ``users``)."""
+    return set((await db.scalars(select(User.id).where(User.department_id == department_id))).all())
+
+
+async def _write_month(month: date, path: Path, format: str) -> tuple[int, int | None, datetime | None, datetime | None]:
+    """Escribe los registros del mes; retorna (filas, change_xid máximo, primera y última entrada)."""
+    start, end = _month_bounds(month)
+    table = AttendanceRecord.__table__
+    chunk_size = settings.report_stream_chunk_size
+    writer = await asyncio.to_thread(_ParquetArchiveWriter if format == "parquet" else _CsvArchiveWriter, path)
+    count, max_xid, first, last = 0, None, None, None
+    try:
+        async with SessionLocal() as session:
+            result = await session.stream(
+                select(*[table.c[name] for name in ARCHIVE_COLUMNS])
+                .where(table.c.check_in >= start, table.c.check_in < end)
+                .order_by(table.c.check_in)
+                .execution_options(yield_per=chunk_size)
+            )
+            async for partition in result.mappings().partitions(chunk_size):
+                rows = [dict(row) for row in partition]
+                await asyncio.to_thread(writer.write, rows)
+                count += len(rows)
+                max_xid = max(max_xid or 0, max(row["change_xid"] for row in rows))
+                first = first or rows[0]["check_in"]
+                last = rows[-1]["check_in"]
+    finally:
+        await asyncio.to_thread(writer.close)
+    return count, max_xid, first, last
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+async def archive_month(month: date) -> AttendanceArchive | None:
+    """
+    Archiva un mes: escribe el archivo, y en una transacción separa y borra su
+    partición, borra las filas del mes que quedaron en la partición default
+    (y la presencia de los check-ins que seguían abiertos) y registra el
+    archivo en el manifiesto. Si los registros cambiaron mientras
+    se escribía el archivo, no borra nada y retorna None (se reintenta en la
+    próxima corrida).
+    """
+    format = settings.attendance_archive_format
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    archive_id = default_uuid()
+    final = directory / f"attendance-{month:%Y-%m}-{archive_id.hex[:8]}.{format}"
+    partial = final.with_name(final.name + ".part")
+    start, end = _month_bounds(month)
+    committed = False
+    try:
+        count, max_xid, first, last = await _write_month(month, partial, format)
+        if not count:
+            return None
+        sha256 = await asyncio.to_thread(_sha256, partial)
+        os.replace(partial, final)
+
+        async with SessionLocal() as session:
+            # DETACH toma un lock exclusivo sobre attendance_records: no esperar detrás de reportes largos
+            await session.execute(text("SET LOCAL lock_timeout = '5s'"))
+            await session.execute(text("SELECT pg_advisory_xact_lock(hashtext('attendance_partitions'))"))
+            detached = await detach_partition(session, month)
+            # Filas que siguen en la tabla (partición default) más las de la partición separada
+            remaining = await session.execute(
+                select(func.count(), func.max(AttendanceRecord.change_xid)).where(
+                    AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end
+                )
+            )
+            counts = [tuple(remaining.one())]
+            if detached:
+                moved = await session.execute(text(f'SELECT count(*), max(change_xid) FROM "{detached}"'))
+                counts.append(tuple(moved.one()))
+            current_xids = [xid for _, xid in counts if xid is not None]
+            if sum(rows for rows, _ in counts) != count or max(current_xids, default=None) != max_xid:
+                logger.warning(f"Attendance for {month:%Y-%m} changed while archiving, retrying later")
+                await session.rollback()
+                return None
+            # Check-ins que siguen abiertos: su fila de presencia apuntaría a un registro
+            # borrado y el próximo escaneo del usuario no encontraría nada que cerrar.
+            # Se quitan en la misma transacción; el siguiente escaneo abre una entrada nueva.
+            stale = await session.execute(
+                delete(AttendancePresence).where(
+                    AttendancePresence.check_in >= start, AttendancePresence.check_in < end
+                )
+            )
+            if stale.rowcount:
+                logger.warning(f"Dropped {stale.rowcount} open check-ins from {month:%Y-%m} while archiving")
+            if detached:
+                await session.execute(text(f'DROP TABLE "{detached}"'))
+            await session.execute(
+                delete(AttendanceRecord).where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end)
+            )
+            archive = AttendanceArchive(
+                id=archive_id,
+                month=month,
+                file_path=str(final),
+                format=format,
+                row_count=count,
+                size_bytes=final.stat().st_size,
+                sha256=sha256,
+                first_check_in=first,
+                last_check_in=last,
+            )
+            session.add(archive)
+            await session.commit()
+            committed = True
+    finally:
+        partial.unlink(missing_ok=True)
+        if not committed:
+            final.unlink(missing_ok=True)
+    logger.info(f"Archived {count} attendance records for {month:%Y-%m} to {final}")
+    return archive
+
+
+async def archive_due() -> int:
+    """Archiva, del más antiguo al más nuevo, los meses anteriores al corte. Retorna cuántos archivó."""
+    cutoff = datetime.combine(
+        add_months(utc_now().date().replace(day=1), -settings.attendance_archive_after_months), time.min
+    )
+    archived = 0
+    while not _stop.is_set():
+        async with SessionLocal() as session:
+            oldest = await session.scalar(
+                select(func.min(AttendanceRecord.check_in)).where(AttendanceRecord.check_in < cutoff)
+            )
+        if oldest is None or await archive_month(oldest.date().replace(day=1)) is None:
+            break
+        archived += 1
+    return archived
+
+
+async def _job() -> None:
+    global _last_run_day
+    while not _stop.is_set():
+        now = utc_now()
+        if (
+            settings.attendance_archive_after_months > 0
+            and now.hour >= settings.attendance_archive_hour
+            and _last_run_day != now.date()
+        ):
+            try:
+                await archive_due()
+                _last_run_day = now.date()
+            except Exception:
+                logger.exception("Attendance archival failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=600)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_archive_job() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_job())
+
+
+async def stop_archive_job() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
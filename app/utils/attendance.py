@@ -0,0 +1,274 @@
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import bindparam, cast, delete, exists, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.types import DateTime, String, Text
+
+from ..models import AttendancePresence, AttendanceRecord, User, default_uuid, utc_now
+from .digests import attendance_mode
+from .email import build_attendance_alert
+from .outbox import enqueue_email
+from .shift_calendar import computed_status, pick_window, status_expression, status_for_window, windows_for_users
+
+
+def status_for_check_in(user: User, check_in: datetime) -> str:
+    # User must have eagerly loaded shift relationship
+    # Respaldo para cuando el calendario de turnos aún no cubre el día
+    return computed_status(user.shift, check_in)
+
+
+def toggle_statement(
+    user_id: uuid.UUID,
+    shift_id: uuid.UUID | None,
+    now: datetime,
+    status: str,
+    location: str | None,
+    notes: str | None,
+):
+    """
+    Construye el toggle de entrada/salida como una sola sentencia.
+
+    La tabla de presencia decide la acción por clave primaria: si el usuario
+    está dentro se borra su fila y se cierra el registro abierto; si no, se
+    reclama la fila de presencia y se inserta la entrada. La clave primaria de
+    presencia serializa escaneos concurrentes del mismo usuario.
+    """
+    table = AttendanceRecord.__table__
+    presence = AttendancePresence.__table__
+    record_id = default_uuid()
+
+    left = (
+        delete(presence)
+        .where(presence.c.user_id == user_id)
+        .returning(presence.c.record_id, presence.c.check_in)
+        .cte("left_site")
+    )
+
+    # Presencia guarda el check_in del registro: con él solo se lee la partición del mes
+    closed = (
+        update(table)
+        .where(
+            table.c.id == select(left.c.record_id).scalar_subquery(),
+            table.c.check_in == select(left.c.check_in).scalar_subquery(),
+            table.c.check_out.is_(None),
+        )
+        .values(check_out=now, notes=func.coalesce(cast(literal(notes), Text), table.c.notes))
+        .returning(*table.c)
+        .cte("closed")
+    )
+
+    claimed = (
+        pg_insert(presence)
+        .from_select(
+            ["user_id", "record_id", "check_in", "location"],
+            select(
+                literal(user_id, UUID(as_uuid=True)),
+                literal(record_id, UUID(as_uuid=True)),
+                cast(literal(now), DateTime),
+                cast(literal(location), String(255)),
+            ).where(~exists(select(left.c.record_id))),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(presence.c.record_id)
+        .cte("claimed")
+    )
+
+    opened = (
+        pg_insert(table)
+        .from_select(
+            ["id", "user_id", "check_in", "status", "location", "notes", "shift_id", "created_at"],
+            select(
+                claimed.c.record_id,
+                literal(user_id, UUID(as_uuid=True)),
+                cast(literal(now), DateTime),
+                # El calendario materializado manda; ``status`` es el respaldo
+                func.coalesce(status_expression(user_id, now), cast(literal(status), String(20))),
+                cast(literal(location), String(255)),
+                cast(literal(notes), Text),
+                literal(shift_id, UUID(as_uuid=True)),
+                cast(literal(now), DateTime),
+            ),
+        )
+        .returning(*table.c)
+        .cte("opened")
+    )
+
+    return select(closed).union_all(select(opened))
+
+
+async def toggle_attendance(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    shift_id: uuid.UUID | None,
+    now: datetime,
+    status: str,
+    location: str | None = None,
+    notes: str | None = None,
+) -> tuple[AttendanceRecord, str]:
+    """
+    Registra entrada o salida en un solo round trip y retorna (registro, acción).
+
+    No hace commit: el llamador confirma la transacción junto con el resto de
+    cambios. Si un escaneo concurrente ganó la inserción, se devuelve la entrada
+    abierta que quedó registrada.
+    """
+    notes = notes or None
+    for _ in range(2):
+        stmt = (
+            select(AttendanceRecord)
+            .from_statement(toggle_statement(user_id, shift_id, now, status, location, notes))
+            .execution_options(populate_existing=True)
+        )
+        record = (await db.execute(stmt)).scalar_one_or_none()
+        if record is not None:
+            return record, "check_out" if record.check_out is not None else "check_in"
+
+        # Otro escaneo simultáneo insertó la entrada primero
+        record = await db.scalar(
+            select(AttendanceRecord)
+            .join(
+                AttendancePresence,
+                (AttendancePresence.record_id == AttendanceRecord.id)
+                & (AttendancePresence.check_in == AttendanceRecord.check_in),
+            )
+            .where(AttendancePresence.user_id == user_id)
+        )
+        if record is not None:
+            return record, "check_in"
+
+    raise RuntimeError("No se pudo registrar la asistencia")
+
+
+@dataclass
+class ScanIntent:
+    """Un escaneo ya validado, pendiente de aplicar el toggle."""
+
+    user: User
+    at: datetime
+    location: str | None = None
+    notes: str | None = None
+
+
+@dataclass
+class ScanOutcome:
+    action: str  # "check_in", "check_out" o "rejected"
+    record: dict | None = None
+    detail: str | None = None
+    intent: ScanIntent | None = field(default=None, repr=False)
+
+
+def _batch_status(windows: list | None, intent: ScanIntent) -> str:
+    window = pick_window(windows or [], intent.at)
+    if window is None:
+        return status_for_check_in(intent.user, intent.at)
+    return status_for_window(window, intent.at)
+
+
+async def apply_scans_bulk(db: AsyncSession, intents: list[ScanIntent]) -> list[ScanOutcome]:
+    """
+    Aplica muchos toggles de entrada/salida con escrituras en lote.
+
+    Los escaneos se ordenan por usuario y hora de captura y el toggle se
+    resuelve en memoria a partir de la presencia actual (bloqueada con
+    FOR UPDATE). Luego se escribe todo con sentencias executemany: cierres,
+    inserciones y presencia. No hace commit. Retorna un resultado por intent,
+    en el mismo orden recibido.
+    """
+    table = AttendanceRecord.__table__
+    presence = AttendancePresence.__table__
+    outcomes: list[ScanOutcome | None] = [None] * len(intents)
+    if not intents:
+        return []
+
+    user_ids = {intent.user.id for intent in intents}
+    open_rows = await db.execute(
+        select(table)
+        .join(presence, (presence.c.record_id == table.c.id) & (presence.c.check_in == table.c.check_in))
+        .where(presence.c.user_id.in_(user_ids))
+        .with_for_update(of=presence)
+    )
+    initial_open = {row["user_id"]: dict(row) for row in open_rows.mappings().all()}
+    open_records = dict(initial_open)
+    windows = await windows_for_users(
+        db, user_ids, min(intent.at for intent in intents), max(intent.at for intent in intents)
+    )
+
+    inserts: dict[uuid.UUID, dict] = {}
+    closes: dict[uuid.UUID, dict] = {}
+
+    order = sorted(range(len(intents)), key=lambda i: (str(intents[i].user.id), intents[i].at))
+    for index in order:
+        intent = intents[index]
+        user_id = intent.user.id
+        current = open_records.get(user_id)
+        if current is not None:
+            if intent.at < current["check_in"]:
+                outcomes[index] = ScanOutcome("rejected", detail="Escaneo anterior a la entrada abierta", intent=intent)
+                continue
+            current["check_out"] = intent.at
+            current["notes"] = intent.notes or current["notes"]
+            if current["id"] not in inserts:
+                closes[current["id"]] = current
+            open_records.pop(user_id)
+            outcomes[index] = ScanOutcome("check_out", dict(current), intent=intent)
+        else:
+            record = {
+                "id": default_uuid(),
+                "user_id": user_id,
+                "check_in": intent.at,
+                "check_out": None,
+                "status": _batch_status(windows.get(user_id), intent),
+                "location": intent.location,
+                "notes": intent.notes or None,
+                "shift_id": intent.user.shift_id,
+                "created_at": utc_now(),
+            }
+            inserts[record["id"]] = record
+            open_records[user_id] = record
+            outcomes[index] = ScanOutcome("check_in", dict(record), intent=intent)
+
+    if closes:
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"), table.c.check_in == bindparam("b_check_in"))
+            .values(check_out=bindparam("b_check_out"), notes=bindparam("b_notes")),
+            [
+                {"b_id": r["id"], "b_check_in": r["check_in"], "b_check_out": r["check_out"], "b_notes": r["notes"]}
+                for r in closes.values()
+            ],
+        )
+    if inserts:
+        await db.execute(insert(table), list(inserts.values()))
+
+    changed = {
+        user_id
+        for user_id in user_ids
+        if (initial_open.get(user_id) or {}).get("id") != (open_records.get(user_id) or {}).get("id")
+    }
+    if changed:
+        await db.execute(delete(presence).where(presence.c.user_id.in_(changed)))
+        now_present = [open_records[user_id] for user_id in changed if user_id in open_records]
+        if now_present:
+            await db.execute(
+                insert(presence),
+                [
+                    {"user_id": r["user_id"], "record_id": r["id"], "check_in": r["check_in"], "location": r["location"]}
+                    for r in now_present
+                ],
+            )
+
+    return outcomes
+
+
+def enqueue_scan_alerts(db: AsyncSession, outcomes: list[ScanOutcome]) -> None:
+    """Encola las alertas inmediatas de los escaneos aplicados, en la sesión del llamador."""
+    for outcome in outcomes:
+        if outcome.record is None:
+            continue
+        user = outcome.intent.user
+        if attendance_mode(user.notification_preferences) == "instant":
+            subject, recipient, html = build_attendance_alert(user.email, outcome.record["status"], outcome.intent.notes)
+            enqueue_email(db, subject, recipient, "Alerta de asistencia", html)
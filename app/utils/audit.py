@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import AuditLog, default_uuid, utc_now
+from .metrics import counter, histogram
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+batch_size_metric = histogram(
+    "tapwork_audit_batch_size",
+    "Entradas de auditoría escritas por INSERT",
+    (1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+flush_latency_metric = histogram(
+    "tapwork_audit_flush_seconds",
+    "Duración de cada escritura de un lote de auditoría",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+dropped_metric = counter(
+    "tapwork_audit_dropped_total",
+    "Entradas de auditoría perdidas porque su lote no se pudo escribir",
+)
+
+
+def add_audit_entry(
+    db: AsyncSession,
+    user_id: uuid.UUID | None,
+    action: str,
+    resource: str,
+    changes: dict | None = None,
+    ip_address: str | None = None,
+) -> AuditLog:
+    """
+    Modo síncrono: agrega la entrada a la sesión del llamador, que la confirma
+    junto con el cambio auditado. Para acciones sensibles (contraseñas, altas
+    por un admin) donde no puede quedar un cambio sin su registro.
+    """
+    entry = AuditLog(user_id=user_id, action=action, resource=resource, changes=changes, ip_address=ip_address)
+    db.add(entry)
+    return entry
+
+
+class AuditSink:
+    """
+    Escritor de auditoría en segundo plano: las peticiones encolan la entrada
+    sin esperar a la base y un único escritor las inserta en lotes de hasta
+    ``batch_size`` filas, o las que haya cada ``interval`` segundos.
+
+    La cola está acotada a ``max_queue``: si se llena, ``log`` espera
+    (contrapresión) en vez de descartar entradas. ``stop`` escribe lo pendiente.
+    """
+
+    def __init__(self, max_queue: int, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        # El centinela se procesa después de lo ya encolado
+        await self._queue.put(None)
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def log(
+        self,
+        user_id: uuid.UUID | None,
+        action: str,
+        resource: str,
+        changes: dict | None = None,
+        ip_address: str | None = None,
+    ) -> None:
+        entry = {
+            "id": default_uuid(),
+            "user_id": user_id,
+            "action": action,
+            "resource": resource,
+            "changes": changes,
+            "ip_address": ip_address,
+            "created_at": utc_now(),
+        }
+        if not self.running:
+            # Scripts o procesos sin el escritor: se escribe enseguida
+            await self._write([entry])
+            return
+        await self._queue.put(entry)
+
+    async def _collect(self, first: dict) -> tuple[list[dict], bool]:
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect(first)
+            try:
+                await self._write(batch)
+            except Exception:
+                # Un reintento: un error transitorio de conexión no debe perder el lote
+                try:
+                    await self._write(batch)
+                except Exception:
+                    dropped_metric.inc(len(batch))
+                    logger.exception(f"Audit batch of {len(batch)} entries could not be written: {batch}")
+
+    async def _write(self, batch: list[dict]) -> None:
+        started = time.perf_counter()
+        async with SessionLocal() as session:
+            await session.execute(insert(AuditLog.__table__).values(batch))
+            await session.commit()
+        batch_size_metric.observe(len(batch))
+        flush_latency_metric.observe(time.perf_counter() - started)
+
+
+audit_sink = AuditSink(
+    max_queue=settings.audit_queue_size,
+    batch_size=settings.audit_batch_size,
+    interval=settings.audit_flush_interval_ms / 1000,
+)
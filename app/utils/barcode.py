@@ -1,25 +1,107 @@
+import base64
+import hashlib
+import hmac
 import io
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 
 import barcode
 from barcode.writer import ImageWriter
 
+from ..config import get_settings
 
-def generate_code_data(employee_id: str) -> str:
+
+settings = get_settings()
+
+SIGNED_PREFIX = "T1."
+_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _to_base36(value: int) -> str:
+    digits = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        digits = _ALPHABET[remainder] + digits
+        if not value:
+            return digits
+
+
+@lru_cache
+def _signing_keys() -> dict[int, bytes]:
     """
-    Genera el código de barras usando el employee_id del usuario.
-    Esto da sentido de pertenencia ya que cada código es único y reconocible.
+    Claves HMAC por versión, de ``BARCODE_SIGNING_KEYS`` ("2:clave,1:clave").
+    Si no se configura la versión 1, se deriva de ``SECRET_KEY``.
+    """
+    keys = {}
+    for item in settings.barcode_signing_keys.split(","):
+        if item.strip():
+            version, key = item.strip().split(":", 1)
+            keys[int(version)] = key.encode()
+    keys.setdefault(1, hmac.new(settings.secret_key.encode(), b"barcode-signing-v1", hashlib.sha256).digest())
+    return keys
+
+
+def _signature(key: bytes, payload: str) -> str:
+    digest = hmac.new(key, payload.encode(), hashlib.sha256).digest()[:12]
+    return base64.urlsafe_b64encode(digest).decode("ascii")
+
+
+def sign_code_data(employee_id: str, issued_at: datetime, expires_at: datetime) -> str:
     """
+    Código firmado: ``T1.<employee_id>.<emisión>.<expiración>.<versión>.<firma>``.
+    Las fechas van en segundos epoch base36 y la firma es un HMAC-SHA256
+    truncado a 96 bits, así el código cabe cómodo en Code128.
+    """
+    version = settings.barcode_signing_key_version
+    issued = _to_base36(int(issued_at.replace(tzinfo=timezone.utc).timestamp()))
+    expires = _to_base36(int(expires_at.replace(tzinfo=timezone.utc).timestamp()))
+    payload = f"{SIGNED_PREFIX}{employee_id}.{issued}.{expires}.{version}"
+    return f"{payload}.{_signature(_signing_keys()[version], payload)}"
+
+
+def is_signed_code(code: str) -> bool:
+    return code.startswith(SIGNED_PREFIX)
+
+
+def verify_code_data(code: str, now: datetime) -> str | None:
+    """Valida firma y expiración sin tocar la base de datos. Retorna el employee_id o None."""
+    try:
+        payload, signature = code.rsplit(".", 1)
+        employee_id, _, expires, version = payload[len(SIGNED_PREFIX):].rsplit(".", 3)
+        key = _signing_keys().get(int(version))
+        expires_at = datetime.fromtimestamp(int(expires, 36), timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError, OSError):
+        # Códigos manipulados: fechas fuera de rango también cuentan como inválidos
+        return None
+    # compare_digest no acepta str con caracteres no ASCII
+    if key is None or not signature.isascii() or not hmac.compare_digest(signature, _signature(key, payload)):
+        return None
+    if expires_at <= now:
+        return None
     return employee_id
 
 
-def generate_barcode_png(employee_id: str) -> bytes:
+def generate_code_data(employee_id: str, expires_at: datetime | None = None) -> str:
+    """
+    Genera el contenido del código de barras del usuario.
+
+    Con ``BARCODE_SIGNED_CODES`` activo el código va firmado y se valida sin
+    consultar ``qr_codes``; si no, es el employee_id tal cual, que da sentido
+    de pertenencia ya que cada código es único y reconocible.
+    """
+    if not settings.barcode_signed_codes:
+        return employee_id
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return sign_code_data(employee_id, now, expires_at or default_expiration())
+
+
+def generate_barcode_png(code_data: str) -> bytes:
     """
-    Genera una imagen PNG de código de barras Code128 a partir del employee_id.
-    Code128 es ideal para employee IDs ya que soporta números, letras y caracteres especiales.
+    Genera una imagen PNG de código de barras Code128 a partir del contenido del código.
+    Code128 es ideal ya que soporta números, letras y caracteres especiales.
     """
     code128 = barcode.get_barcode_class('code128')
-    barcode_instance = code128(employee_id, writer=ImageWriter())
+    barcode_instance = code128(code_data, writer=ImageWriter())
 
     buffer = io.BytesIO()
     barcode_instance.write(buffer, options={
@@ -0,0 +1,117 @@
+"""
+Exportación columnar (Parquet / Arrow IPC) para consumidores de BI.
+
+pyarrow es opcional: se importa solo al exportar en estos formatos.
+"""
+import asyncio
+import importlib.util
+import logging
+from pathlib import Path
+from typing import AsyncIterator
+
+from ..config import get_settings
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+# Columnas categóricas: se escriben con diccionario (pocas cadenas distintas repetidas)
+_CATEGORICAL = ("status", "department")
+
+
+def columnar_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return pa
+    except ImportError as e:
+        logger.error(f"Failed to import pyarrow: {e}")
+        raise ImportError("Columnar export dependencies not installed. Run: pip install pyarrow")
+
+
+def export_schema(pa):
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            pa.field("user_email", pa.string(), nullable=False),
+            pa.field("department", category),
+            pa.field("check_in", pa.timestamp("us"), nullable=False),
+            pa.field("check_out", pa.timestamp("us")),
+            pa.field("status", category),
+            pa.field("location", pa.string()),
+            pa.field("notes", pa.string()),
+        ]
+    )
+
+
+class _Categories:
+    """
+    Diccionario estable entre lotes: los valores nuevos se agregan al final, así
+    cada lote emite solo un delta del diccionario (el formato de archivo Arrow
+    no admite reemplazarlo).
+    """
+
+    def __init__(self):
+        self.values: list[str] = []
+        self._index: dict[str, int] = {}
+
+    def encode(self, values: list) -> list[int | None]:
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            index = self._index.get(value)
+            if index is None:
+                index = self._index[value] = len(self.values)
+                self.values.append(value)
+            indices.append(index)
+        return indices
+
+
+class ColumnarWriter:
+    """Escribe lotes de filas de exportación como record batches de Parquet o Arrow IPC."""
+
+    def __init__(self, path: Path, format: str):
+        pa = self._pa = _import_pyarrow()
+        self.schema = export_schema(pa)
+        self._categories = {name: _Categories() for name in _CATEGORICAL}
+        compression = settings.report_columnar_compression
+        if format == "parquet":
+            self._writer = pa.parquet.ParquetWriter(str(path), self.schema, compression=compression)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression, emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_file(str(path), self.schema, options=options)
+
+    def _column(self, field, values: list):
+        pa = self._pa
+        if field.name in self._categories:
+            categories = self._categories[field.name]
+            indices = pa.array(categories.encode(values), type=pa.int32())
+            return pa.DictionaryArray.from_arrays(indices, pa.array(categories.values, type=pa.string()))
+        return pa.array(values, type=field.type)
+
+    def write(self, rows: list[dict]) -> None:
+        if not rows:
+            return
+        columns = [self._column(field, [row.get(field.name) for row in rows]) for field in self.schema]
+        self._writer.write_batch(self._pa.RecordBatch.from_arrays(columns, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+async def write_columnar(batches: AsyncIterator[list[dict]], path: Path, format: str) -> None:
+    """Convierte y escribe cada lote en un hilo mientras el cursor sigue en el event loop."""
+    writer = await asyncio.to_thread(ColumnarWriter, path, format)
+    try:
+        async for batch in batches:
+            await asyncio.to_thread(writer.write, batch)
+    finally:
+        await asyncio.to_thread(writer.close)
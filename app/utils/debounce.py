@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import ScanDebounce
+
+
+settings = get_settings()
+
+# Espera máxima por el resultado de un escaneo idéntico que aún se está procesando
+_POLL_INTERVAL = 0.05
+_POLL_ATTEMPTS = 20
+
+
+def debounce_enabled() -> bool:
+    return settings.scan_debounce_seconds > 0
+
+
+async def claim_scan(db: AsyncSession, code: str, now: datetime) -> bool:
+    """
+    Reserva el escaneo de ``code``. Retorna False si el mismo código se escaneó
+    dentro de la ventana de debounce.
+
+    Confirma la transacción de inmediato para que la reserva sea visible en
+    los demás workers.
+    """
+    cutoff = now - timedelta(seconds=settings.scan_debounce_seconds)
+    stmt = (
+        pg_insert(ScanDebounce)
+        .values(code_data=code, scanned_at=now, result=None)
+        .on_conflict_do_update(
+            index_elements=["code_data"],
+            set_={"scanned_at": now, "result": None},
+            where=ScanDebounce.scanned_at < cutoff,
+        )
+        .returning(ScanDebounce.code_data)
+    )
+    claimed = (await db.execute(stmt)).scalar_one_or_none() is not None
+    await db.commit()
+    return claimed
+
+
+async def previous_result(db: AsyncSession, code: str) -> dict | None:
+    """Resultado del escaneo que ganó la ventana; espera brevemente si sigue en curso."""
+    for _ in range(_POLL_ATTEMPTS):
+        result = await db.scalar(select(ScanDebounce.result).where(ScanDebounce.code_data == code))
+        await db.commit()
+        if result is not None:
+            return result
+        await asyncio.sleep(_POLL_INTERVAL)
+    return None
+
+
+async def store_result(db: AsyncSession, code: str, now: datetime, result: dict) -> None:
+    """Guarda el resultado para las lecturas repetidas. No hace commit."""
+    await db.execute(
+        update(ScanDebounce)
+        .where(ScanDebounce.code_data == code, ScanDebounce.scanned_at == now)
+        .values(result=result)
+    )
+
+
+async def release_scan(db: AsyncSession, code: str, now: datetime) -> None:
+    """Libera la reserva si el escaneo falló, para permitir reintentar de inmediato."""
+    await db.execute(
+        delete(ScanDebounce).where(ScanDebounce.code_data == code, ScanDebounce.scanned_at == now)
+    )
+    await db.commit()
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+
+from sqlalchemy import func, select
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import AttendanceRecord, Department, User, utc_now
+from .email import build_attendance_digest, build_late_arrivals_digest
+from .outbox import enqueue_unique_emails
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+_last_run_day: date | None = None
+
+
+def attendance_mode(preferences: dict) -> str:
+    """Modo de notificación de asistencia: "off", "instant" o "daily"."""
+    if not preferences.get("attendance", True):
+        return "off"
+    return preferences.get("attendance_mode", "instant")
+
+
+async def _user_digests(session, day: date, start: datetime, end: datetime) -> list[dict]:
+    result = await session.execute(
+        select(
+            User.id.label("user_id"),
+            User.email,
+            User.first_name,
+            AttendanceRecord.check_in,
+            AttendanceRecord.check_out,
+            AttendanceRecord.status,
+            AttendanceRecord.location,
+        )
+        .join(User, User.id == AttendanceRecord.user_id)
+        .where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end)
+        .where(User.is_active.is_(True))
+        .where(User.notification_preferences["attendance_mode"].astext == "daily")
+        .where(func.coalesce(User.notification_preferences["attendance"].astext, "true") != "false")
+        .order_by(User.id, AttendanceRecord.check_in)
+    )
+    emails = []
+    for user_id, rows in groupby(result.mappings().all(), key=lambda row: row["user_id"]):
+        rows = list(rows)
+        subject, recipient, html = build_attendance_digest(rows[0]["email"], rows[0]["first_name"], day, rows)
+        emails.append(
+            {
+                "recipient": recipient,
+                "subject": subject,
+                "body": "Resumen diario de asistencia",
+                "html": html,
+                "dedupe_key": f"digest:attendance:{day.isoformat()}:{user_id}",
+            }
+        )
+    return emails
+
+
+async def _late_digests(session, day: date, start: datetime, end: datetime) -> list[dict]:
+    manager = User.__table__.alias("manager")
+    result = await session.execute(
+        select(
+            Department.id.label("department_id"),
+            Department.name.label("department_name"),
+            manager.c.email.label("manager_email"),
+            User.employee_id,
+            User.first_name,
+            User.last_name,
+            AttendanceRecord.check_in,
+            AttendanceRecord.location,
+        )
+        .join(User, User.id == AttendanceRecord.user_id)
+        .join(Department, Department.id == User.department_id)
+        .join(manager, manager.c.id == Department.manager_id)
+        .where(AttendanceRecord.check_in >= start, AttendanceRecord.check_in < end)
+        .where(AttendanceRecord.status == "late")
+        .where(manager.c.is_active.is_(True))
+        .where(manager.c.notification_preferences["late_digest"].astext == "true")
+        .order_by(Department.id, AttendanceRecord.check_in)
+    )
+    emails = []
+    for department_id, rows in groupby(result.mappings().all(), key=lambda row: row["department_id"]):
+        rows = list(rows)
+        subject, recipient, html = build_late_arrivals_digest(
+            rows[0]["manager_email"], rows[0]["department_name"], day, rows
+        )
+        emails.append(
+            {
+                "recipient": recipient,
+                "subject": subject,
+                "body": "Resumen de llegadas tarde",
+                "html": html,
+                "dedupe_key": f"digest:late:{day.isoformat()}:{department_id}",
+            }
+        )
+    return emails
+
+
+async def send_daily_digests(day: date) -> int:
+    """
+    Encola los resúmenes de ``day``: uno por usuario en modo "daily" y uno por
+    departamento para managers con ``late_digest``. Es idempotente gracias al
+    ``dedupe_key`` del outbox, así que puede correr en varios workers.
+    """
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    async with SessionLocal() as session:
+        emails = await _user_digests(session, day, start, end)
+        emails += await _late_digests(session, day, start, end)
+        await enqueue_unique_emails(session, emails)
+        await session.commit()
+    logger.info(f"Queued {len(emails)} attendance digests for {day.isoformat()}")
+    return len(emails)
+
+
+async def _scheduler() -> None:
+    global _last_run_day
+    while not _stop.is_set():
+        now = utc_now()
+        day = now.date() - timedelta(days=1)
+        if now.hour >= settings.attendance_digest_hour and _last_run_day != day:
+            try:
+                await send_daily_digests(day)
+                _last_run_day = day
+            except Exception:
+                logger.exception("Attendance digest run failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=60)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_digest_scheduler() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_scheduler())
+
+
+async def stop_digest_scheduler() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
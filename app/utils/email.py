@@ -1,4 +1,7 @@
+import asyncio
 import logging
+import time
+from datetime import date
 from email.message import EmailMessage
 
 import aiosmtplib
@@ -10,9 +13,9 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
-async def send_email(subject: str, recipient: str, body: str, html: str | None = None, attachments: list[tuple[str, bytes, str]] | None = None) -> None:
+def build_message(subject: str, recipient: str, body: str, html: str | None = None, attachments: list[tuple[str, bytes, str]] | None = None) -> EmailMessage:
     """
-    Envía un email con soporte para adjuntos.
+    Construye el mensaje con soporte para adjuntos.
 
     Args:
         subject: Asunto del email
@@ -34,16 +37,117 @@ async def send_email(subject: str, recipient: str, body: str, html: str | None =
         for filename, content, mimetype in attachments:
             maintype, subtype = mimetype.split('/')
             message.add_attachment(content, maintype=maintype, subtype=subtype, filename=filename)
+    return message
 
-    try:
-        await aiosmtplib.send(
-            message,
+
+class SMTPConnectionPool:
+    """
+    Pool de conexiones SMTP persistentes.
+
+    Reutiliza conexiones ya autenticadas entre envíos para no pagar connect,
+    EHLO, STARTTLS y AUTH por cada mensaje. Las conexiones ociosas más allá de
+    ``idle_timeout`` se cierran, las que llevan un rato sin uso se verifican con
+    NOOP antes de reutilizarse, y un envío que encuentra la conexión caída se
+    reintenta una vez con una conexión nueva.
+    """
+
+    def __init__(self, size: int, idle_timeout: float, health_check_after: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle: list[tuple[aiosmtplib.SMTP, float]] = []
+        self._slots = asyncio.Semaphore(size)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
             hostname=settings.smtp_host,
             port=settings.smtp_port,
             username=settings.smtp_username,
             password=settings.smtp_password,
             start_tls=settings.smtp_tls,
         )
+        await client.connect()
+        return client
+
+    @staticmethod
+    async def _discard(client: aiosmtplib.SMTP) -> None:
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+    async def _checkout(self) -> aiosmtplib.SMTP:
+        while self._idle:
+            client, last_used = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout or not client.is_connected:
+                await self._discard(client)
+                continue
+            if idle_for > self.health_check_after:
+                try:
+                    await client.noop()
+                except Exception:
+                    await self._discard(client)
+                    continue
+            return client
+        return await self._connect()
+
+    async def _checkin(self, client: aiosmtplib.SMTP, healthy: bool) -> None:
+        if healthy and client.is_connected:
+            self._idle.append((client, time.monotonic()))
+        else:
+            await self._discard(client)
+
+    async def send(self, message: EmailMessage) -> None:
+        async with self._slots:
+            for attempt in range(2):
+                client = await self._checkout()
+                try:
+                    await client.send_message(message)
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError, ConnectionError):
+                    # Conexión reutilizada que el servidor cerró: reconectar y reintentar una vez
+                    await self._checkin(client, healthy=False)
+                    if attempt:
+                        raise
+                    continue
+                except aiosmtplib.SMTPException:
+                    # Error del mensaje (p.ej. destinatario rechazado): la conexión sigue sirviendo
+                    await self._checkin(client, healthy=True)
+                    raise
+                except BaseException:
+                    await self._checkin(client, healthy=False)
+                    raise
+                await self._checkin(client, healthy=True)
+                return
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(client) for client, _ in idle), return_exceptions=True)
+
+
+smtp_pool = SMTPConnectionPool(
+    size=settings.smtp_pool_size,
+    idle_timeout=settings.smtp_pool_idle_timeout_seconds,
+    health_check_after=settings.smtp_pool_health_check_seconds,
+)
+
+
+async def deliver_message(message: EmailMessage) -> None:
+    """Envía el mensaje por SMTP. A diferencia de send_email, propaga los errores."""
+    await smtp_pool.send(message)
+
+
+async def send_email(subject: str, recipient: str, body: str, html: str | None = None, attachments: list[tuple[str, bytes, str]] | None = None) -> None:
+    """
+    Envía un email inmediatamente, sin pasar por el outbox.
+
+    Los flujos de la API usan ``enqueue_email`` (app/utils/outbox.py); esta
+    función queda para scripts y envíos puntuales.
+    """
+    message = build_message(subject, recipient, body, html, attachments)
+    try:
+        await deliver_message(message)
     except Exception:
         logger.exception("Failed to send email")
         # Surface a soft failure to keep flows working locally
@@ -132,6 +236,66 @@ def build_attendance_alert(email: str, status: str, notes: str | None = None) ->
     return subject, email, html
 
 
+def build_attendance_digest(email: str, first_name: str, day: date, records: list[dict]) -> tuple[str, str, str]:
+    """Resumen diario de asistencia de un usuario (modo "daily")."""
+    subject = f"Resumen de asistencia {day.isoformat()}"
+    rows = "".join(
+        f"<tr><td>{r['check_in']:%H:%M}</td>"
+        f"<td>{r['check_out'].strftime('%H:%M') if r['check_out'] else '-'}</td>"
+        f"<td>{r['status']}</td><td>{r['location'] or ''}</td></tr>"
+        for r in records
+    )
+    late = sum(1 for r in records if r["status"] == "late")
+    html = (
+        f"<p>Hola <strong>{first_name}</strong>,</p>"
+        f"<p>Tus registros del {day.isoformat()}: {len(records)} entrada(s), {late} tarde.</p>"
+        "<table border='1' cellpadding='4' cellspacing='0'>"
+        "<tr><th>Entrada</th><th>Salida</th><th>Estado</th><th>Ubicación</th></tr>"
+        f"{rows}</table>"
+    )
+    return subject, email, html
+
+
+def build_late_arrivals_digest(email: str, department_name: str, day: date, records: list[dict]) -> tuple[str, str, str]:
+    """Resumen diario de llegadas tarde de un departamento para su manager."""
+    subject = f"Llegadas tarde {department_name} - {day.isoformat()}"
+    rows = "".join(
+        f"<tr><td>{r['employee_id']}</td><td>{r['first_name']} {r['last_name']}</td>"
+        f"<td>{r['check_in']:%H:%M}</td><td>{r['location'] or ''}</td></tr>"
+        for r in records
+    )
+    html = (
+        f"<p>Departamento <strong>{department_name}</strong>: "
+        f"{len(records)} llegada(s) tarde el {day.isoformat()}.</p>"
+        "<table border='1' cellpadding='4' cellspacing='0'>"
+        "<tr><th>Empleado</th><th>Nombre</th><th>Entrada</th><th>Ubicación</th></tr>"
+        f"{rows}</table>"
+    )
+    return subject, email, html
+
+
+def build_scheduled_report_email(
+    email: str, name: str, department_name: str | None, job, link: str, attached: bool
+) -> tuple[str, str, str]:
+    """Aviso de un reporte programado listo, con el archivo adjunto o un enlace de descarga."""
+    period = f"{job.range_start:%Y-%m-%d} - {job.range_end:%Y-%m-%d}"
+    subject = f"Reporte programado: {name} ({period})"
+    scope = department_name or "Todos los departamentos"
+    delivery = (
+        "<p>El archivo va adjunto.</p>"
+        if attached
+        else f"<p>Descárgalo (requiere iniciar sesión) en <a href='{link}'>{link}</a>.</p>"
+    )
+    html = (
+        f"<p>El reporte <strong>{name}</strong> está listo.</p>"
+        f"<p>Período: {period}<br>Alcance: {scope}<br>"
+        f"Formato: {job.format.upper()} · {job.rows_done} fila(s)</p>"
+        f"{delivery}"
+        f"<p>Disponible para descarga hasta {job.expires_at:%Y-%m-%d %H:%M} UTC.</p>"
+    )
+    return subject, email, html
+
+
 def build_welcome_email(email: str, first_name: str, employee_id: str) -> tuple[str, str, str]:
     """
     Construye el email de bienvenida con instrucciones sobre el código de barras.
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import engine
+from ..models import User
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL = "attendance_events"
+# Identifica a este proceso: sus propios NOTIFY ya se publicaron en memoria
+ORIGIN = uuid.uuid4().hex
+OVERFLOW = object()
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+
+
+@dataclass(eq=False)
+class Subscriber:
+    department_id: str | None = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(maxsize=settings.live_feed_buffer_size))
+    overflowed: bool = False
+
+    def offer(self, event: dict) -> None:
+        if self.overflowed:
+            return
+        if self.department_id and event.get("department_id") != self.department_id:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Suscriptor lento: se descarta su buffer y se le pide reconectar
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+_subscribers: set[Subscriber] = set()
+# Callbacks síncronos que reciben cada evento publicado en este proceso (p.ej. invalidar caches)
+_handlers: list[Callable[[dict], None]] = []
+
+
+def subscribe(department_id: str | None = None) -> Subscriber:
+    subscriber = Subscriber(department_id=department_id)
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber) -> None:
+    _subscribers.discard(subscriber)
+
+
+def add_event_handler(handler: Callable[[dict], None]) -> None:
+    _handlers.append(handler)
+
+
+def _utc_iso(value: datetime) -> str:
+    """ISO con zona explícita: los timestamps se guardan en UTC sin zona."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat().replace("+00:00", "Z")
+
+
+def attendance_event(user: User, record: dict) -> dict:
+    """Evento de entrada/salida para el feed en vivo, a partir del registro como dict."""
+    check_out = record.get("check_out")
+    return {
+        "type": "check_out" if check_out is not None else "check_in",
+        "record_id": str(record["id"]),
+        "user_id": str(user.id),
+        "employee_id": user.employee_id,
+        "name": f"{user.first_name} {user.last_name}",
+        "department_id": str(user.department_id) if user.department_id else None,
+        "status": record["status"],
+        "late": record["status"] == "late",
+        "at": _utc_iso(check_out or record["check_in"]),
+        "check_in": _utc_iso(record["check_in"]),
+        "location": record.get("location"),
+    }
+
+
+def outcome_events(outcomes: list) -> list[dict]:
+    """Eventos de los ``ScanOutcome`` aplicados (los rechazados no generan evento)."""
+    return [attendance_event(outcome.intent.user, outcome.record) for outcome in outcomes if outcome.record]
+
+
+async def notify_events(db: AsyncSession, events: list[dict]) -> None:
+    """
+    Emite los eventos con pg_notify dentro de la transacción del llamador.
+
+    Postgres solo los entrega a los demás workers si la transacción se
+    confirma; tras el commit hay que llamar a ``publish_events``.
+    """
+    if not events:
+        return
+    payloads = [json.dumps({"origin": ORIGIN, "event": event}) for event in events]
+    await db.execute(
+        text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+        {"channel": CHANNEL, "payloads": payloads},
+    )
+
+
+def publish_events(events: list[dict]) -> None:
+    """Publica en los suscriptores de este proceso, después del commit."""
+    for event in events:
+        for handler in _handlers:
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Live event handler failed")
+        for subscriber in list(_subscribers):
+            subscriber.offer(event)
+
+
+def _on_notify(connection, pid, channel, payload) -> None:
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return
+    if message.get("origin") != ORIGIN:
+        publish_events([message["event"]])
+
+
+async def _listen(dsn: str) -> None:
+    connection = await asyncpg.connect(dsn)
+    try:
+        await connection.add_listener(CHANNEL, _on_notify)
+        while not _stop.is_set() and not connection.is_closed():
+            try:
+                await asyncio.wait_for(_stop.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await connection.close()
+
+
+async def _listener() -> None:
+    # Conexión dedicada fuera del pool: LISTEN la ocupa mientras viva el proceso
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while not _stop.is_set():
+        try:
+            await _listen(dsn)
+        except Exception:
+            logger.exception("Live feed listener failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_live_feed() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_listener())
+
+
+async def stop_live_feed() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
@@ -0,0 +1,74 @@
+import threading
+from bisect import bisect_left
+
+
+class Counter:
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            if index < len(self.buckets):
+                self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.total}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+_registry: list[Counter | Histogram] = []
+
+
+def counter(name: str, description: str) -> Counter:
+    metric = Counter(name, description)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, description: str, buckets: tuple[float, ...]) -> Histogram:
+    metric = Histogram(name, description, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """Exporta las métricas registradas en formato de texto de Prometheus."""
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,205 @@
+import asyncio
+import base64
+import logging
+from datetime import timedelta
+
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import EmailOutbox, default_uuid, utc_now
+from .email import build_message, deliver_message
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_stop = asyncio.Event()
+_workers: list[asyncio.Task] = []
+
+
+def _encode_attachments(attachments: list[tuple[str, bytes, str]] | None) -> list[dict] | None:
+    if not attachments:
+        return None
+    return [
+        {"filename": filename, "content": base64.b64encode(content).decode("ascii"), "mimetype": mimetype}
+        for filename, content, mimetype in attachments
+    ]
+
+
+def enqueue_email(
+    db: AsyncSession,
+    subject: str,
+    recipient: str,
+    body: str,
+    html: str | None = None,
+    attachments: list[tuple[str, bytes, str]] | None = None,
+) -> EmailOutbox:
+    """
+    Agrega un email al outbox dentro de la sesión del llamador.
+
+    El email se confirma (o descarta) junto con la transacción de negocio y lo
+    envían los workers en segundo plano.
+    """
+    entry = EmailOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        html=html,
+        attachments=_encode_attachments(attachments),
+    )
+    db.add(entry)
+    return entry
+
+
+async def enqueue_unique_emails(db: AsyncSession, emails: list[dict]) -> None:
+    """
+    Encola varios emails en un solo INSERT, ignorando los ``dedupe_key`` ya encolados.
+
+    Cada elemento lleva las claves de ``enqueue_email`` más ``dedupe_key``. Útil
+    para trabajos periódicos que pueden correr en varios procesos a la vez.
+    """
+    if not emails:
+        return
+    rows = [
+        {
+            "id": default_uuid(),
+            "recipient": email["recipient"],
+            "subject": email["subject"],
+            "body": email["body"],
+            "html": email.get("html"),
+            "attachments": _encode_attachments(email.get("attachments")),
+            "dedupe_key": email["dedupe_key"],
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": utc_now(),
+            "created_at": utc_now(),
+        }
+        for email in emails
+    ]
+    await db.execute(pg_insert(EmailOutbox).values(rows).on_conflict_do_nothing(index_elements=["dedupe_key"]))
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    seconds = settings.email_outbox_retry_base_seconds * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.email_outbox_retry_max_seconds))
+
+
+async def _claim_batch(session: AsyncSession) -> list[EmailOutbox]:
+    """Reserva un lote de emails vencidos con SKIP LOCKED y un lease temporal."""
+    now = utc_now()
+    due = (
+        select(EmailOutbox.id)
+        .where(
+            or_(
+                and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+                # Lease vencido: el worker que lo tomó murió a mitad de envío
+                and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now),
+            )
+        )
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(settings.email_outbox_batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    claim = (
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(
+            status="sending",
+            attempts=EmailOutbox.attempts + 1,
+            locked_until=now + timedelta(seconds=settings.email_outbox_lease_seconds),
+        )
+        .returning(EmailOutbox)
+    )
+    result = await session.execute(
+        select(EmailOutbox).from_statement(claim).execution_options(populate_existing=True)
+    )
+    batch = list(result.scalars().all())
+    await session.commit()
+    return batch
+
+
+async def _deliver(entry: EmailOutbox) -> dict:
+    attachments = [
+        (item["filename"], base64.b64decode(item["content"]), item["mimetype"])
+        for item in entry.attachments or []
+    ]
+    message = build_message(entry.subject, entry.recipient, entry.body, entry.html, attachments)
+    now = utc_now()
+    # Mismas claves en todos los resultados: se escriben con un solo executemany
+    outcome = {
+        "b_id": entry.id,
+        "b_attempts": entry.attempts,
+        "status": "sent",
+        "next_attempt_at": entry.next_attempt_at,
+        "sent_at": None,
+        "last_error": None,
+    }
+    try:
+        await deliver_message(message)
+    except Exception as exc:
+        if entry.attempts >= settings.email_outbox_max_attempts:
+            logger.error(f"Email {entry.id} to {entry.recipient} failed permanently: {exc}")
+            return {**outcome, "status": "failed", "last_error": str(exc)}
+        logger.warning(f"Email {entry.id} to {entry.recipient} failed (attempt {entry.attempts}): {exc}")
+        return {
+            **outcome,
+            "status": "pending",
+            "next_attempt_at": now + _retry_delay(entry.attempts),
+            "last_error": str(exc),
+        }
+    return {**outcome, "sent_at": now}
+
+
+async def process_batch() -> int:
+    """Reclama, envía y registra el resultado de un lote. Retorna cuántos procesó."""
+    async with SessionLocal() as session:
+        batch = await _claim_batch(session)
+        if not batch:
+            return 0
+        # Envío concurrente; el pool SMTP limita las conexiones simultáneas
+        outcomes = await asyncio.gather(*(_deliver(entry) for entry in batch))
+        # UPDATE en modo executemany, solo si el lease sigue siendo nuestro: si el
+        # lote tardó más que el lease, otro worker pudo reclamarlo (attempts cambió)
+        table = EmailOutbox.__table__
+        await session.execute(
+            update(table)
+            .where(
+                table.c.id == bindparam("b_id"),
+                table.c.status == "sending",
+                table.c.attempts == bindparam("b_attempts"),
+            )
+            .values(locked_until=None),
+            list(outcomes),
+        )
+        await session.commit()
+        return len(batch)
+
+
+async def _worker(index: int) -> None:
+    while not _stop.is_set():
+        try:
+            processed = await process_batch()
+        except Exception:
+            logger.exception(f"Email outbox worker {index} failed")
+            processed = 0
+        if processed:
+            continue
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=settings.email_outbox_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_outbox_workers() -> None:
+    _stop.clear()
+    for index in range(settings.email_outbox_workers):
+        _workers.append(asyncio.create_task(_worker(index)))
+
+
+async def stop_outbox_workers() -> None:
+    _stop.set()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
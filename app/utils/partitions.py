@@ -0,0 +1,86 @@
+"""
+Particiones mensuales de ``attendance_records``.
+
+El job crea por adelantado las particiones de los próximos
+``ATTENDANCE_PARTITION_MONTHS_AHEAD`` meses con la función
+``attendance_ensure_partition`` (migración 0016). Los escaneos de meses sin
+partición caen en ``attendance_records_default`` y se mueven a la del mes
+cuando se crea.
+"""
+import asyncio
+import logging
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import utc_now
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"attendance_records_{month:%Y_%m}"
+
+
+async def ensure_partitions(db: AsyncSession, first: date, last: date) -> list[str]:
+    """Crea (si faltan) las particiones de los meses de ``first`` a ``last``. No hace commit."""
+    month, names = first.replace(day=1), []
+    while month <= last:
+        names.append(await db.scalar(text("SELECT attendance_ensure_partition(:month)"), {"month": month}))
+        month = add_months(month, 1)
+    return names
+
+
+async def detach_partition(db: AsyncSession, month: date) -> str | None:
+    """
+    Separa la partición del mes y retorna su nombre (None si no existe). Solo
+    toca el catálogo: la tabla queda intacta para archivarla o borrarla con
+    DROP TABLE sin un DELETE masivo. No hace commit.
+    """
+    name = partition_name(month)
+    if await db.scalar(text("SELECT to_regclass(:name)"), {"name": name}) is None:
+        return None
+    await db.execute(text(f'ALTER TABLE attendance_records DETACH PARTITION "{name}"'))
+    return name
+
+
+async def _job() -> None:
+    while not _stop.is_set():
+        try:
+            current = utc_now().date().replace(day=1)
+            async with SessionLocal() as session:
+                await ensure_partitions(
+                    session, current, add_months(current, settings.attendance_partition_months_ahead)
+                )
+                await session.commit()
+        except Exception:
+            logger.exception("Attendance partition maintenance failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=3600)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_partition_job() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_job())
+
+
+async def stop_partition_job() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
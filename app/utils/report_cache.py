@@ -0,0 +1,144 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timezone
+from typing import Any, Awaitable, Callable
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import utc_now
+from .live_events import add_event_handler
+from .metrics import counter
+
+
+settings = get_settings()
+
+hits_metric = counter("tapwork_report_cache_hits_total", "Consultas de reportes servidas desde el cache")
+misses_metric = counter("tapwork_report_cache_misses_total", "Consultas de reportes calculadas en la base")
+coalesced_metric = counter(
+    "tapwork_report_cache_coalesced_total", "Consultas de reportes que esperaron un cálculo idéntico en curso"
+)
+
+
+def normalize_datetime(value: datetime) -> datetime:
+    """UTC sin zona, como se guardan los timestamps: el mismo instante da la misma clave."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+    start: datetime
+    end: datetime
+    department_id: uuid.UUID | None
+
+
+class ReportCache:
+    """
+    Cache de resultados de reportes con single-flight.
+
+    Los períodos ya cerrados (terminan antes de hoy) se guardan por
+    ``REPORT_CACHE_CLOSED_TTL_SECONDS``; los que incluyen hoy por
+    ``REPORT_CACHE_OPEN_TTL_SECONDS``. Cada escaneo invalida las entradas cuyo
+    rango contiene su entrada, de modo que los datos nuevos (incluidas
+    sincronizaciones offline de días pasados) se ven enseguida.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        # Cálculos en curso invalidados: su resultado se entrega pero no se guarda
+        self._stale: set[tuple] = set()
+
+    async def get(
+        self,
+        name: str,
+        fn: Callable[..., Awaitable[Any]],
+        start: datetime,
+        end: datetime,
+        department_id: uuid.UUID | None = None,
+        *extra: Any,
+    ) -> Any:
+        """
+        Resultado de ``fn(session, start, end, department_id, *extra)``, desde el
+        cache o calculado una sola vez para todas las peticiones idénticas
+        concurrentes. ``fn`` corre con su propia sesión: sobrevive a la
+        petición que lo disparó si esta se cancela.
+        """
+        start, end = normalize_datetime(start), normalize_datetime(end)
+        key = (name, start, end, department_id, *extra)
+        entry = self._entries.get(key)
+        if entry and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            hits_metric.inc()
+            return entry.value
+
+        task = self._inflight.get(key)
+        if task:
+            coalesced_metric.inc()
+        else:
+            misses_metric.inc()
+            task = asyncio.create_task(self._compute(key, fn, start, end, department_id, *extra))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: tuple, fn, start, end, department_id, *extra) -> Any:
+        try:
+            async with SessionLocal() as session:
+                value = await fn(session, start, end, department_id, *extra)
+        finally:
+            self._inflight.pop(key, None)
+            stale = key in self._stale
+            self._stale.discard(key)
+        if not stale:
+            self._store(key, value, start, end, department_id)
+        return value
+
+    def _store(self, key: tuple, value: Any, start: datetime, end: datetime, department_id) -> None:
+        today = datetime.combine(utc_now().date(), dt_time.min)
+        closed = end < today
+        ttl = settings.report_cache_closed_ttl_seconds if closed else settings.report_cache_open_ttl_seconds
+        if ttl <= 0:
+            return
+        self._entries[key] = _Entry(value, time.monotonic() + ttl, start, end, department_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _affected(start: datetime, end: datetime, entry_department, at: datetime, department_id: str | None) -> bool:
+        if not start <= at <= end:
+            return False
+        return entry_department is None or department_id is None or str(entry_department) == department_id
+
+    def invalidate(self, at: datetime, department_id: str | None = None) -> None:
+        """Descarta las entradas cuyo rango contiene ``at`` (y son de ese departamento o de todos)."""
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if self._affected(entry.start, entry.end, entry.department_id, at, department_id)
+        ]
+        for key in stale:
+            del self._entries[key]
+        # Las claves son (nombre, inicio, fin, departamento, ...)
+        self._stale.update(key for key in self._inflight if self._affected(key[1], key[2], key[3], at, department_id))
+
+    def on_attendance_event(self, event: dict) -> None:
+        """Handler de eventos del feed en vivo (locales y de otros workers)."""
+        at = event.get("check_in") or event.get("at")
+        if at:
+            self.invalidate(normalize_datetime(datetime.fromisoformat(at)), event.get("department_id"))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._stale.update(self._inflight)
+
+
+report_cache = ReportCache(max_entries=settings.report_cache_max_entries)
+add_event_handler(report_cache.on_attendance_event)
@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator
+
+from sqlalchemy import and_, delete, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import ReportJob, default_uuid, utc_now
+from .archive import archives_for_range
+from .columnar import COLUMNAR_FORMATS, write_columnar
+from .report_rows import copy_csv_chunks, export_query, parallel_row_batches
+from .reporting import ROWS_PER_PAGE, csv_chunks, render_pdf_report
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# formato -> (media type, extensión)
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "pdf": ("application/pdf", "pdf"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+}
+ACTIVE_STATUSES = ("pending", "running")
+
+_stop = asyncio.Event()
+_workers: list[asyncio.Task] = []
+
+
+def cache_key(format: str, range_start: datetime, range_end: datetime, department_id: uuid.UUID | None) -> str:
+    """Clave del resultado: exportaciones con los mismos parámetros comparten archivo."""
+    raw = "|".join([format, range_start.isoformat(), range_end.isoformat(), str(department_id or "")])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Las columnas son timestamp sin zona (UTC); así el mismo instante da la misma clave
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def store_dir() -> Path:
+    return Path(settings.report_store_dir)
+
+
+async def _reusable(db: AsyncSession, key: str) -> ReportJob | None:
+    """Job en curso o terminado y vigente con la misma clave."""
+    return await db.scalar(
+        select(ReportJob)
+        .where(
+            ReportJob.cache_key == key,
+            or_(
+                ReportJob.status.in_(ACTIVE_STATUSES),
+                and_(ReportJob.status == "done", ReportJob.expires_at > utc_now()),
+            ),
+        )
+        .order_by(ReportJob.created_at.desc())
+        .limit(1)
+    )
+
+
+async def submit_job(
+    db: AsyncSession,
+    format: str,
+    range_start: datetime,
+    range_end: datetime,
+    department_id: uuid.UUID | None,
+    requested_by: uuid.UUID | None,
+    commit: bool = True,
+) -> ReportJob:
+    """
+    Retorna el job que produce esta exportación: uno existente con los mismos
+    parámetros si está en curso o vigente, o uno nuevo encolado. Hace commit
+    salvo con ``commit=False`` (el llamador confirma su propia transacción).
+    """
+    range_start, range_end = _naive_utc(range_start), _naive_utc(range_end)
+    key = cache_key(format, range_start, range_end, department_id)
+    existing = await _reusable(db, key)
+    if existing:
+        return existing
+    job_id = await db.scalar(
+        pg_insert(ReportJob)
+        .values(
+            id=default_uuid(),
+            requested_by=requested_by,
+            format=format,
+            range_start=range_start,
+            range_end=range_end,
+            department_id=department_id,
+            cache_key=key,
+            status="pending",
+            rows_done=0,
+            attempts=0,
+            created_at=utc_now(),
+        )
+        .on_conflict_do_nothing(index_elements=["cache_key"], index_where=text("status IN ('pending', 'running')"))
+        .returning(ReportJob.id)
+    )
+    if commit:
+        await db.commit()
+    if job_id is None:
+        # Otro request encoló la misma exportación en paralelo
+        return await _reusable(db, key)
+    return await db.get(ReportJob, job_id)
+
+
+async def _update_job(job_id: uuid.UUID, **values) -> None:
+    async with SessionLocal() as session:
+        await session.execute(update(ReportJob).where(ReportJob.id == job_id).values(**values))
+        await session.commit()
+
+
+async def _claim_job() -> ReportJob | None:
+    """Reserva el job pendiente más antiguo (o uno con lease vencido) con SKIP LOCKED."""
+    now = utc_now()
+    due = (
+        select(ReportJob.id)
+        .where(
+            or_(
+                ReportJob.status == "pending",
+                # Lease vencido: el worker que lo tomó murió a mitad de la exportación
+                and_(ReportJob.status == "running", ReportJob.locked_until < now),
+            )
+        )
+        .order_by(ReportJob.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    claim = (
+        update(ReportJob)
+        .where(ReportJob.id == due.scalar_subquery())
+        .values(
+            status="running",
+            attempts=ReportJob.attempts + 1,
+            started_at=now,
+            locked_until=now + timedelta(seconds=settings.report_job_lease_seconds),
+        )
+        .returning(ReportJob)
+    )
+    async with SessionLocal() as session:
+        result = await session.execute(select(ReportJob).from_statement(claim))
+        job = result.scalars().first()
+        await session.commit()
+        return job
+
+
+async def _count_rows(job: ReportJob) -> int:
+    query = export_query(job.range_start, job.range_end, job.department_id).order_by(None).subquery()
+    async with SessionLocal() as session:
+        total = await session.scalar(select(func.count()).select_from(query))
+        # Los meses archivados suman completos (sin filtrar por rango ni departamento): es una cota para el progreso
+        archives = await archives_for_range(session, job.range_start, job.range_end)
+    return total + sum(archive.row_count for archive in archives)
+
+
+async def _tracked(job_id: uuid.UUID, batches: AsyncIterator[list[dict]], done: list[int]) -> AsyncIterator[list[dict]]:
+    """Cuenta las filas que pasan y publica el progreso (y renueva el lease) cada pocos segundos."""
+    reported_at = time.monotonic()
+    async for batch in batches:
+        done[0] += len(batch)
+        if time.monotonic() - reported_at >= settings.report_job_progress_seconds:
+            reported_at = time.monotonic()
+            await _update_job(
+                job_id,
+                rows_done=done[0],
+                locked_until=utc_now() + timedelta(seconds=settings.report_job_lease_seconds),
+            )
+        yield batch
+
+
+async def _tracked_copy(job_id: uuid.UUID, chunks: AsyncIterator[bytes], done: list[int]) -> AsyncIterator[bytes]:
+    """Como ``_tracked`` para los bloques de COPY: estima filas por saltos de línea y renueva el lease."""
+    reported_at = time.monotonic()
+    lines = 0
+    async for chunk in chunks:
+        lines += chunk.count(b"\n")
+        # Sin la cabecera; un campo con saltos de línea cuenta de más, el progreso se acota a 1
+        done[0] = max(lines - 1, 0)
+        if time.monotonic() - reported_at >= settings.report_job_progress_seconds:
+            reported_at = time.monotonic()
+            await _update_job(
+                job_id,
+                rows_done=done[0],
+                locked_until=utc_now() + timedelta(seconds=settings.report_job_lease_seconds),
+            )
+        yield chunk
+
+
+async def _write_csv(job: ReportJob, path: Path, done: list[int]) -> None:
+    use_copy = settings.report_csv_copy
+    if use_copy:
+        # COPY solo ve la tabla; con meses archivados se usa el cursor, que también lee los archivos
+        async with SessionLocal() as session:
+            use_copy = not await archives_for_range(session, job.range_start, job.range_end)
+    if use_copy:
+        # Sin heartbeat otro worker reclamaría el job al vencer el lease y escribiría el mismo .part
+        chunks = _tracked_copy(job.id, copy_csv_chunks(job.range_start, job.range_end, job.department_id), done)
+    else:
+        batches = parallel_row_batches(job.range_start, job.range_end, job.department_id)
+        chunks = csv_chunks(_tracked(job.id, batches, done))
+    with path.open("wb") as output:
+        async for chunk in chunks:
+            await asyncio.to_thread(output.write, chunk)
+
+
+async def _write_pdf(job: ReportJob, path: Path, done: list[int]) -> None:
+    batches = parallel_row_batches(
+        job.range_start,
+        job.range_end,
+        job.department_id,
+        by_department=True,
+        chunk_size=ROWS_PER_PAGE * settings.report_pdf_chunk_pages,
+    )
+    subtitle = (
+        f"{job.range_start:%Y-%m-%d %H:%M} - {job.range_end:%Y-%m-%d %H:%M} · "
+        f"Generado: {utc_now():%Y-%m-%d %H:%M} UTC"
+    )
+    content = await render_pdf_report(
+        _tracked(job.id, batches, done), "Reporte de asistencia", subtitle, settings.report_pdf_max_rows
+    )
+    await asyncio.to_thread(path.write_bytes, content)
+
+
+async def _write_columnar(job: ReportJob, path: Path, done: list[int]) -> None:
+    # Lotes grandes: cada lote es un row group de Parquet / record batch de Arrow
+    batches = parallel_row_batches(
+        job.range_start,
+        job.range_end,
+        job.department_id,
+        by_department=True,
+        chunk_size=settings.report_columnar_batch_rows,
+    )
+    await write_columnar(_tracked(job.id, batches, done), path, job.format)
+
+
+async def run_job(job: ReportJob) -> None:
+    """Genera el archivo del job en el file store y registra el resultado."""
+    if job.attempts > settings.report_job_max_attempts:
+        await _update_job(job.id, status="failed", error="Demasiados intentos", finished_at=utc_now(), locked_until=None)
+        return
+    directory = store_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    final = directory / f"{job.id}.{FORMATS[job.format][1]}"
+    # Se escribe a un archivo temporal y se renombra: una descarga nunca ve un archivo a medias
+    partial = final.with_name(final.name + ".part")
+    done = [0]
+    started = time.perf_counter()
+    try:
+        rows_total = await _count_rows(job)
+        await _update_job(job.id, rows_total=rows_total)
+        if job.format == "pdf":
+            await _write_pdf(job, partial, done)
+        elif job.format in COLUMNAR_FORMATS:
+            await _write_columnar(job, partial, done)
+        else:
+            await _write_csv(job, partial, done)
+        os.replace(partial, final)
+    except asyncio.CancelledError:
+        # Apagado: el job vuelve a la cola sin consumir un intento
+        partial.unlink(missing_ok=True)
+        await _update_job(job.id, status="pending", attempts=job.attempts - 1, locked_until=None)
+        raise
+    except Exception as exc:
+        logger.exception(f"Report job {job.id} failed")
+        partial.unlink(missing_ok=True)
+        await _update_job(job.id, status="failed", error=str(exc), finished_at=utc_now(), locked_until=None)
+        return
+
+    now = utc_now()
+    await _update_job(
+        job.id,
+        status="done",
+        # Sin filas contadas (rango vacío) vale el total
+        rows_done=done[0] or rows_total,
+        file_path=str(final),
+        size_bytes=final.stat().st_size,
+        finished_at=now,
+        expires_at=now + timedelta(seconds=settings.report_job_ttl_seconds),
+        locked_until=None,
+        error=None,
+    )
+    logger.info(f"Report job {job.id} ({job.format}) finished in {time.perf_counter() - started:.1f}s")
+
+
+async def purge_expired() -> int:
+    """Borra los jobs vencidos (y los fallidos viejos) junto con sus archivos."""
+    now = utc_now()
+    async with SessionLocal() as session:
+        result = await session.execute(
+            delete(ReportJob)
+            .where(
+                or_(
+                    and_(ReportJob.status == "done", ReportJob.expires_at < now),
+                    and_(
+                        ReportJob.status == "failed",
+                        ReportJob.finished_at < now - timedelta(seconds=settings.report_job_ttl_seconds),
+                    ),
+                )
+            )
+            .returning(ReportJob.file_path)
+        )
+        paths = [path for path in result.scalars().all() if path]
+        await session.commit()
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+    return len(paths)
+
+
+async def _worker(index: int) -> None:
+    while not _stop.is_set():
+        job = None
+        try:
+            job = await _claim_job()
+            if job:
+                await run_job(job)
+            elif index == 0:
+                await purge_expired()
+        except Exception:
+            logger.exception(f"Report job worker {index} failed")
+        if job:
+            continue
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=settings.report_job_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_report_workers() -> None:
+    _stop.clear()
+    for index in range(settings.report_job_workers):
+        _workers.append(asyncio.create_task(_worker(index)))
+
+
+async def stop_report_workers() -> None:
+    _stop.set()
+    # Un job a medias queda "running"; otro worker lo retoma cuando vence el lease
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
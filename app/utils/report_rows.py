@@ -0,0 +1,269 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator
+
+from sqlalchemy import select
+
+from ..config import get_settings
+from ..database import SessionLocal, engine
+from ..models import AttendanceRecord, Department, User
+from .archive import archived_rows, archives_for_range
+from .rollups import NO_DEPARTMENT
+
+
+settings = get_settings()
+
+EXPORT_COLUMNS = ["user_email", "check_in", "check_out", "status", "location", "notes"]
+
+_COPY_SQL = """
+SELECT u.email AS user_email, r.check_in, r.check_out, r.status, r.location, r.notes
+FROM attendance_records r
+JOIN users u ON u.id = r.user_id
+WHERE r.check_in >= $1 AND r.check_in <= $2 {department_filter}
+ORDER BY r.check_in
+"""
+
+
+def export_query(
+    range_start: datetime,
+    range_end: datetime,
+    department_id: uuid.UUID | None = None,
+    by_department: bool = False,
+):
+    """
+    Consulta de filas de exportación, compartida por CSV y PDF. Con
+    ``by_department`` agrega el nombre del departamento y ordena por él (secciones del PDF).
+    """
+    query = (
+        select(
+            User.email.label("user_email"),
+            AttendanceRecord.check_in,
+            AttendanceRecord.check_out,
+            AttendanceRecord.status,
+            AttendanceRecord.location,
+            AttendanceRecord.notes,
+        )
+        .join(User, User.id == AttendanceRecord.user_id)
+        .where(AttendanceRecord.check_in >= range_start, AttendanceRecord.check_in <= range_end)
+        .order_by(AttendanceRecord.check_in)
+    )
+    if department_id == NO_DEPARTMENT:
+        query = query.where(User.department_id.is_(None))
+    elif department_id:
+        query = query.where(User.department_id == department_id)
+    if by_department:
+        query = (
+            query.add_columns(Department.name.label("department"))
+            .outerjoin(Department, Department.id == User.department_id)
+            .order_by(None)
+            .order_by(Department.name.nulls_last(), AttendanceRecord.check_in)
+        )
+    return query
+
+
+async def _archive_people() -> dict[uuid.UUID, tuple[str, uuid.UUID | None, str | None]]:
+    """usuario -> (email, departamento, nombre del departamento) para completar filas archivadas."""
+    async with SessionLocal() as session:
+        result = await session.execute(
+            select(User.id, User.email, User.department_id, Department.name).outerjoin(
+                Department, Department.id == User.department_id
+            )
+        )
+        return {row[0]: tuple(row[1:]) for row in result.all()}
+
+
+def _archive_export_rows(rows: list[dict], people: dict, department_id: uuid.UUID | None, by_department: bool) -> list[dict]:
+    """Filas archivadas con la forma de ``export_query`` (los usuarios borrados se omiten, como en el join)."""
+    selected = []
+    for row in rows:
+        person = people.get(row["user_id"])
+        if person is None:
+            continue
+        email, user_department, department_name = person
+        if department_id == NO_DEPARTMENT and user_department is not None:
+            continue
+        if department_id and department_id != NO_DEPARTMENT and user_department != department_id:
+            continue
+        export_row = {
+            "user_email": email,
+            "check_in": row["check_in"],
+            "check_out": row["check_out"],
+            "status": row["status"],
+            "location": row["location"],
+            "notes": row["notes"],
+        }
+        if by_department:
+            export_row["department"] = department_name
+        selected.append(export_row)
+    return selected
+
+
+async def stream_row_batches(
+    range_start: datetime,
+    range_end: datetime,
+    department_id: uuid.UUID | None = None,
+    by_department: bool = False,
+    chunk_size: int | None = None,
+) -> AsyncIterator[list[dict]]:
+    """
+    Filas de exportación en lotes de ``chunk_size`` (por defecto
+    ``REPORT_STREAM_CHUNK_SIZE``) leídos con un cursor del lado del servidor.
+    Abre su propia sesión: la del request ya se cerró cuando la respuesta
+    empieza a transmitirse. Los meses archivados se leen de sus archivos.
+    """
+    chunk_size = chunk_size or settings.report_stream_chunk_size
+    async with SessionLocal() as session:
+        archives = await archives_for_range(session, range_start, range_end)
+    if archives and by_department and not department_id:
+        # Los archivos están ordenados por check_in: una pasada por departamento mantiene las secciones
+        for department in await _department_order():
+            async for batch in stream_row_batches(range_start, range_end, department, True, chunk_size):
+                yield batch
+        return
+
+    if archives:
+        # Los meses archivados son los más antiguos: van primero y el orden por check_in se mantiene
+        people = await _archive_people()
+        async for batch in archived_rows(archives, range_start, range_end, chunk_size):
+            rows = _archive_export_rows(batch, people, department_id, by_department)
+            if rows:
+                yield rows
+    async with SessionLocal() as session:
+        result = await session.stream(
+            export_query(range_start, range_end, department_id, by_department).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.mappings().partitions(chunk_size):
+            yield [dict(row) for row in partition]
+
+
+def export_parallelism() -> int:
+    """``REPORT_EXPORT_PARALLELISM`` acotado al tamaño del pool del engine."""
+    pool_size = getattr(engine.pool, "size", lambda: 1)()
+    return max(1, min(settings.report_export_parallelism, pool_size))
+
+
+def month_parts(range_start: datetime, range_end: datetime) -> list[tuple[datetime, datetime]]:
+    """Divide [range_start, range_end] en tramos por mes calendario, inclusivos como ``export_query``."""
+    parts = []
+    current = range_start
+    while True:
+        year, month = (current.year + 1, 1) if current.month == 12 else (current.year, current.month + 1)
+        boundary = current.replace(year=year, month=month, day=1, hour=0, minute=0, second=0, microsecond=0)
+        if boundary > range_end:
+            parts.append((current, range_end))
+            return parts
+        # Postgres guarda microsegundos: "<= boundary - 1µs" equivale a "< boundary"
+        parts.append((current, boundary - timedelta(microseconds=1)))
+        current = boundary
+
+
+async def _department_order() -> list[uuid.UUID]:
+    async with SessionLocal() as session:
+        ids = (await session.execute(select(Department.id).order_by(Department.name))).scalars().all()
+    return [*ids, NO_DEPARTMENT]
+
+
+async def parallel_row_batches(
+    range_start: datetime,
+    range_end: datetime,
+    department_id: uuid.UUID | None = None,
+    by_department: bool = False,
+    chunk_size: int | None = None,
+) -> AsyncIterator[list[dict]]:
+    """
+    Igual que ``stream_row_batches`` pero repartiendo la consulta en tramos
+    (por departamento si la salida va agrupada por departamento, si no por mes)
+    que corren en paralelo, cada uno con su conexión del pool. Los lotes se
+    entregan en el orden de los tramos, así que el orden total se conserva.
+    """
+    parallelism = export_parallelism()
+    if by_department and not department_id:
+        parts = [(range_start, range_end, department) for department in await _department_order()]
+    else:
+        parts = [(start, end, department_id) for start, end in month_parts(range_start, range_end)]
+    if parallelism == 1 or len(parts) == 1:
+        async for batch in stream_row_batches(range_start, range_end, department_id, by_department, chunk_size):
+            yield batch
+        return
+
+    # Cola acotada por tramo: los tramos adelantados esperan sin acumular más de dos lotes
+    queues = [asyncio.Queue(maxsize=2) for _ in parts]
+    slots = asyncio.Semaphore(parallelism)
+    producers: list[asyncio.Task] = []
+
+    async def produce(index: int, start: datetime, end: datetime, department: uuid.UUID | None) -> None:
+        try:
+            async for batch in stream_row_batches(start, end, department, by_department, chunk_size):
+                await queues[index].put(batch)
+            await queues[index].put(None)
+        except Exception as exc:
+            await queues[index].put(exc)
+        finally:
+            slots.release()
+
+    async def launch() -> None:
+        # Los tramos arrancan en orden: el que se está leyendo siempre tiene conexión
+        for index, part in enumerate(parts):
+            await slots.acquire()
+            producers.append(asyncio.create_task(produce(index, *part)))
+
+    launcher = asyncio.create_task(launch())
+    try:
+        for queue in queues:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        launcher.cancel()
+        for producer in producers:
+            producer.cancel()
+        await asyncio.gather(launcher, *producers, return_exceptions=True)
+
+
+async def copy_csv_chunks(
+    range_start: datetime, range_end: datetime, department_id: uuid.UUID | None = None
+) -> AsyncIterator[bytes]:
+    """CSV generado por Postgres con ``COPY ... TO STDOUT``, reenviado tal como llega."""
+    # Cola acotada: si el cliente lee lento, COPY espera en vez de acumular en memoria
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=8)
+    args = [range_start, range_end]
+    department_filter = ""
+    if department_id:
+        department_filter = "AND u.department_id = $3"
+        args.append(department_id)
+
+    async def copy() -> None:
+        async with SessionLocal() as session:
+            connection = await session.connection()
+            raw = (await connection.get_raw_connection()).driver_connection
+            await raw.copy_from_query(
+                _COPY_SQL.format(department_filter=department_filter),
+                *args,
+                output=chunks.put,
+                format="csv",
+                header=True,
+            )
+
+    task = asyncio.create_task(copy())
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(chunks.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield bytes(getter.result())
+                continue
+            getter.cancel()
+            while not chunks.empty():
+                yield bytes(chunks.get_nowait())
+            task.result()
+            break
+    finally:
+        if getter is not None:
+            getter.cancel()
+        task.cancel()
@@ -0,0 +1,196 @@
+"""
+Exportaciones programadas.
+
+El worker encola las programaciones vencidas solo dentro de la ventana fuera de
+horas pico (``REPORT_SCHEDULE_WINDOW_START`` a ``REPORT_SCHEDULE_WINDOW_END``,
+UTC) a través de los report jobs, así que comparten el file store y el
+resultado con las exportaciones manuales idénticas. Cuando el job termina, el
+archivo queda vigente ``REPORT_SCHEDULE_TTL_SECONDS`` y se envía a los
+destinatarios por el outbox.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+from sqlalchemy import select
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import Department, ReportJob, ReportSchedule, utc_now
+from .email import build_scheduled_report_email
+from .outbox import enqueue_unique_emails
+from .report_jobs import FORMATS, submit_job
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+RANGE_TEMPLATES = ("previous_day", "previous_week", "previous_month", "last_7_days", "last_30_days")
+FREQUENCIES = ("daily", "weekly", "monthly")
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+
+
+def template_range(template: str, day: date) -> tuple[datetime, datetime]:
+    """Rango [inicio, fin] (inclusivo, como las exportaciones) del template para una ejecución en ``day``."""
+    today = datetime.combine(day, time.min)
+    if template == "previous_day":
+        start = today - timedelta(days=1)
+    elif template == "previous_week":
+        # Semana de lunes a domingo anterior a la de ``day``
+        start = today - timedelta(days=day.weekday() + 7)
+        today = start + timedelta(days=7)
+    elif template == "previous_month":
+        today = today.replace(day=1)
+        start = (today - timedelta(days=1)).replace(day=1)
+    elif template == "last_7_days":
+        start = today - timedelta(days=7)
+    elif template == "last_30_days":
+        start = today - timedelta(days=30)
+    else:
+        raise ValueError(f"Template de rango desconocido: {template}")
+    return start, today - timedelta(microseconds=1)
+
+
+def _runs_on(frequency: str, weekday: int | None, day_of_month: int | None, day: date) -> bool:
+    if frequency == "weekly":
+        # weekday usa 0=domingo ... 6=sábado, como working_days
+        return day.isoweekday() % 7 == weekday
+    if frequency == "monthly":
+        return day.day == day_of_month
+    return True
+
+
+def next_run_at(frequency: str, weekday: int | None, day_of_month: int | None, after: datetime) -> datetime:
+    """Próximo inicio de la ventana fuera de horas pico posterior a ``after`` en un día que toca."""
+    day = after.date()
+    # day_of_month <= 28: cualquier cadencia cae dentro de un mes
+    for _ in range(32):
+        candidate = datetime.combine(day, time(settings.report_schedule_window_start))
+        if candidate > after and _runs_on(frequency, weekday, day_of_month, day):
+            return candidate
+        day += timedelta(days=1)
+    raise ValueError(f"Cadencia inválida: {frequency}")
+
+
+def in_offpeak_window(hour: int) -> bool:
+    start, end = settings.report_schedule_window_start, settings.report_schedule_window_end
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+async def dispatch_due() -> int:
+    """Encola el job de cada programación vencida y calcula su próxima ejecución."""
+    now = utc_now()
+    async with SessionLocal() as session:
+        schedules = (
+            await session.scalars(
+                select(ReportSchedule)
+                .where(
+                    ReportSchedule.is_active.is_(True),
+                    ReportSchedule.next_run_at <= now,
+                    ReportSchedule.pending_job_id.is_(None),
+                )
+                .order_by(ReportSchedule.next_run_at)
+                .limit(20)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        for schedule in schedules:
+            # El período sale del día programado: una ejecución atrasada produce el mismo reporte
+            start, end = template_range(schedule.range_template, schedule.next_run_at.date())
+            job = await submit_job(
+                session, schedule.format, start, end, schedule.department_id, schedule.created_by, commit=False
+            )
+            schedule.pending_job_id = job.id
+            schedule.last_run_at = now
+            schedule.next_run_at = next_run_at(schedule.frequency, schedule.weekday, schedule.day_of_month, now)
+        await session.commit()
+    if schedules:
+        logger.info(f"Queued {len(schedules)} scheduled reports")
+    return len(schedules)
+
+
+async def _report_emails(session, schedule: ReportSchedule, job: ReportJob) -> list[dict]:
+    department = await session.get(Department, schedule.department_id) if schedule.department_id else None
+    link = f"{settings.api_base_url}/api/reports/export/{job.id}/download"
+    media_type, extension = FORMATS[job.format]
+    attachments = None
+    path = Path(job.file_path) if job.file_path else None
+    if path and job.size_bytes is not None and job.size_bytes <= settings.report_schedule_attach_max_bytes:
+        try:
+            content = await asyncio.to_thread(path.read_bytes)
+            attachments = [(f"{schedule.name}-{job.range_start:%Y%m%d}.{extension}", content, media_type)]
+        except OSError:
+            logger.warning(f"Scheduled report {job.id} file missing, sending link only")
+    emails = []
+    for recipient in schedule.recipients or []:
+        subject, recipient, html = build_scheduled_report_email(
+            recipient, schedule.name, department.name if department else None, job, link, bool(attachments)
+        )
+        emails.append(
+            {
+                "recipient": recipient,
+                "subject": subject,
+                "body": f"Reporte programado: {schedule.name}",
+                "html": html,
+                "attachments": attachments,
+                "dedupe_key": f"report-schedule:{schedule.id}:{job.id}:{recipient}",
+            }
+        )
+    return emails
+
+
+async def deliver_finished() -> int:
+    """Cierra las ejecuciones cuyo job terminó: extiende su vigencia y encola los emails."""
+    now = utc_now()
+    async with SessionLocal() as session:
+        rows = (
+            await session.execute(
+                select(ReportSchedule, ReportJob)
+                .join(ReportJob, ReportJob.id == ReportSchedule.pending_job_id)
+                .where(ReportJob.status.in_(("done", "failed")))
+                .with_for_update(of=ReportSchedule, skip_locked=True)
+            )
+        ).all()
+        for schedule, job in rows:
+            schedule.pending_job_id = None
+            schedule.last_job_id = job.id
+            if job.status == "failed":
+                schedule.last_error = job.error
+                continue
+            schedule.last_error = None
+            # El job puede ser una exportación manual reutilizada con vigencia corta
+            job.expires_at = max(job.expires_at or now, now + timedelta(seconds=settings.report_schedule_ttl_seconds))
+            await enqueue_unique_emails(session, await _report_emails(session, schedule, job))
+        await session.commit()
+    return len(rows)
+
+
+async def _scheduler() -> None:
+    while not _stop.is_set():
+        try:
+            if in_offpeak_window(utc_now().hour):
+                await dispatch_due()
+            await deliver_finished()
+        except Exception:
+            logger.exception("Report schedule run failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=settings.report_schedule_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_report_scheduler() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_scheduler())
+
+
+async def stop_report_scheduler() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
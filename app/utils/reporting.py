@@ -1,50 +1,305 @@
+import asyncio
+import contextlib
 import csv
 import io
+import logging
+import threading
+import time
 from datetime import datetime, timezone
-from typing import Iterable
+from typing import AsyncIterator, Iterable, Iterator
 
 from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+
+from .metrics import counter, histogram
+from .payroll import PAYROLL_COLUMNS
+from .report_rows import EXPORT_COLUMNS
+
+
+logger = logging.getLogger(__name__)
+
+pdf_render_metric = histogram(
+    "tapwork_report_pdf_render_seconds",
+    "Duración del renderizado de reportes PDF",
+    (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+pdf_rows_metric = counter("tapwork_report_pdf_rows_total", "Filas renderizadas en reportes PDF")
+pdf_pages_metric = counter("tapwork_report_pdf_pages_total", "Páginas renderizadas en reportes PDF")
 
 
 def attendance_to_csv(records: Iterable[dict]) -> bytes:
     buffer = io.StringIO()
-    writer = csv.DictWriter(
-        buffer,
-        fieldnames=["user_email", "check_in", "check_out", "status", "location", "notes"],
-    )
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
     writer.writeheader()
     for row in records:
         writer.writerow(row)
     return buffer.getvalue().encode("utf-8")
 
 
-def attendance_to_pdf(records: Iterable[dict], title: str = "Attendance Report") -> bytes:
-    pdf = FPDF()
+def payroll_to_csv(entries: Iterable[dict]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=PAYROLL_COLUMNS)
+    writer.writeheader()
+    writer.writerows(entries)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def csv_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    """Codifica lotes de filas a CSV de a uno: la memoria depende del lote, no del total de filas."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue().encode("utf-8")
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class ReportTooLarge(Exception):
+    """El reporte supera el máximo de filas permitido para PDF"""
+    pass
+
+
+# (clave, encabezado, ancho en mm) sobre A4 horizontal: 277 mm útiles
+_PDF_COLUMNS = [
+    ("user_email", "Email", 70),
+    ("check_in", "Entrada", 36),
+    ("check_out", "Salida", 36),
+    ("status", "Estado", 22),
+    ("location", "Ubicación", 48),
+    ("notes", "Notas", 65),
+]
+_ROW_HEIGHT = 6
+# Filas que entran en una página con encabezado y pie; define el tamaño de los lotes
+ROWS_PER_PAGE = 26
+_NO_DEPARTMENT = "Sin departamento"
+
+
+def _pdf_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M")
+    # Las fuentes base del PDF son latin-1
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+class AttendancePDF(FPDF):
+    """
+    Documento de asistencia con encabezado de tabla en cada página y secciones por departamento.
+
+    Las filas se escriben con ``text`` y líneas en vez de ``cell``: es mucho
+    más barato por celda y permite documentos de cientos de miles de filas.
+    """
+
+    def __init__(self, title: str, subtitle: str):
+        super().__init__(orientation="L", format="A4")
+        self.report_title = _pdf_text(title)
+        self.report_subtitle = _pdf_text(subtitle)
+        self.section: str | None = None
+        self.set_auto_page_break(True, margin=15)
+        self.set_font("helvetica", size=8)
+        self._char_widths = self.current_font.cw
+        # Límite de cada columna en unidades de la fuente (1/1000 del tamaño)
+        self._limits = [(width - 2) * 1000 / self.font_size for _, _, width in _PDF_COLUMNS]
+        # Caracteres que entran seguro sin medir (el más ancho de la fuente mide ~1015)
+        self._safe_chars = [int(limit / 1015) for limit in self._limits]
+        self._table_top: float | None = None
+
+    def header(self) -> None:
+        self.set_font("helvetica", "B", 12)
+        self.cell(0, 7, self.report_title, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("helvetica", size=8)
+        self.cell(0, 5, self.report_subtitle, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        if self.section is None:
+            self.ln(2)
+            return
+        self.set_font("helvetica", "B", 10)
+        self.cell(0, 7, _pdf_text(self.section), new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        self.set_font("helvetica", "B", 8)
+        self.set_fill_color(230, 230, 230)
+        for _, label, width in _PDF_COLUMNS:
+            self.cell(width, _ROW_HEIGHT, _pdf_text(label), border=1, fill=True)
+        self.ln()
+        self.set_font("helvetica", size=8)
+        self._table_top = self.y
+
+    def footer(self) -> None:
+        self._close_table()
+        self.set_y(-12)
+        self.set_font("helvetica", size=8)
+        self.cell(0, 5, f"Página {self.page_no()}/{{nb}}", align="C")
+
+    def _close_table(self) -> None:
+        # Las líneas verticales de la tabla se dibujan una vez por página
+        if self._table_top is None or self.y <= self._table_top:
+            self._table_top = None
+            return
+        x = self.l_margin
+        self.line(x, self._table_top, x, self.y)
+        for _, _, width in _PDF_COLUMNS:
+            x += width
+            self.line(x, self._table_top, x, self.y)
+        self._table_top = None
+
+    def _fit(self, text: str, index: int) -> str:
+        if len(text) <= self._safe_chars[index]:
+            return text
+        limit = self._limits[index]
+        widths = self._char_widths
+        if sum(widths.get(char, 600) for char in text) <= limit:
+            return text
+        limit -= 3 * widths["."]
+        used = 0
+        for position, char in enumerate(text):
+            used += widths.get(char, 600)
+            if used > limit:
+                return text[:position] + "..."
+        return text
+
+    def start_section(self, name: str) -> None:
+        self._close_table()
+        self.section = name
+        self.add_page()
+
+    def row(self, record: dict) -> None:
+        if self.y + _ROW_HEIGHT > self.page_break_trigger:
+            self.add_page()
+        x, y = self.l_margin, self.y
+        baseline = y + _ROW_HEIGHT - 1.8
+        for index, (key, _, width) in enumerate(_PDF_COLUMNS):
+            text = self._fit(_pdf_text(record.get(key)), index)
+            if text:
+                self.text(x + 1, baseline, text)
+            x += width
+        self.line(self.l_margin, y + _ROW_HEIGHT, x, y + _ROW_HEIGHT)
+        self.y = y + _ROW_HEIGHT
+
+    def totals(self, label: str, totals: dict) -> None:
+        self._close_table()
+        self.set_font("helvetica", "B", 8)
+        hours = totals["minutes"] / 60
+        self.cell(
+            0,
+            _ROW_HEIGHT + 1,
+            _pdf_text(f"{label}: {totals['rows']} registros, {totals['late']} tardanzas, {hours:.1f} horas trabajadas"),
+            new_x=XPos.LMARGIN,
+            new_y=YPos.NEXT,
+        )
+        self.set_font("helvetica", size=8)
+
+
+def _new_totals() -> dict:
+    return {"rows": 0, "late": 0, "minutes": 0.0}
+
+
+def _add_to_totals(totals: dict, record: dict) -> None:
+    totals["rows"] += 1
+    if record.get("status") == "late":
+        totals["late"] += 1
+    check_in, check_out = record.get("check_in"), record.get("check_out")
+    if check_in and check_out:
+        totals["minutes"] += (check_out - check_in).total_seconds() / 60
+
+
+def render_attendance_pdf(
+    batches: Iterator[list[dict]], title: str, subtitle: str, max_rows: int | None = None
+) -> tuple[bytes, int, int]:
+    """
+    Renderiza lotes de filas ordenadas por departamento y retorna (pdf, filas, páginas).
+
+    Es síncrono y consume los lotes de a uno: pensado para correr en un hilo.
+    """
+    pdf = AttendancePDF(title, subtitle)
+    grand = _new_totals()
+    sections: list[tuple[str, dict]] = []
+    current: dict | None = None
+    for batch in batches:
+        for record in batch:
+            name = record.get("department") or _NO_DEPARTMENT
+            if current is None or name != pdf.section:
+                if current is not None:
+                    pdf.totals(f"Total {pdf.section}", current)
+                current = _new_totals()
+                sections.append((name, current))
+                pdf.start_section(name)
+            pdf.row(record)
+            _add_to_totals(current, record)
+            _add_to_totals(grand, record)
+            if max_rows and grand["rows"] > max_rows:
+                raise ReportTooLarge(f"El reporte supera {max_rows} filas")
+    if current is not None:
+        pdf.totals(f"Total {pdf.section}", current)
+
+    # Resumen final por departamento
+    pdf.section = None
     pdf.add_page()
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, title, ln=1)
-    pdf.set_font("Arial", size=10)
-    pdf.cell(0, 10, f"Generado: {datetime.now(timezone.utc).isoformat()} UTC", ln=1)
-
-    pdf.set_font("Arial", "B", 10)
-    headers = ["Email", "Check-in", "Check-out", "Status", "Location", "Notes"]
-    col_widths = [35, 35, 35, 20, 30, 35]
-    for width, header in zip(col_widths, headers):
-        pdf.cell(width, 8, header, border=1)
-    pdf.ln()
-
-    pdf.set_font("Arial", size=9)
-    for row in records:
-        values = [
-            row.get("user_email", ""),
-            row.get("check_in", ""),
-            row.get("check_out", ""),
-            row.get("status", ""),
-            row.get("location", ""),
-            row.get("notes", ""),
-        ]
-        for width, value in zip(col_widths, values):
-            pdf.cell(width, 7, str(value)[:50], border=1)
-        pdf.ln()
-    return pdf.output(dest="S").encode("latin-1")
+    pdf.set_font("helvetica", "B", 10)
+    pdf.cell(0, 7, "Resumen", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("helvetica", size=8)
+    for name, totals in sections:
+        pdf.totals(name, totals)
+    pdf.totals("Total general", grand)
+    return bytes(pdf.output()), grand["rows"], pdf.page_no()
+
+
+async def render_pdf_report(
+    batches: AsyncIterator[list[dict]], title: str, subtitle: str, max_rows: int | None = None
+) -> bytes:
+    """
+    Renderiza el PDF en un hilo mientras el event loop lee los lotes siguientes.
+
+    Entre la base y el hilo hay a lo sumo dos lotes en memoria; si el
+    renderizado va más lento, la lectura del cursor espera.
+    """
+    loop = asyncio.get_running_loop()
+    pending: asyncio.Queue = asyncio.Queue(maxsize=2)
+    cancelled = threading.Event()
+
+    async def produce() -> None:
+        async with contextlib.aclosing(batches):
+            try:
+                async for batch in batches:
+                    await pending.put(batch)
+            except Exception as exc:
+                await pending.put(exc)
+                return
+        await pending.put(None)
 
+    def consume() -> Iterator[list[dict]]:
+        while not cancelled.is_set():
+            item = asyncio.run_coroutine_threadsafe(pending.get(), loop).result()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    producer = asyncio.create_task(produce())
+    started = time.perf_counter()
+    try:
+        content, rows, pages = await asyncio.to_thread(render_attendance_pdf, consume(), title, subtitle, max_rows)
+    finally:
+        # Si el request se cancela, el hilo no debe quedar esperando un lote que no llegará
+        cancelled.set()
+        producer.cancel()
+        while not pending.empty():
+            pending.get_nowait()
+        pending.put_nowait(None)
+
+    elapsed = time.perf_counter() - started
+    pdf_render_metric.observe(elapsed)
+    pdf_rows_metric.inc(rows)
+    pdf_pages_metric.inc(pages)
+    logger.info(
+        "PDF report rendered: %d rows, %d pages in %.2fs (%.0f rows/s)", rows, pages, elapsed, rows / max(elapsed, 1e-6)
+    )
+    return content
+
+
+def attendance_to_pdf(records: Iterable[dict], title: str = "Attendance Report") -> bytes:
+    subtitle = f"Generado: {datetime.now(timezone.utc).isoformat()} UTC"
+    content, _, _ = render_attendance_pdf(iter([list(records)]), title, subtitle)
+    return content
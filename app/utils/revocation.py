@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from sqlalchemy import or_, select, union
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import QRCode, RevokedBarcode, utc_now
+
+
+settings = get_settings()
+
+_revoked: set[str] = set()
+_loaded_at = float("-inf")
+_lock = asyncio.Lock()
+
+
+async def _refresh(db: AsyncSession) -> None:
+    global _revoked, _loaded_at
+    now = utc_now()
+    stmt = union(
+        select(RevokedBarcode.code_data).where(
+            or_(RevokedBarcode.expires_at.is_(None), RevokedBarcode.expires_at > now)
+        ),
+        # Códigos desactivados a mano en qr_codes
+        select(QRCode.code_data).where(
+            QRCode.is_active.is_(False),
+            or_(QRCode.expires_at.is_(None), QRCode.expires_at > now),
+        ),
+    )
+    _revoked = set((await db.execute(stmt)).scalars().all())
+    _loaded_at = time.monotonic()
+
+
+async def is_revoked(db: AsyncSession, code: str) -> bool:
+    """
+    Consulta el conjunto de códigos revocados cacheado en memoria.
+
+    Se recarga cada ``BARCODE_REVOCATION_REFRESH_SECONDS``; es pequeño porque
+    solo guarda revocaciones que aún no expiraron.
+    """
+    if time.monotonic() - _loaded_at > settings.barcode_revocation_refresh_seconds:
+        async with _lock:
+            if time.monotonic() - _loaded_at > settings.barcode_revocation_refresh_seconds:
+                await _refresh(db)
+    return code in _revoked
+
+
+async def revoke_code(db: AsyncSession, code: str, expires_at) -> None:
+    """Revoca un código firmado. No hace commit; los demás workers lo ven en su próxima recarga."""
+    await db.execute(
+        pg_insert(RevokedBarcode)
+        .values(code_data=code, expires_at=expires_at, revoked_at=utc_now())
+        .on_conflict_do_nothing(index_elements=["code_data"])
+    )
+    _revoked.add(code)
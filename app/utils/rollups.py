@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import case, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import (
+    AttendanceDailyDepartment,
+    AttendanceDailyUser,
+    AttendanceRecord,
+    RollupDirtyDay,
+    RollupState,
+    User,
+    utc_now,
+)
+from .archive import archived_months, archived_rows, archives_for_range, department_user_ids
+from .partitions import add_months
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+ROLLUP_NAME = "attendance"
+# Departamento de los usuarios sin departamento en attendance_daily_department
+NO_DEPARTMENT = uuid.UUID(int=0)
+# Clave del advisory lock: un solo worker consolida a la vez
+_LOCK_KEY = 0x7A70_0037
+_CHUNK_DAYS = 31
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+
+_USER_ROLLUP_SQL = """
+INSERT INTO attendance_daily_user (user_id, day, check_ins, late_count, minutes_worked)
+SELECT user_id,
+       check_in::date,
+       count(*),
+       count(*) FILTER (WHERE status = 'late'),
+       coalesce(round(sum(extract(epoch FROM check_out - check_in)) / 60), 0)::int
+FROM attendance_records
+WHERE check_in >= :start AND check_in < :end
+GROUP BY user_id, check_in::date
+"""
+
+_DEPARTMENT_ROLLUP_SQL = """
+INSERT INTO attendance_daily_department (department_id, day, check_ins, late_count, minutes_worked, employees)
+SELECT coalesce(u.department_id, CAST(:no_department AS uuid)),
+       r.day,
+       sum(r.check_ins),
+       sum(r.late_count),
+       sum(r.minutes_worked),
+       count(*)
+FROM attendance_daily_user r
+JOIN users u ON u.id = r.user_id
+WHERE r.day >= :start_day AND r.day < :end_day
+GROUP BY 1, r.day
+"""
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """UTC sin zona, como se guardan los timestamps (ver ``report_cache.normalize_datetime``)."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _live_spans(start_day: date, end_day: date, archived: set[date]) -> list[tuple[date, date]]:
+    """Tramos de [start_day, end_day) fuera de los meses archivados."""
+    spans: list[tuple[date, date]] = []
+    day = start_day
+    while day < end_day:
+        month = day.replace(day=1)
+        span_end = min(add_months(month, 1), end_day)
+        if month not in archived:
+            if spans and spans[-1][1] == day:
+                spans[-1] = (spans[-1][0], span_end)
+            else:
+                spans.append((day, span_end))
+        day = span_end
+    return spans
+
+
+async def rebuild_days(db: AsyncSession, start_day: date, end_day: date) -> None:
+    """
+    Recalcula los rollups de [start_day, end_day) desde los registros. No hace commit.
+
+    Los meses archivados ya no tienen registros en la tabla: sus rollups se
+    conservan tal cual en vez de recalcularse a cero.
+    """
+    archived = await archived_months(db, start_day, end_day - timedelta(days=1))
+    for span_start, span_end in _live_spans(start_day, end_day, archived):
+        await db.execute(
+            delete(AttendanceDailyUser).where(AttendanceDailyUser.day >= span_start, AttendanceDailyUser.day < span_end)
+        )
+        await db.execute(
+            delete(AttendanceDailyDepartment).where(
+                AttendanceDailyDepartment.day >= span_start, AttendanceDailyDepartment.day < span_end
+            )
+        )
+        await db.execute(text(_USER_ROLLUP_SQL), {"start": _midnight(span_start), "end": _midnight(span_end)})
+        await db.execute(
+            text(_DEPARTMENT_ROLLUP_SQL),
+            {"no_department": str(NO_DEPARTMENT), "start_day": span_start, "end_day": span_end},
+        )
+
+
+async def rolled_through(db: AsyncSession) -> date | None:
+    return await db.scalar(select(RollupState.rolled_through).where(RollupState.name == ROLLUP_NAME))
+
+
+async def mark_dirty(db: AsyncSession, days: set[date]) -> None:
+    """Marca días pasados que recibieron registros tarde para recalcularlos. No hace commit."""
+    today = utc_now().date()
+    days = {day for day in days if day < today}
+    if days:
+        # Los días de meses archivados no se recalculan (ver ``rebuild_days``)
+        archived = await archived_months(db, min(days), max(days))
+        days = {day for day in days if day.replace(day=1) not in archived}
+    if days:
+        await db.execute(
+            pg_insert(RollupDirtyDay).values([{"day": day} for day in days]).on_conflict_do_nothing()
+        )
+
+
+async def catch_up() -> None:
+    """
+    Consolida los días completos pendientes, los últimos ``ROLLUP_RECOMPUTE_DAYS``
+    (salidas que llegaron después de medianoche) y los días marcados como sucios.
+    """
+    today = utc_now().date()
+    async with SessionLocal() as session:
+        locked = await session.scalar(select(func.pg_try_advisory_xact_lock(_LOCK_KEY)))
+        if not locked:
+            return
+        through = await rolled_through(session)
+        if through is None:
+            first = await session.scalar(select(func.min(AttendanceRecord.check_in)))
+            start = first.date() if first else today
+        else:
+            start = min(through + timedelta(days=1), today - timedelta(days=settings.rollup_recompute_days))
+        dirty = set((await session.execute(select(RollupDirtyDay.day))).scalars().all())
+
+        # Rango continuo en bloques de un mes, para no recalcular años en una sola sentencia
+        day = start
+        while day < today:
+            chunk_end = min(day + timedelta(days=_CHUNK_DAYS), today)
+            await rebuild_days(session, day, chunk_end)
+            day = chunk_end
+        for dirty_day in sorted(dirty):
+            if dirty_day < start:
+                await rebuild_days(session, dirty_day, dirty_day + timedelta(days=1))
+        if dirty:
+            await session.execute(delete(RollupDirtyDay).where(RollupDirtyDay.day.in_(dirty)))
+
+        await session.execute(
+            pg_insert(RollupState)
+            .values(name=ROLLUP_NAME, rolled_through=today - timedelta(days=1), updated_at=utc_now())
+            .on_conflict_do_update(
+                index_elements=["name"],
+                set_={"rolled_through": today - timedelta(days=1), "updated_at": utc_now()},
+            )
+        )
+        await session.commit()
+
+
+def split_range(start: datetime, end: datetime, through: date | None) -> tuple[tuple[date, date] | None, list[tuple[datetime, datetime]]]:
+    """
+    Divide [start, end] en días completos ya consolidados (para leer de los
+    rollups) y tramos que se leen de los registros: bordes parciales y días
+    aún no consolidados (hoy).
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    first_full = start.date() if start == _midnight(start.date()) else start.date() + timedelta(days=1)
+    last_full = end.date()  # exclusivo: el día de ``end`` no está completo
+    if through is not None:
+        last_full = min(last_full, through + timedelta(days=1))
+    if through is None or first_full >= last_full:
+        return None, [(start, end)]
+    raw = []
+    if start < _midnight(first_full):
+        raw.append((start, _midnight(first_full)))
+    raw.append((_midnight(last_full), end))
+    return (first_full, last_full), raw
+
+
+async def summarize(
+    db: AsyncSession, start: datetime, end: datetime, department_id: uuid.UUID | None = None
+) -> tuple[int, int]:
+    """(entradas, tardanzas) en [start, end], leyendo de los rollups salvo en los bordes y hoy."""
+    start, end = _naive_utc(start), _naive_utc(end)
+    days, raw_ranges = split_range(start, end, await rolled_through(db))
+    total = late = 0
+
+    if days:
+        rollup = AttendanceDailyDepartment
+        query = select(func.coalesce(func.sum(rollup.check_ins), 0), func.coalesce(func.sum(rollup.late_count), 0)).where(
+            rollup.day >= days[0], rollup.day < days[1]
+        )
+        if department_id:
+            query = query.where(rollup.department_id == department_id)
+        rollup_total, rollup_late = (await db.execute(query)).one()
+        total += rollup_total
+        late += rollup_late
+
+    for range_start, range_end in raw_ranges:
+        # El tramo final es inclusivo en ``end``, como el endpoint original
+        upper = AttendanceRecord.check_in <= range_end if range_end == end else AttendanceRecord.check_in < range_end
+        query = select(
+            func.count(AttendanceRecord.id),
+            func.count(case((AttendanceRecord.status == "late", 1))),
+        ).where(AttendanceRecord.check_in >= range_start, upper)
+        if department_id:
+            query = query.join(User, User.id == AttendanceRecord.user_id).where(User.department_id == department_id)
+        raw_total, raw_late = (await db.execute(query)).one()
+        total += raw_total
+        late += raw_late
+
+        # Bordes en meses archivados: sus registros ya no están en la tabla
+        archives = await archives_for_range(db, range_start, range_end)
+        if archives:
+            users = await department_user_ids(db, department_id) if department_id else None
+            async for batch in archived_rows(archives, range_start, range_end, settings.report_stream_chunk_size):
+                for row in batch:
+                    if range_end != end and row["check_in"] >= range_end:
+                        continue
+                    if users is None or row["user_id"] in users:
+                        total += 1
+                        late += row["status"] == "late"
+
+    return int(total), int(late)
+
+
+async def _job() -> None:
+    while not _stop.is_set():
+        try:
+            await catch_up()
+        except Exception:
+            logger.exception("Attendance rollup catch-up failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=settings.rollup_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_rollup_job() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_job())
+
+
+async def stop_rollup_job() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from ..config import get_settings
+from ..database import SessionLocal
+from .attendance import ScanIntent, ScanOutcome, apply_scans_bulk, enqueue_scan_alerts
+from .live_events import notify_events, outcome_events, publish_events
+from .metrics import counter, histogram
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+batch_size_metric = histogram(
+    "tapwork_scan_batch_size",
+    "Escaneos confirmados por transacción de group commit",
+    (1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+flush_latency_metric = histogram(
+    "tapwork_scan_batch_flush_seconds",
+    "Duración de la escritura y commit de cada lote de escaneos",
+    (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+flush_failures_metric = counter(
+    "tapwork_scan_batch_failures_total",
+    "Lotes de escaneos que no se pudieron confirmar",
+)
+
+
+class ScanBatcher:
+    """
+    Group commit de escaneos: las peticiones encolan su intent y un único
+    escritor confirma lotes en una sola transacción.
+
+    El lote se cierra al llegar a ``max_batch`` escaneos o cuando pasa
+    ``linger`` segundos desde el primero. Cada petición recibe su propio
+    resultado al confirmarse el lote.
+    """
+
+    def __init__(self, max_batch: int, linger: float):
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if not self.running:
+            return
+        # El centinela se procesa después de lo ya encolado
+        await self._queue.put(None)
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def submit(self, intent: ScanIntent) -> ScanOutcome:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((intent, future))
+        # shield: si el cliente se desconecta el escaneo igual se registra
+        return await asyncio.shield(future)
+
+    async def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.linger
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect(first)
+            try:
+                await self._flush(batch)
+            except Exception as exc:
+                logger.exception("Scan batch flush failed")
+                flush_failures_metric.inc()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    async def _flush(self, batch: list) -> None:
+        intents = [intent for intent, _ in batch]
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                async with SessionLocal() as session:
+                    outcomes = await apply_scans_bulk(session, intents)
+                    enqueue_scan_alerts(session, outcomes)
+                    events = outcome_events(outcomes)
+                    await notify_events(session, events)
+                    await session.commit()
+                break
+            except IntegrityError:
+                # Un escaneo fuera del lote (biométrico o sync) abrió una entrada en paralelo
+                if attempt:
+                    raise
+        publish_events(events)
+        batch_size_metric.observe(len(batch))
+        flush_latency_metric.observe(time.perf_counter() - started)
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+
+scan_batcher = ScanBatcher(
+    max_batch=settings.scan_batch_max_size,
+    linger=settings.scan_batch_linger_ms / 1000,
+)
@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import uuid
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, case, delete, literal, literal_column, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import SessionLocal
+from ..models import AttendanceRecord, Shift, ShiftInstance, User, utc_now
+
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_stop = asyncio.Event()
+_task: asyncio.Task | None = None
+
+# working_days usa 0=domingo ... 6=sábado, igual que extract(dow) en Postgres
+_MATERIALIZE_SQL = """
+INSERT INTO shift_instances (user_id, work_date, shift_id, starts_at, ends_at, late_after)
+SELECT u.id, d::date, s.id,
+       d + s.start_time,
+       d + s.end_time + CASE WHEN s.end_time <= s.start_time THEN interval '1 day' ELSE interval '0' END,
+       d + s.start_time + make_interval(mins => coalesce(s.grace_period_minutes, 0))
+FROM users u
+JOIN shifts s ON s.id = u.shift_id
+CROSS JOIN generate_series(CAST(:start AS date), CAST(:end AS date), interval '1 day') AS d
+WHERE u.is_active
+  AND s.working_days @> to_jsonb(extract(dow FROM d)::int)
+  {user_filter}
+ON CONFLICT (user_id, work_date) DO UPDATE
+SET shift_id = excluded.shift_id,
+    starts_at = excluded.starts_at,
+    ends_at = excluded.ends_at,
+    late_after = excluded.late_after
+WHERE (shift_instances.shift_id, shift_instances.starts_at, shift_instances.ends_at, shift_instances.late_after)
+      IS DISTINCT FROM (excluded.shift_id, excluded.starts_at, excluded.ends_at, excluded.late_after)
+"""
+
+
+def _early_window() -> timedelta:
+    return timedelta(minutes=settings.shift_early_checkin_minutes)
+
+
+def shift_window(shift: Shift, day: date) -> tuple[date, datetime, datetime, datetime]:
+    """(work_date, inicio, fin, tarde_desde) del turno en ``day``; el fin pasa al día siguiente si cruza medianoche."""
+    starts_at = datetime.combine(day, shift.start_time)
+    ends_at = datetime.combine(day, shift.end_time)
+    if shift.end_time <= shift.start_time:
+        ends_at += timedelta(days=1)
+    return day, starts_at, ends_at, starts_at + timedelta(minutes=shift.grace_period_minutes or 0)
+
+
+def pick_window(windows, at: datetime):
+    """
+    Elige el turno que corresponde a un escaneo en ``at``.
+
+    Cuenta el turno del mismo día desde ``SHIFT_EARLY_CHECKIN_MINUTES`` antes
+    de su inicio, y el del día anterior solo mientras no haya terminado
+    (turnos nocturnos).
+    """
+    today, yesterday = at.date(), at.date() - timedelta(days=1)
+    candidates = []
+    for window in windows:
+        work_date, starts_at, ends_at, _ = window
+        if starts_at - _early_window() > at:
+            continue
+        if work_date == today or (work_date == yesterday and ends_at > at):
+            candidates.append(window)
+    return max(candidates, key=lambda window: window[1], default=None)
+
+
+def status_for_window(window, at: datetime) -> str:
+    if window is None:
+        return "on-time"
+    return "late" if at > window[3] else "on-time"
+
+
+def computed_status(shift: Shift | None, at: datetime) -> str:
+    """Estado calculado desde la definición del turno, para días aún sin materializar."""
+    if shift is None:
+        return "on-time"
+    windows = [
+        shift_window(shift, day)
+        for day in (at.date(), at.date() - timedelta(days=1))
+        if day.isoweekday() % 7 in (shift.working_days or [])
+    ]
+    return status_for_window(pick_window(windows, at), at)
+
+
+def status_expression(user_id: uuid.UUID, at: datetime):
+    """Subconsulta escalar con el estado según ``shift_instances`` (NULL si no hay turno esperado)."""
+    day = at.date()
+    return (
+        select(
+            case(
+                (literal(at) > ShiftInstance.late_after, literal_column("'late'")),
+                else_=literal_column("'on-time'"),
+            )
+        )
+        .where(
+            ShiftInstance.user_id == user_id,
+            ShiftInstance.work_date.in_([day, day - timedelta(days=1)]),
+            ShiftInstance.starts_at <= at + _early_window(),
+            or_(ShiftInstance.work_date == day, ShiftInstance.ends_at > at),
+        )
+        .order_by(ShiftInstance.starts_at.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+async def windows_for_users(db: AsyncSession, user_ids: set[uuid.UUID], first: datetime, last: datetime) -> dict:
+    """Turnos materializados de varios usuarios alrededor de un rango de escaneos, en una consulta."""
+    result = await db.execute(
+        select(
+            ShiftInstance.user_id,
+            ShiftInstance.work_date,
+            ShiftInstance.starts_at,
+            ShiftInstance.ends_at,
+            ShiftInstance.late_after,
+        ).where(
+            ShiftInstance.user_id.in_(user_ids),
+            ShiftInstance.work_date >= first.date() - timedelta(days=1),
+            ShiftInstance.work_date <= last.date(),
+        )
+    )
+    windows: dict[uuid.UUID, list] = {}
+    for user_id, *window in result.all():
+        windows.setdefault(user_id, []).append(tuple(window))
+    return windows
+
+
+async def materialize(db: AsyncSession, start: date, end: date, user_ids: list[uuid.UUID] | None = None) -> None:
+    """Genera (o corrige) los turnos esperados entre ``start`` y ``end`` inclusive. No hace commit."""
+    params = {"start": start, "end": end}
+    user_filter = ""
+    if user_ids is not None:
+        if not user_ids:
+            return
+        user_filter = "AND u.id = ANY(:user_ids)"
+        params["user_ids"] = list(user_ids)
+    await db.execute(text(_MATERIALIZE_SQL.format(user_filter=user_filter)), params)
+
+
+async def refresh_users(db: AsyncSession, user_ids: list[uuid.UUID]) -> None:
+    """Regenera los turnos futuros de usuarios cuyo turno o estado cambió. No hace commit."""
+    if not user_ids:
+        return
+    today = utc_now().date()
+    await db.execute(
+        delete(ShiftInstance).where(ShiftInstance.user_id.in_(user_ids), ShiftInstance.work_date >= today)
+    )
+    await materialize(db, today, today + timedelta(days=settings.shift_calendar_horizon_days), user_ids)
+
+
+async def refresh_shift(db: AsyncSession, shift_id: uuid.UUID) -> None:
+    """Regenera los turnos futuros de todos los usuarios de un turno editado. No hace commit."""
+    user_ids = (await db.execute(select(User.id).where(User.shift_id == shift_id))).scalars().all()
+    await refresh_users(db, list(user_ids))
+
+
+def absences_query(start: date, end: date, now: datetime):
+    """Turnos esperados ya terminados sin ninguna entrada registrada dentro de su ventana."""
+    attended = (
+        select(AttendanceRecord.id)
+        .where(
+            AttendanceRecord.user_id == ShiftInstance.user_id,
+            AttendanceRecord.check_in >= ShiftInstance.starts_at - _early_window(),
+            AttendanceRecord.check_in < ShiftInstance.ends_at,
+        )
+        .exists()
+    )
+    return (
+        select(ShiftInstance, User)
+        .join(User, User.id == ShiftInstance.user_id)
+        .where(
+            and_(ShiftInstance.work_date >= start, ShiftInstance.work_date <= end),
+            ShiftInstance.ends_at <= now,
+            ~attended,
+        )
+        .order_by(ShiftInstance.work_date, User.employee_id)
+    )
+
+
+async def _job() -> None:
+    while not _stop.is_set():
+        today = utc_now().date()
+        try:
+            async with SessionLocal() as session:
+                await materialize(session, today, today + timedelta(days=settings.shift_calendar_horizon_days))
+                await session.commit()
+        except Exception:
+            logger.exception("Shift calendar materialization failed")
+        try:
+            await asyncio.wait_for(_stop.wait(), timeout=3600)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_shift_calendar_job() -> None:
+    global _task
+    _stop.clear()
+    _task = asyncio.create_task(_job())
+
+
+async def stop_shift_calendar_job() -> None:
+    _stop.set()
+    if _task:
+        await asyncio.gather(_task, return_exceptions=True)